@@ -11,7 +11,7 @@ __email__ = "your.email@example.com"
 
 # Core imports
 from .schema import ReportExtraction, Lesion, Summary
-from .extract import extract_from_text, batch_extract
+from .extract import extract_from_text, extract_stream, batch_extract
 from .eval import evaluate
 from .models import model_manager, ModelConfig, ModelBackend
 
@@ -23,9 +23,10 @@ __all__ = [
     "__author__",
     "__email__",
     "ReportExtraction",
-    "Lesion", 
+    "Lesion",
     "Summary",
     "extract_from_text",
+    "extract_stream",
     "batch_extract",
     "evaluate",
     "model_manager",
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .models import (
+    ModelBackend,
+    ModelConfig,
+    current_memory_usage,
+    release_memory,
+    torch,
+)
+
+# Transient prefill activations per prompt token, in multiples of hidden_size values
+ACTIVATION_FACTOR = 8
+# Bounds for the observed/estimated memory correction
+MIN_SCALE, MAX_SCALE = 0.5, 8.0
+
+
+@dataclass(frozen=True)
+class BatchPolicy:
+    """How reports are grouped into `generate_batch` calls.
+
+    `batch_size=None` plans each batch from estimated memory; a number fixes the size
+    (OOM still splits). `memory_cap_bytes` bounds the process on CPU (RSS) and the
+    allocator on CUDA; without it free device memory / available RAM is used.
+    """
+
+    batch_size: Optional[int] = None
+    max_batch_size: int = 64
+    memory_cap_bytes: Optional[int] = None
+    safety: float = 0.9
+
+
+def is_oom(exc: BaseException) -> bool:
+    if isinstance(exc, MemoryError):
+        return True
+    if torch is not None and isinstance(exc, torch.cuda.OutOfMemoryError):
+        return True
+    return isinstance(exc, RuntimeError) and "out of memory" in str(exc).lower()
+
+
+def _available_host_bytes() -> int:
+    try:
+        import psutil
+
+        return int(psutil.virtual_memory().available)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_AVPHYS_PAGES")
+
+
+class BatchPlanner:
+    """Picks the largest batch whose estimated memory fits, and learns as it goes.
+
+    A sequence costs its KV cache, ``(prompt + max_tokens) * kv_bytes_per_token``, plus
+    prefill activations and one row of fp32 logits; batches are padded to their longest
+    prompt and largest `max_tokens`. Estimates are multiplied by `scale`, which tracks
+    the observed/estimated ratio of each batch and grows after an out-of-memory error.
+    """
+
+    def __init__(self, config: ModelConfig, policy: BatchPolicy = BatchPolicy()):
+        self.config = config
+        self.policy = policy
+        self.scale = 1.0
+        self.on_cuda = torch is not None and torch.cuda.is_available()
+        self.stats = Counter()
+
+    def sequence_bytes(self, prompt_tokens: int, max_tokens: int) -> float:
+        c = self.config
+        kv = (prompt_tokens + max_tokens) * c.kv_bytes_per_token
+        activations = (
+            prompt_tokens * c.hidden_size * c.kv_dtype_bytes * ACTIVATION_FACTOR
+        )
+        return kv + activations + c.vocab_size * 4
+
+    def batch_bytes(self, lengths: Sequence[int], max_tokens: Sequence[int]) -> float:
+        if not lengths:
+            return 0.0
+        return (
+            len(lengths)
+            * self.sequence_bytes(max(lengths), max(max_tokens))
+            * self.scale
+        )
+
+    def available_bytes(self) -> int:
+        """Memory a batch may use now, after the safety margin"""
+        cap = self.policy.memory_cap_bytes
+        if self.on_cuda:
+            free, _ = torch.cuda.mem_get_info()
+            free += torch.cuda.memory_reserved() - torch.cuda.memory_allocated()
+            if cap is not None:
+                free = min(free, cap - torch.cuda.memory_allocated())
+        elif cap is not None:
+            free = cap - current_memory_usage().host_bytes
+        else:
+            free = _available_host_bytes()
+        return max(int(free * self.policy.safety), 0)
+
+    def plan(
+        self, lengths: Sequence[int], max_tokens: Sequence[int]
+    ) -> List[List[int]]:
+        """Split item indexes into batches, grouped by prompt length to limit padding"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        if self.policy.batch_size:
+            size = self.policy.batch_size
+            return [order[i : i + size] for i in range(0, len(order), size)]
+        available = self.available_bytes()
+        batches, current = [], []
+        for i in order:
+            candidate = current + [i]
+            fits = (
+                self.batch_bytes(
+                    [lengths[j] for j in candidate], [max_tokens[j] for j in candidate]
+                )
+                <= available
+            )
+            if current and (not fits or len(candidate) > self.policy.max_batch_size):
+                batches.append(current)
+                candidate = [i]
+            current = candidate
+        if current:
+            batches.append(current)
+        return batches
+
+    def _measure_start(self) -> int:
+        if self.on_cuda:
+            torch.cuda.reset_peak_memory_stats()
+            return torch.cuda.memory_allocated()
+        return current_memory_usage().host_bytes
+
+    def _measure_used(self, start: int) -> int:
+        if self.on_cuda:
+            return torch.cuda.max_memory_allocated() - start
+        return current_memory_usage().host_bytes - start
+
+    def observe(self, estimated: float, used: int):
+        """Move `scale` halfway towards the observed/estimated ratio of a batch"""
+        if estimated <= 0 or used <= 0:
+            return
+        ratio = used / (estimated / self.scale)
+        self.scale = min(max((self.scale + ratio) / 2, MIN_SCALE), MAX_SCALE)
+
+    def run(
+        self,
+        backend: ModelBackend,
+        batch: List[List[Dict[str, str]]],
+        lengths: Sequence[int],
+        max_tokens: Sequence[int],
+        **gen_params,
+    ) -> List[Tuple[str, Optional[str], Optional[int]]]:
+        """Generate every item in planned batches.
+
+        Returns (text, finish reason, tokens) per item, in input order. A batch that
+        runs out of memory is halved and retried, so no item is lost; a single item
+        that does not fit re-raises the error.
+        """
+        results: List[Any] = [None] * len(batch)
+        pending = self.plan(lengths, max_tokens)
+        while pending:
+            idx = pending.pop(0)
+            estimated = self.batch_bytes(
+                [lengths[i] for i in idx], [max_tokens[i] for i in idx]
+            )
+            start = self._measure_start()
+            try:
+                texts = backend.generate_batch(
+                    [batch[i] for i in idx],
+                    **dict(gen_params, max_tokens=[max_tokens[i] for i in idx]),
+                )
+            except Exception as exc:
+                if not is_oom(exc) or len(idx) == 1:
+                    raise
+                release_memory()
+                self.scale = min(self.scale * 1.5, MAX_SCALE)
+                self.stats["batch_oom_splits"] += 1
+                half = len(idx) // 2
+                pending[:0] = [idx[:half], idx[half:]]
+                continue
+            self.observe(estimated, self._measure_used(start))
+            reasons = backend.last_batch_finish_reasons or [None] * len(idx)
+            tokens = backend.last_batch_completion_tokens or [None] * len(idx)
+            for i, text, reason, n in zip(idx, texts, reasons, tokens):
+                results[i] = (text, reason, n)
+            self.stats.update({"batches": 1, "batch_items": len(idx)})
+            self.stats["batch_max_size"] = max(self.stats["batch_max_size"], len(idx))
+        return results
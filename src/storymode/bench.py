@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .decode import VALIDATION_ENGINES, parse_completion
+from .prompts import FEW_SHOT
+from .sections import (
+    DEFAULT_SECTION_POLICY,
+    SectionPolicy,
+    estimate_tokens,
+    parse_exam,
+    prune_report,
+)
+from .tabular import TABULAR_PROMPT_VERSION, render_table
+from .utils import read_txt
+
+
+def load_completions(labels_dir: str = None) -> List[str]:
+    """Reference extractions serialized the way a model emits them (compact JSON)"""
+    texts = [json.dumps(ex["json"]) for ex in FEW_SHOT]
+    if labels_dir:
+        for fn in sorted(os.listdir(labels_dir)):
+            if fn.endswith(".json"):
+                with open(os.path.join(labels_dir, fn)) as f:
+                    texts.append(json.dumps(json.load(f)))
+    return texts
+
+
+def bench_validation(
+    texts: Sequence[str], engines: Sequence[str] = VALIDATION_ENGINES, repeat: int = 200
+) -> Dict[str, Dict[str, float]]:
+    """Per-report CPU cost of parsing a completion into a ReportExtraction"""
+    results = {}
+    for engine in engines:
+        for text in texts:  # warm caches (compiled schema validator, etc.)
+            parse_completion(text, engine)
+        start = time.process_time()
+        for _ in range(repeat):
+            for text in texts:
+                parse_completion(text, engine)
+        cpu_s = time.process_time() - start
+        n = repeat * len(texts)
+        results[engine] = {
+            "reports": n,
+            "cpu_s": cpu_s,
+            "us_per_report": cpu_s / n * 1e6,
+        }
+    base = results.get("jsonschema")
+    if base:
+        for res in results.values():
+            res["speedup_vs_jsonschema"] = base["us_per_report"] / res["us_per_report"]
+    return results
+
+
+def bench_sections(
+    reports_dir: str, labels_dir: str, policy: SectionPolicy = DEFAULT_SECTION_POLICY
+) -> Dict[str, float]:
+    """Tokens saved by section pruning, and whether pruning keeps what the labels need.
+
+    Every labeled evidence span must survive pruning and the EXAM parse must agree
+    with the labeled modality/body region; otherwise eval scores could regress.
+    """
+    n = saved = spans = spans_kept = exam_hits = 0
+    for fn in sorted(os.listdir(reports_dir)):
+        if not fn.endswith(".txt"):
+            continue
+        text = read_txt(os.path.join(reports_dir, fn))
+        pruned = prune_report(text, policy)
+        n += 1
+        saved += pruned.tokens_saved
+        label_fp = os.path.join(labels_dir, fn[: -len(".txt")] + ".json")
+        if not os.path.exists(label_fp):
+            continue
+        with open(label_fp) as f:
+            label = json.load(f)
+        for lesion in label.get("lesions", []):
+            if lesion.get("evidence_span"):
+                spans += 1
+                spans_kept += int(lesion["evidence_span"] in pruned.text)
+        summary = label.get("summary", {})
+        exam_hits += int(
+            parse_exam(text, pruned.sections)
+            == (summary.get("modality"), summary.get("body_region"))
+        )
+    return {
+        "reports": n,
+        "avg_tokens_saved": saved / n if n else 0.0,
+        "evidence_spans_kept": spans_kept / spans if spans else 1.0,
+        "exam_parse_accuracy": exam_hits / n if n else 0.0,
+    }
+
+
+def _leaf_fields(data: Dict, prefix: str = "") -> Dict[str, object]:
+    out = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(_leaf_fields(value, path + "."))
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                out.update(_leaf_fields(item, f"{path}.{i}."))
+        elif value is not None:
+            out[path] = value
+    return out
+
+
+def bench_output_format(
+    labels_dir: str = None, count_tokens: Optional[Callable[[str], int]] = None
+) -> Dict[str, Dict[str, float]]:
+    """Generated tokens per report for JSON ("v1") vs. the row protocol ("t1").
+
+    Each reference is serialized the way the model is prompted to emit it, counted with
+    `count_tokens` (e.g. a tokenizer's ``lambda s: len(tok(s).input_ids)``; default
+    `estimate_tokens`) and parsed back; `field_accuracy` is the share of reference
+    fields the parsed completion reproduces. Model accuracy for each format comes from
+    `storymode extract --prompt-version` followed by `storymode eval`.
+    """
+    count_tokens = count_tokens or estimate_tokens
+    refs = [json.loads(text) for text in load_completions(labels_dir)]
+    results = {}
+    for version, render in (("v1", json.dumps), (TABULAR_PROMPT_VERSION, render_table)):
+        tokens = fields = hits = 0
+        for ref in refs:
+            text = render(ref)
+            tokens += count_tokens(text)
+            parsed = _leaf_fields(
+                parse_completion(text, prompt_version=version).model_dump(
+                    exclude_none=True
+                )
+            )
+            expected = _leaf_fields(ref)
+            fields += len(expected)
+            hits += sum(parsed.get(k) == v for k, v in expected.items())
+        results[version] = {
+            "reports": len(refs),
+            "tokens_per_report": tokens / len(refs),
+            "field_accuracy": hits / fields if fields else 1.0,
+        }
+    base = results["v1"]["tokens_per_report"]
+    for res in results.values():
+        res["token_reduction_vs_json"] = 1 - res["tokens_per_report"] / base
+    return results
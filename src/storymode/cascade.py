@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .models import model_manager
+from .textindex import ReportIndex
+
+# Values whose confidence decides escalation; others (notes, spans) are free text
+KEY_FIELDS = ("finding_type", "body_site", "is_node", "size_mm", "metastasis_present")
+_KEY_VALUE_RE = re.compile(
+    r'"(?:' + "|".join(KEY_FIELDS) + r')"\s*:\s*(?P<value>"[^"]*"|[^,}\]\s]+)'
+)
+
+
+@dataclass(kw_only=True)
+class UncertaintyPolicy:
+    """Signals that mark an extraction as uncertain.
+
+    Signals: the output failed validation even after repair and retry; the lowest
+    token log-probability on a key field value is below `min_key_logprob`; the number
+    of sized lesions differs from the number of current (non-comparison) measurement
+    mentions in the report by more than `max_count_gap`; an evidence span could not
+    be found in the report. Set a threshold to None to disable that signal.
+    """
+
+    escalate_on_failure: bool = True
+    min_key_logprob: Optional[float] = -1.0
+    max_count_gap: Optional[int] = 1
+    escalate_on_unsupported_evidence: bool = True
+
+
+@dataclass
+class CascadePolicy(UncertaintyPolicy):
+    """Run `small_model` on every report and re-run `large_model` when a signal fires"""
+
+    small_model: str
+    large_model: str
+
+
+def key_field_logprob(
+    token_logprobs: Optional[Sequence[Tuple[str, float]]]
+) -> Optional[float]:
+    """Lowest log-probability among the generated tokens that spell a key field value"""
+    if not token_logprobs:
+        return None
+    text, bounds = "", []
+    for token, lp in token_logprobs:
+        bounds.append((len(text), len(text) + len(token), lp))
+        text += token
+    spans = [m.span("value") for m in _KEY_VALUE_RE.finditer(text)]
+    lps = [
+        lp
+        for start, end, lp in bounds
+        if any(start < ve and end > vs for vs, ve in spans)
+    ]
+    return min(lps) if lps else None
+
+
+def escalation_signals(
+    data: Dict[str, Any],
+    diagnostics: Dict[str, Any],
+    index: ReportIndex,
+    policy: UncertaintyPolicy,
+) -> List[str]:
+    """Names of the uncertainty signals that fire for one extraction"""
+    signals = []
+    if policy.min_key_logprob is not None:
+        lp = key_field_logprob(diagnostics.get("token_logprobs"))
+        if lp is not None and lp < policy.min_key_logprob:
+            signals.append("low_logprob")
+    lesions = data.get("lesions", [])
+    if policy.max_count_gap is not None:
+        sized = sum(1 for lesion in lesions if lesion.get("size_mm") is not None)
+        if abs(len(index.current_measurements) - sized) > policy.max_count_gap:
+            signals.append("count_mismatch")
+    if policy.escalate_on_unsupported_evidence and any(
+        lesion.get("evidence_status") == "unsupported" for lesion in lesions
+    ):
+        signals.append("unsupported_evidence")
+    return signals
+
+
+def cascade_summary(stats: Counter, policy: CascadePolicy) -> Dict[str, Any]:
+    """Escalation rate and cost saved against running the large model on every report.
+
+    Cost uses `ModelConfig.relative_cost` per report for each model.
+    """
+    n = stats["cascade_reports"]
+    escalated = stats["cascade_escalated"]
+    small = model_manager.get_model_config(policy.small_model).relative_cost
+    large = model_manager.get_model_config(policy.large_model).relative_cost
+    cost = n * small + escalated * large
+    return {
+        "reports": n,
+        "escalated": escalated,
+        "escalation_rate": escalated / n if n else 0.0,
+        "signals": {
+            k[len("escalate_") :]: v
+            for k, v in stats.items()
+            if k.startswith("escalate_")
+        },
+        "cost_saved": 1.0 - cost / (n * large) if n else 0.0,
+    }
@@ -1,36 +1,366 @@
 from __future__ import annotations
-import os, json, typer
+
+import json
+import os
+from contextlib import nullcontext
+from typing import List
+
+import typer
 from rich import print
 from rich.table import Table
-from .extract import batch_extract
+
+from .batching import BatchPolicy
+from .bench import (
+    bench_output_format,
+    bench_sections,
+    bench_validation,
+    load_completions,
+)
+from .cascade import CascadePolicy, UncertaintyPolicy
+from .columnar import convert_json_dir
+from .corpus import DEFAULT_SHARD_BYTES, merge_shards, pack_reports, parse_shard
+from .dedup import DedupPolicy
 from .eval import evaluate
+from .extract import batch_extract, sweep_models
+from .leaderboard import (
+    DIFF_FIELDS,
+    LEADERBOARD_METRICS,
+    diff_runs,
+    evaluate_runs,
+    rank_runs,
+    run_names,
+)
 from .models import model_manager
+from .profiling import Profiler, format_summary
+from .sections import SectionPolicy
+from .selfconsistency import SelfConsistencyConfig
+from .tokenbudget import TokenBudget
 
 app = typer.Typer(add_completion=False)
 
+
 @app.command()
-def extract(in_dir: str = typer.Option(..., help="Folder of .txt reports"),
-            out_dir: str = typer.Option(..., help="Output folder for .json"),
-            model: str = typer.Option("mistral-7b-instruct", help="Model name"),
-            max_workers: int = typer.Option(4, help="Parallelism hint"),
-            temperature: float = typer.Option(0.0, help="Generation temperature"),
-            max_tokens: int = typer.Option(1200, help="Maximum tokens to generate")):
+def extract(
+    in_dir: str = typer.Option(..., help="Folder of .txt reports or a packed corpus"),
+    out_dir: str = typer.Option(..., help="Output folder for .json"),
+    model: str = typer.Option("mistral-7b-instruct", help="Model name"),
+    max_workers: int = typer.Option(4, help="Parallelism hint"),
+    shard: str = typer.Option(
+        None, help="Extract only shard i of N, as i/N (combine outputs with `merge`)"
+    ),
+    batch_size: int = typer.Option(
+        1, help="Reports per generate call; 0 = plan from estimated memory"
+    ),
+    memory_cap_gb: float = typer.Option(
+        None,
+        help="Memory cap for batch planning (process RSS on CPU, allocator on GPU)",
+    ),
+    temperature: float = typer.Option(0.0, help="Generation temperature"),
+    max_tokens: int = typer.Option(1200, help="Maximum tokens to generate"),
+    adaptive_max_tokens: bool = typer.Option(
+        False,
+        help="Size max_tokens per report from its findings; "
+        "truncated output is continued up to --max-tokens",
+    ),
+    output_format: str = typer.Option(
+        "json", help="json (file per report) or parquet (reports/lesions tables)"
+    ),
+    prompt_version: str = typer.Option(
+        "v1", help="v1 (model emits JSON) or t1 (compact rows expanded by storymode)"
+    ),
+    validation_engine: str = typer.Option(
+        "pydantic", help="pydantic (single pass) or jsonschema (legacy)"
+    ),
+    sections: str = typer.Option(
+        None,
+        help="Comma-separated report sections to send, e.g. FINDINGS,IMPRESSION "
+        "(default: full report)",
+    ),
+    escalate_to: str = typer.Option(
+        None,
+        help="Cascade: run --model first and re-run uncertain reports with this model",
+    ),
+    min_key_logprob: float = typer.Option(
+        -1.0, help="Escalate/sample when a key field token log-prob is below this"
+    ),
+    max_count_gap: int = typer.Option(
+        1,
+        help="Escalate/sample when sized lesions and current measurement mentions "
+        "differ by more than this (-1 = off)",
+    ),
+    escalate_on_failure: bool = typer.Option(
+        True,
+        help="Escalate/sample when the output fails validation after repair and retry",
+    ),
+    escalate_on_unsupported_evidence: bool = typer.Option(
+        True, help="Escalate/sample when an evidence span is not found in the report"
+    ),
+    self_consistency: int = typer.Option(
+        0, help="Samples per uncertain report for self-consistency voting (0 = off)"
+    ),
+    sample_all: bool = typer.Option(
+        False, help="Self-consistency: sample every report, not only uncertain ones"
+    ),
+    record: str = typer.Option(
+        None, help="Append raw completions, prompts and parameters to this store"
+    ),
+    replay: str = typer.Option(
+        None,
+        help="Serve completions recorded for --model from this store "
+        "instead of running it",
+    ),
+    profile: bool = typer.Option(
+        False,
+        help="Profile a sample of reports; traces and pstats go to OUT_DIR/profile",
+    ),
+    profile_every: int = typer.Option(
+        100, help="Profile every Nth report (or batch) when --profile is set"
+    ),
+    dedup: bool = typer.Option(
+        False,
+        help="Extract each text once after dropping PHI header lines "
+        "and normalizing whitespace/case",
+    ),
+    dedup_case_sensitive: bool = typer.Option(
+        False, help="With --dedup, treat texts that differ only in case as different"
+    ),
+):
     """Extract structured data from radiology reports using specified model."""
+    uncertainty = dict(
+        min_key_logprob=min_key_logprob,
+        max_count_gap=None if max_count_gap < 0 else max_count_gap,
+        escalate_on_failure=escalate_on_failure,
+        escalate_on_unsupported_evidence=escalate_on_unsupported_evidence,
+    )
+    try:
+        section_policy = SectionPolicy.from_names(sections) if sections else None
+    except ValueError as exc:
+        raise typer.BadParameter(str(exc), param_hint="--sections")
+    if replay:
+        model = model_manager.register_replay(replay, model)
+        if escalate_to:
+            escalate_to = model_manager.register_replay(replay, escalate_to)
     batch_extract(
-        in_dir=in_dir, 
-        out_dir=out_dir, 
-        model=model, 
+        in_dir=in_dir,
+        out_dir=out_dir,
+        model=model,
         max_workers=max_workers,
+        output_format=output_format,
+        record_to=record,
+        shard=parse_shard(shard) if shard else None,
+        validation_engine=validation_engine,
+        section_policy=section_policy,
+        cascade=CascadePolicy(model, escalate_to, **uncertainty)
+        if escalate_to
+        else None,
+        self_consistency=SelfConsistencyConfig(
+            n=self_consistency,
+            only_uncertain=None if sample_all else UncertaintyPolicy(**uncertainty),
+        )
+        if self_consistency
+        else None,
+        token_budget=TokenBudget() if adaptive_max_tokens else None,
+        prompt_version=prompt_version,
+        batching=None
+        if batch_size == 1
+        else BatchPolicy(
+            batch_size=batch_size or None,
+            memory_cap_bytes=None
+            if memory_cap_gb is None
+            else int(memory_cap_gb * 2**30),
+        ),
+        profiler=Profiler(os.path.join(out_dir, "profile"), every=profile_every)
+        if profile
+        else None,
+        dedup=DedupPolicy(casefold=not dedup_case_sensitive) if dedup else None,
+        temperature=temperature,
+        max_tokens=max_tokens,
+    )
+
+
+@app.command()
+def pack(
+    in_dir: str = typer.Option(..., help="Folder of .txt reports"),
+    out_dir: str = typer.Option(..., help="Output folder for the packed corpus"),
+    shard_mb: int = typer.Option(
+        DEFAULT_SHARD_BYTES // 2**20, help="Target size of each shard file in MB"
+    ),
+):
+    """Pack .txt reports into large shard files with an offset index."""
+    n = pack_reports(in_dir, out_dir, shard_bytes=shard_mb * 2**20)
+    print(f"Packed {n} reports into {out_dir}")
+
+
+@app.command()
+def merge(
+    shard_dir: List[str] = typer.Option(
+        ..., help="Output folder of one `extract --shard` run; repeat for each shard"
+    ),
+    out_dir: str = typer.Option(..., help="Output folder for the merged results"),
+):
+    """Combine per-shard extraction outputs and run statistics."""
+    stats = merge_shards(shard_dir, out_dir)
+    print(f"Merged {len(shard_dir)} shards ({stats['outputs']} reports) into {out_dir}")
+
+
+@app.command()
+def sweep(
+    in_dir: str = typer.Option(..., help="Folder of .txt reports"),
+    out_dir: str = typer.Option(..., help="Output folder; one subfolder per model"),
+    models: str = typer.Option(..., help="Comma-separated model names"),
+    host_budget_gb: float = typer.Option(
+        None, help="Host memory budget for loaded models"
+    ),
+    device_budget_gb: float = typer.Option(
+        None, help="GPU memory budget for loaded models"
+    ),
+    temperature: float = typer.Option(0.0, help="Generation temperature"),
+    max_tokens: int = typer.Option(1200, help="Maximum tokens to generate"),
+):
+    """Run several models over the same reports, loading each model exactly once."""
+    model_manager.set_memory_budget(
+        host_bytes=None if host_budget_gb is None else int(host_budget_gb * 2**30),
+        device_bytes=None
+        if device_budget_gb is None
+        else int(device_budget_gb * 2**30),
+    )
+    stats = sweep_models(
+        [m.strip() for m in models.split(",") if m.strip()],
+        in_dir=in_dir,
+        out_dir=out_dir,
         temperature=temperature,
-        max_tokens=max_tokens
+        max_tokens=max_tokens,
     )
+    print(stats)
+
+
+@app.command()
+def eval(
+    pred_dir: List[str] = typer.Option(
+        ...,
+        help="Predicted .json folder, parquet tables or .jsonl file; "
+        "repeat to compare runs",
+    ),
+    ref_dir: str = typer.Option(..., help="Folder of reference .json"),
+    workers: int = typer.Option(4, help="Runs evaluated in parallel"),
+    diff: str = typer.Option(
+        None, help="Two run names, RUN_A,RUN_B: list documents whose scores differ"
+    ),
+):
+    """Evaluate extraction results against reference annotations.
+
+    Several --pred-dir runs give a leaderboard.
+    """
+    if diff:
+        names = run_names(pred_dir)
+        pair = [name.strip() for name in diff.split(",")]
+        if len(pair) != 2 or not set(pair) <= set(names):
+            raise typer.BadParameter(
+                f"expected two run names as RUN_A,RUN_B; runs are: {', '.join(names)}",
+                param_hint="--diff",
+            )
+    if len(pred_dir) == 1 and not diff:
+        res = evaluate(pred_dir[0], ref_dir)
+        print(res)
+        return
+    results = evaluate_runs(pred_dir, ref_dir, max_workers=workers)
+    table = Table(title=f"Leaderboard ({len(results)} runs)")
+    table.add_column("Run", style="cyan")
+    for metric in LEADERBOARD_METRICS:
+        table.add_column(metric, style="yellow")
+    table.add_column("Mean rank", style="magenta")
+    table.add_column("Missing", style="red")
+    for row in rank_runs(results):
+        cells = [
+            f"{row[m]:.3f} (#{row[m + '_rank']})"
+            if row[m] is not None
+            else f"- (#{row[m + '_rank']})"
+            for m in LEADERBOARD_METRICS
+        ]
+        table.add_row(
+            row["run"], *cells, f"{row['mean_rank']:.1f}", str(row["missing_docs"])
+        )
+    print(table)
+    if diff:
+        a, b = pair
+        rows = diff_runs(results[a], results[b])
+        table = Table(title=f"Documents that differ: {a} vs {b}")
+        table.add_column("Document", style="cyan")
+        for field in DIFF_FIELDS:
+            table.add_column(field)
+        for row in rows:
+            table.add_row(
+                row["doc"],
+                *[
+                    f"{row[f][0]} → {row[f][1]}" if f in row else ""
+                    for f in DIFF_FIELDS
+                ],
+            )
+        print(table)
+
+
+@app.command()
+def to_parquet(
+    json_dir: str = typer.Option(..., help="Folder of per-report .json outputs"),
+    out_dir: str = typer.Option(
+        ..., help="Output folder for reports/lesions parquet tables"
+    ),
+):
+    """Convert per-report JSON outputs into columnar reports/lesions tables."""
+    n = convert_json_dir(json_dir, out_dir)
+    print(f"Converted {n} reports into {out_dir}")
+
 
 @app.command()
-def eval(pred_dir: str = typer.Option(..., help="Folder of predicted .json"),
-         ref_dir: str = typer.Option(..., help="Folder of reference .json")):
-    """Evaluate extraction results against reference annotations."""
-    res = evaluate(pred_dir, ref_dir)
-    print(res)
+def bench(
+    labels_dir: str = typer.Option(
+        "examples/labels", help="Reference .json used as model completions"
+    ),
+    reports_dir: str = typer.Option(
+        "examples/reports", help="Reports matching the labels"
+    ),
+    repeat: int = typer.Option(200, help="Passes over the completions per engine"),
+    profile: str = typer.Option(
+        None, help="Profile each benchmark into this folder (Chrome trace and pstats)"
+    ),
+):
+    """Benchmark validation CPU cost, section pruning and output format token counts."""
+    profiler = Profiler(profile, every=1, use_torch=False) if profile else None
+    with profiler.sample("bench_validation") if profiler else nullcontext():
+        results = bench_validation(load_completions(labels_dir), repeat=repeat)
+    table = Table(title="Validation cost per report")
+    table.add_column("Engine", style="cyan")
+    table.add_column("Reports", style="green")
+    table.add_column("µs/report", style="yellow")
+    table.add_column("Speedup", style="magenta")
+    for engine, res in results.items():
+        table.add_row(
+            engine,
+            str(res["reports"]),
+            f"{res['us_per_report']:.1f}",
+            f"{res.get('speedup_vs_jsonschema', 1.0):.1f}x",
+        )
+    print(table)
+    with profiler.sample("bench_sections") if profiler else nullcontext():
+        print(bench_sections(reports_dir, labels_dir))
+    table = Table(title="Generated tokens per report by output format")
+    table.add_column("Prompt version", style="cyan")
+    table.add_column("Tokens/report", style="yellow")
+    table.add_column("Reduction vs JSON", style="magenta")
+    table.add_column("Field accuracy", style="green")
+    with profiler.sample("bench_output_format") if profiler else nullcontext():
+        formats = bench_output_format(labels_dir)
+    for version, res in formats.items():
+        table.add_row(
+            version,
+            f"{res['tokens_per_report']:.0f}",
+            f"{res['token_reduction_vs_json']:.1%}",
+            f"{res['field_accuracy']:.1%}",
+        )
+    print(table)
+    if profiler:
+        print(format_summary(profiler.write()))
+
 
 @app.command()
 def list_models():
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .utils import RUN_STATS_FILE, read_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    pa = None
+    pq = None
+
+REPORTS_FILE = "reports.parquet"
+LESIONS_FILE = "lesions.parquet"
+
+# (column, arrow type name); "enum" columns are dictionary-encoded strings
+REPORT_COLUMNS = [
+    ("doc_id", "string"),
+    ("patient_id", "string"),
+    ("study_date", "string"),
+    ("report_id", "string"),
+    ("modality", "enum"),
+    ("body_region", "enum"),
+    ("tn_stage_reported", "string"),
+    ("metastasis_present", "bool"),
+    ("total_lesion_count", "int32"),
+    ("model_name", "enum"),
+    ("prompt_version", "enum"),
+    ("schema_version", "enum"),
+]
+SUMMARY_FIELDS = {
+    "modality",
+    "body_region",
+    "tn_stage_reported",
+    "metastasis_present",
+    "total_lesion_count",
+}
+
+LESION_COLUMNS = [
+    ("doc_id", "string"),
+    ("lesion_index", "int16"),
+    ("lesion_id", "string"),
+    ("finding_type", "enum"),
+    ("body_site", "string"),
+    ("metastatic_site", "string"),
+    ("is_node", "bool"),
+    ("node_station", "string"),
+    ("laterality", "enum"),
+    ("measure_axis", "enum"),
+    ("size_mm", "int32"),
+    ("certainty", "enum"),
+    ("date_relative", "string"),
+    ("note", "string"),
+    ("evidence_span", "string"),
+    ("evidence_start", "int32"),
+    ("evidence_end", "int32"),
+    ("evidence_status", "enum"),
+]
+
+# Columns `evaluate` needs; everything else is pruned at read time
+EVAL_REPORT_COLUMNS = ["doc_id", "metastasis_present"]
+EVAL_LESION_COLUMNS = ["doc_id", "finding_type", "body_site", "node_station", "size_mm"]
+
+
+def _require_pyarrow():
+    if not PYARROW_AVAILABLE:
+        raise ImportError(
+            "pyarrow is not available. Install it with "
+            "`pip install storymode[parquet]` or use JSON output."
+        )
+
+
+def _arrow_schema(columns: List[tuple]) -> "pa.Schema":
+    types = {
+        "string": pa.string(),
+        "enum": pa.dictionary(pa.int8(), pa.string()),
+        "bool": pa.bool_(),
+        "int16": pa.int16(),
+        "int32": pa.int32(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def is_columnar_dir(d: str) -> bool:
+    return os.path.exists(os.path.join(d, REPORTS_FILE))
+
+
+class ColumnarWriter:
+    """Flatten ReportExtraction dicts into `reports` and `lesions` Parquet tables.
+
+    Rows are buffered and written as one row group per `row_group_size` reports, so
+    memory stays flat over long runs and partial output is readable after a crash.
+    """
+
+    def __init__(
+        self, out_dir: str, row_group_size: int = 1024, compression: str = "zstd"
+    ):
+        _require_pyarrow()
+        os.makedirs(out_dir, exist_ok=True)
+        self.row_group_size = row_group_size
+        self.report_schema = _arrow_schema(REPORT_COLUMNS)
+        self.lesion_schema = _arrow_schema(LESION_COLUMNS)
+        self.report_writer = pq.ParquetWriter(
+            os.path.join(out_dir, REPORTS_FILE),
+            self.report_schema,
+            compression=compression,
+        )
+        self.lesion_writer = pq.ParquetWriter(
+            os.path.join(out_dir, LESIONS_FILE),
+            self.lesion_schema,
+            compression=compression,
+        )
+        self._reports = {name: [] for name, _ in REPORT_COLUMNS}
+        self._lesions = {name: [] for name, _ in LESION_COLUMNS}
+        self._pending = 0
+
+    def write(self, doc_id: str, data: Dict[str, Any]):
+        summary = data.get("summary") or {}
+        for name, _ in REPORT_COLUMNS:
+            if name == "doc_id":
+                value = doc_id
+            elif name in SUMMARY_FIELDS:
+                value = summary.get(name)
+            else:
+                value = data.get(name)
+            self._reports[name].append(value)
+        for i, lesion in enumerate(data.get("lesions") or []):
+            for name, _ in LESION_COLUMNS:
+                if name == "doc_id":
+                    value = doc_id
+                elif name == "lesion_index":
+                    value = i
+                else:
+                    value = lesion.get(name)
+                self._lesions[name].append(value)
+        self._pending += 1
+        if self._pending >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        self.report_writer.write_table(
+            pa.Table.from_pydict(self._reports, schema=self.report_schema)
+        )
+        if self._lesions["doc_id"]:
+            self.lesion_writer.write_table(
+                pa.Table.from_pydict(self._lesions, schema=self.lesion_schema)
+            )
+        for col in self._reports.values():
+            col.clear()
+        for col in self._lesions.values():
+            col.clear()
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        self.report_writer.close()
+        self.lesion_writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _iter_rows(
+    path: str, columns: Optional[List[str]], batch_size: int
+) -> Iterator[Dict[str, Any]]:
+    for batch in pq.ParquetFile(path, memory_map=True).iter_batches(
+        batch_size=batch_size, columns=columns
+    ):
+        data = batch.to_pydict()
+        for i in range(batch.num_rows):
+            yield {name: values[i] for name, values in data.items()}
+
+
+def iter_dir_columnar(
+    d: str,
+    report_columns: Optional[List[str]] = None,
+    lesion_columns: Optional[List[str]] = None,
+    batch_size: int = 1024,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stream ``("<doc_id>.json", extraction)`` pairs from a columnar output dir.
+
+    Only the requested columns are read, files are memory-mapped and at most one
+    record batch per table is held. `ColumnarWriter` writes lesions in report order,
+    which is what lets the two tables be merged in one pass.
+    """
+    _require_pyarrow()
+    lesions = _iter_rows(os.path.join(d, LESIONS_FILE), lesion_columns, batch_size)
+    pending = next(lesions, None)
+    for report in _iter_rows(os.path.join(d, REPORTS_FILE), report_columns, batch_size):
+        doc_id = report.pop("doc_id")
+        obj: Dict[str, Any] = {"summary": {}, "lesions": []}
+        for name, value in report.items():
+            if name in SUMMARY_FIELDS:
+                obj["summary"][name] = value
+            else:
+                obj[name] = value
+        while pending is not None and pending["doc_id"] == doc_id:
+            obj["lesions"].append(
+                {
+                    k: v
+                    for k, v in pending.items()
+                    if k not in ("doc_id", "lesion_index")
+                }
+            )
+            pending = next(lesions, None)
+        yield f"{doc_id}.json", obj
+    if pending is not None:
+        raise ValueError(f"{d}: lesions of {pending['doc_id']} are not in report order")
+
+
+def load_dir_columnar(
+    d: str,
+    report_columns: Optional[List[str]] = None,
+    lesion_columns: Optional[List[str]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Read a columnar output dir back as `{"<doc_id>.json": extraction}`.
+
+    This is the shape `load_dir_json` returns. Only the requested columns are read,
+    and files are memory-mapped.
+    """
+    return dict(iter_dir_columnar(d, report_columns, lesion_columns))
+
+
+def convert_json_dir(json_dir: str, out_dir: str, row_group_size: int = 1024) -> int:
+    """Convert a directory of per-report JSON outputs into the columnar tables"""
+    files = sorted(
+        f for f in os.listdir(json_dir) if f.endswith(".json") and f != RUN_STATS_FILE
+    )
+    with ColumnarWriter(out_dir, row_group_size=row_group_size) as writer:
+        for fn in files:
+            writer.write(fn[: -len(".json")], read_json(os.path.join(json_dir, fn)))
+    return len(files)
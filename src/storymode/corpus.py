@@ -0,0 +1,276 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import shutil
+import sys
+from array import array
+from bisect import bisect_right
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import orjson
+
+from .columnar import LESIONS_FILE, REPORTS_FILE, _require_pyarrow, is_columnar_dir, pq
+from .utils import RUN_STATS_FILE, dump_json, read_json
+
+# A packed corpus is a directory of large shard files plus an offset index:
+#   manifest.json        {"version", "byteorder", "count",
+#                         "shards": [{"data", "index", "names", "count", "bytes"}]}
+#   shard-00000.bin      report texts, UTF-8, back to back
+#   shard-00000.idx      count + 1 uint64 offsets into the .bin (native byte order)
+#   shard-00000.names    document names (e.g. "001.txt"), one per line
+MANIFEST_FILE = "manifest.json"
+PACK_VERSION = 1
+DEFAULT_SHARD_BYTES = 256 * 2**20
+# Run counters merged with max() instead of summed
+MAX_STATS = ("batch_max_size",)
+
+
+def is_packed_corpus(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """ "i/N" -> (i, N), with 0 <= i < N"""
+    try:
+        i, n = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like i/N, got {spec!r}") from None
+    if not 0 <= i < n:
+        raise ValueError(f"Shard index must be in [0, {n}), got {i}")
+    return i, n
+
+
+def shard_of(name: str, num_shards: int) -> int:
+    """Deterministic shard for a document, stable across machines, listings and packs"""
+    digest = hashlib.blake2b(name.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % num_shards
+
+
+def pack_reports(
+    in_dir: str, out_dir: str, shard_bytes: int = DEFAULT_SHARD_BYTES
+) -> int:
+    """Pack every .txt report in `in_dir` into shard files; returns the number packed.
+
+    Reports go in name order, and a new shard starts once the current one reaches
+    `shard_bytes`.
+    """
+    with os.scandir(in_dir) as entries:
+        names = sorted(
+            e.name for e in entries if e.name.lower().endswith(".txt") and e.is_file()
+        )
+    os.makedirs(out_dir, exist_ok=True)
+    shards = []
+
+    def open_shard():
+        stem = f"shard-{len(shards):05d}"
+        shards.append(
+            {
+                "data": stem + ".bin",
+                "index": stem + ".idx",
+                "names": stem + ".names",
+                "count": 0,
+                "bytes": 0,
+            }
+        )
+        return open(os.path.join(out_dir, stem + ".bin"), "wb"), array("Q", [0]), []
+
+    def close_shard(data, offsets, shard_names):
+        data.close()
+        with open(os.path.join(out_dir, shards[-1]["index"]), "wb") as f:
+            offsets.tofile(f)
+        with open(
+            os.path.join(out_dir, shards[-1]["names"]), "w", encoding="utf-8"
+        ) as f:
+            f.write("\n".join(shard_names))
+        shards[-1].update(count=len(shard_names), bytes=offsets[-1])
+
+    data, offsets, shard_names = open_shard()
+    for name in names:
+        if offsets[-1] >= shard_bytes:
+            close_shard(data, offsets, shard_names)
+            data, offsets, shard_names = open_shard()
+        with open(os.path.join(in_dir, name), "rb") as f:
+            raw = f.read()
+        data.write(raw)
+        offsets.append(offsets[-1] + len(raw))
+        shard_names.append(name)
+    close_shard(data, offsets, shard_names)
+
+    with open(os.path.join(out_dir, MANIFEST_FILE), "wb") as f:
+        f.write(
+            orjson.dumps(
+                {
+                    "version": PACK_VERSION,
+                    "byteorder": sys.byteorder,
+                    "shards": shards,
+                    "count": len(names),
+                },
+                option=orjson.OPT_INDENT_2,
+            )
+        )
+    return len(names)
+
+
+class PackedCorpus:
+    """Random access to a packed corpus; shard data and offsets are memory-mapped.
+
+    `raw(i)` returns a zero-copy memoryview into the shard; `text(i)` decodes it.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, MANIFEST_FILE), "rb") as f:
+            manifest = orjson.loads(f.read())
+        if manifest.get("version") != PACK_VERSION:
+            raise ValueError(
+                f"{path}: unsupported pack version {manifest.get('version')}"
+            )
+        if manifest["byteorder"] != sys.byteorder:
+            raise ValueError(
+                f"{path} was packed on a {manifest['byteorder']}-endian machine; "
+                "repack it here"
+            )
+        self.path = path
+        self.names: List[str] = []
+        self._starts: List[int] = []  # global index of each shard's first report
+        self._data: List[Optional[mmap.mmap]] = []
+        self._offsets: List[memoryview] = []
+        self._files = []
+        for shard in manifest["shards"]:
+            self._starts.append(len(self.names))
+            with open(os.path.join(path, shard["names"]), encoding="utf-8") as f:
+                self.names.extend(f.read().split("\n") if shard["count"] else [])
+            self._data.append(self._map(shard["data"]) if shard["bytes"] else None)
+            self._offsets.append(memoryview(self._map(shard["index"])).cast("Q"))
+
+    def _map(self, fn: str) -> mmap.mmap:
+        f = open(os.path.join(self.path, fn), "rb")
+        self._files.append(f)
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def raw(self, i: int) -> memoryview:
+        shard = bisect_right(self._starts, i) - 1
+        j = i - self._starts[shard]
+        offsets = self._offsets[shard]
+        if self._data[shard] is None:
+            return memoryview(b"")
+        return memoryview(self._data[shard])[offsets[j] : offsets[j + 1]]
+
+    def text(self, i: int) -> str:
+        return str(self.raw(i), "utf-8")
+
+    def __getitem__(self, i: int) -> Tuple[str, str]:
+        return self.names[i], self.text(i)
+
+    def __iter__(self) -> Iterator[Tuple[str, str]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        for view in self._offsets:
+            view.release()
+        self._offsets = []
+        for data in self._data:
+            if data is not None:
+                data.close()
+        for f in self._files:
+            f.close()
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_run_stats(
+    out_dir: str, stats: Counter, shard: Optional[Tuple[int, int]] = None
+):
+    dump_json(
+        {"shard": list(shard) if shard else None, "stats": dict(stats)},
+        os.path.join(out_dir, RUN_STATS_FILE),
+    )
+
+
+def merge_stats(runs: Sequence[Dict[str, Any]]) -> Counter:
+    merged = Counter()
+    for stats in runs:
+        for key, value in stats.items():
+            merged[key] = (
+                max(merged[key], value) if key in MAX_STATS else merged[key] + value
+            )
+    return merged
+
+
+def merge_shards(shard_dirs: Sequence[str], out_dir: str) -> Counter:
+    """Combine the outputs and run statistics of `extract --shard i/N` runs.
+
+    Every shard 0..N-1 must be present exactly once and all must share an output
+    format. JSON files are copied; Parquet tables are streamed row group by row group.
+    """
+    runs = [read_json(os.path.join(d, RUN_STATS_FILE)) for d in shard_dirs]
+    shards = [tuple(run["shard"]) if run["shard"] else (0, 1) for run in runs]
+    counts = {n for _, n in shards}
+    if len(counts) != 1:
+        raise ValueError(
+            f"Shard directories come from different splits: {sorted(counts)}"
+        )
+    n = counts.pop()
+    if sorted(i for i, _ in shards) != list(range(n)):
+        missing = sorted(set(range(n)) - {i for i, _ in shards})
+        raise ValueError(
+            f"Expected each of {n} shards once; missing {missing}, "
+            f"got {sorted(i for i, _ in shards)}"
+        )
+    columnar = {is_columnar_dir(d) for d in shard_dirs}
+    if len(columnar) != 1:
+        raise ValueError("Cannot merge JSON and Parquet shard outputs")
+    shard_dirs = [d for _, d in sorted(zip(shards, shard_dirs))]
+    os.makedirs(out_dir, exist_ok=True)
+    if columnar.pop():
+        _merge_tables(shard_dirs, out_dir)
+    else:
+        _merge_json(shard_dirs, out_dir)
+    stats = merge_stats([run["stats"] for run in runs])
+    dump_json(
+        {"shard": None, "shards": n, "stats": dict(stats)},
+        os.path.join(out_dir, RUN_STATS_FILE),
+    )
+    return stats
+
+
+def _merge_json(shard_dirs: Sequence[str], out_dir: str):
+    seen = set()
+    for d in shard_dirs:
+        with os.scandir(d) as entries:
+            for e in entries:
+                if not e.name.endswith(".json") or e.name == RUN_STATS_FILE:
+                    continue
+                if e.name in seen:
+                    raise ValueError(f"{e.name} appears in more than one shard")
+                seen.add(e.name)
+                shutil.copyfile(e.path, os.path.join(out_dir, e.name))
+
+
+def _merge_tables(shard_dirs: Sequence[str], out_dir: str):
+    _require_pyarrow()
+    for fn in (REPORTS_FILE, LESIONS_FILE):
+        writer = None
+        try:
+            for d in shard_dirs:
+                src = pq.ParquetFile(os.path.join(d, fn), memory_map=True)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        os.path.join(out_dir, fn), src.schema_arrow, compression="zstd"
+                    )
+                for k in range(src.num_row_groups):
+                    writer.write_table(src.read_row_group(k))
+        finally:
+            if writer is not None:
+                writer.close()
@@ -1,21 +1,41 @@
 from __future__ import annotations
-import json, os
-from typing import Any, Dict, List
+
+import json
+import os
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
 from jsonschema import Draft202012Validator
-from pydantic import TypeAdapter
+from jsonschema.exceptions import ValidationError as SchemaValidationError
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic_core import from_json
 from tenacity import retry, stop_after_attempt, wait_fixed
-from .schema import ReportExtraction
-from .models import model_manager
 
+from .models import ModelConfig, model_manager
+from .profiling import stage
+from .prompt_templates import STATIC_PREFIX_KEY
+from .schema import Lesion, ReportExtraction, Summary
+from .tabular import is_tabular, parse_table
+
+VALIDATION_ENGINES = ("pydantic", "jsonschema")
+
+
+@lru_cache(maxsize=None)
 def get_json_schema() -> Dict[str, Any]:
     # Build JSON Schema from Pydantic
     ta = TypeAdapter(ReportExtraction)
     json_schema = ta.json_schema()
     return json_schema
 
+
+@lru_cache(maxsize=None)
+def _schema_validator() -> Draft202012Validator:
+    return Draft202012Validator(get_json_schema())
+
+
 def validate_json(data: Dict[str, Any]) -> None:
-    schema = get_json_schema()
-    Draft202012Validator(schema).validate(data)
+    _schema_validator().validate(data)
 
 def _repair_common(json_text: str) -> str:
     # Lightweight repairs: trailing commas, single quotes, True/False/null variants
@@ -33,52 +53,335 @@ def coerce_and_validate(json_text: str) -> Dict[str, Any]:
     validate_json(obj)
     return obj
 
+
+class ExtractionValidationError(ValueError):
+    """Validation failure with path-addressable errors, e.g. ``lesions.1.size_mm``"""
+
+    def __init__(self, errors: List[Dict[str, Any]]):
+        self.errors = errors
+        super().__init__(
+            "; ".join(f"{e['path'] or '<root>'}: {e['msg']}" for e in errors)
+        )
+
+
+def _path(loc: Tuple) -> str:
+    return ".".join(str(p) for p in loc)
+
+
+def _owner_model(loc: Tuple) -> Optional[type[BaseModel]]:
+    """Model class that declares the field at `loc`"""
+    if len(loc) == 1:
+        return ReportExtraction
+    if len(loc) == 2 and loc[0] == "summary":
+        return Summary
+    if len(loc) == 3 and loc[0] == "lesions":
+        return Lesion
+    return None
+
+
+def _repair_field(obj: Dict[str, Any], error: Dict[str, Any]) -> bool:
+    """Fix one field error in place; returns False when the error is not repairable.
+
+    Enum values are matched case-insensitively and a negative `size_mm` is clamped to
+    0, as postprocessing always did; other bad values of optional fields are dropped
+    so the schema default applies. Required fields are never invented.
+    """
+    loc = error["loc"]
+    model = _owner_model(loc)
+    if model is None or loc[-1] not in model.model_fields:
+        return False
+    parent = obj
+    for part in loc[:-1]:
+        parent = parent[part]
+    if error["type"] == "literal_error" and isinstance(error.get("input"), str):
+        allowed = re.findall(r"'([^']*)'", error["ctx"]["expected"])
+        matches = [a for a in allowed if a.lower() == error["input"].strip().lower()]
+        if matches:
+            parent[loc[-1]] = matches[0]
+            return True
+    if (
+        loc[-1] == "size_mm"
+        and isinstance(error.get("input"), (int, float))
+        and error["input"] < 0
+    ):
+        parent[loc[-1]] = 0
+        return True
+    if model.model_fields[loc[-1]].is_required():
+        return False
+    parent.pop(loc[-1], None)
+    return True
+
+
+def _errors(exc: ValidationError) -> List[Dict[str, Any]]:
+    return [dict(e, path=_path(e["loc"])) for e in exc.errors(include_url=False)]
+
+
+def validate_extraction(json_text: str) -> ReportExtraction:
+    """Parse and validate a completion in one compiled pass with pydantic-core.
+
+    Falls back to text repair for malformed JSON and to field repair for invalid
+    values; raises ExtractionValidationError with the remaining errors otherwise.
+    """
+    try:
+        return ReportExtraction.model_validate_json(json_text)
+    except ValidationError as exc:
+        errors = _errors(exc)
+
+    with stage("repair"):
+        if any(e["type"] == "json_invalid" for e in errors):
+            json_text = _repair_common(json_text)
+            try:
+                return ReportExtraction.model_validate_json(json_text)
+            except ValidationError as exc:
+                errors = _errors(exc)
+            if any(e["type"] == "json_invalid" for e in errors):
+                raise ExtractionValidationError(errors)
+
+        return _repair_and_validate(from_json(json_text), errors)
+
+
+def _repair_and_validate(
+    obj: Dict[str, Any], errors: List[Dict[str, Any]]
+) -> ReportExtraction:
+    unrepaired = [e for e in errors if not _repair_field(obj, e)]
+    if unrepaired:
+        raise ExtractionValidationError(unrepaired)
+    try:
+        return ReportExtraction.model_validate(obj)
+    except ValidationError as exc:
+        raise ExtractionValidationError(_errors(exc)) from exc
+
+
+def validate_part(model: type[BaseModel], obj: Dict[str, Any]) -> BaseModel:
+    """Validate a lone Summary or Lesion dict, repairing fields as for a whole report"""
+    try:
+        return model.model_validate(obj)
+    except ValidationError as exc:
+        prefix = ("summary",) if model is Summary else ("lesions", 0)
+        errors = [
+            dict(e, loc=prefix + tuple(e["loc"]), path=_path(prefix + tuple(e["loc"])))
+            for e in exc.errors(include_url=False)
+        ]
+    wrapper = {"summary": obj} if model is Summary else {"lesions": [obj]}
+    unrepaired = [e for e in errors if not _repair_field(wrapper, e)]
+    if unrepaired:
+        raise ExtractionValidationError(unrepaired)
+    try:
+        return model.model_validate(obj)
+    except ValidationError as exc:
+        raise ExtractionValidationError(_errors(exc)) from exc
+
+
+def validate_table(text: str) -> ReportExtraction:
+    """Expand a row-protocol completion (see `storymode.tabular`) and validate it"""
+    obj = parse_table(text)
+    try:
+        return ReportExtraction.model_validate(obj)
+    except ValidationError as exc:
+        with stage("repair"):
+            return _repair_and_validate(obj, _errors(exc))
+
+
+def parse_completion(
+    text: str, validation_engine: str = "pydantic", prompt_version: str = "v1"
+) -> ReportExtraction:
+    """Turn raw model text into a typed ReportExtraction.
+
+    "jsonschema" is the legacy path (json.loads + Draft 2020-12 validation), kept for
+    compatibility; it converts to the pydantic model only after validating, and its
+    schema errors are raised as ExtractionValidationError too. Tabular prompt versions
+    are always expanded and validated with pydantic.
+    """
+    with stage("parse"):
+        if is_tabular(prompt_version):
+            return validate_table(text)
+        if validation_engine == "pydantic":
+            return validate_extraction(text)
+        if validation_engine == "jsonschema":
+            try:
+                return ReportExtraction.model_validate(coerce_and_validate(text))
+            except SchemaValidationError as exc:
+                loc = tuple(exc.absolute_path)
+                raise ExtractionValidationError(
+                    [
+                        {
+                            "type": exc.validator,
+                            "loc": loc,
+                            "msg": exc.message,
+                            "path": _path(loc),
+                        }
+                    ]
+                ) from exc
+    raise ValueError(
+        f"Unknown validation engine: {validation_engine}. "
+        f"Available: {VALIDATION_ENGINES}"
+    )
+
+
 def format_messages_for_model(prompt: Dict[str, Any], model_name: str) -> List[Dict[str, str]]:
     """Format prompt into messages appropriate for the specific model"""
     config = model_manager.get_model_config(model_name)
     messages = []
-    
+
     # Add system message if required
     if config.requires_system_prompt:
         messages.append({"role": "system", "content": prompt["system"]})
-    
+
     # Add few-shot examples
     for msg in prompt["fewshot_messages"]:
         messages.append(msg)
-    
-    # Add user message
-    messages.append({"role": "user", "content": prompt["user"]})
-    
+
+    # Add user message; the static mark lets backends reuse the tokenized instructions
+    user = {"role": "user", "content": prompt["user"]}
+    if "user_static_chars" in prompt:
+        user[STATIC_PREFIX_KEY] = prompt["user_static_chars"]
+    messages.append(user)
+
     return messages
 
-@retry(stop=stop_after_attempt(2), wait=wait_fixed(0.2))
-def constrained_json_completion(prompt: Dict[str, Any], model_name: str, **gen_kwargs) -> Dict[str, Any]:
-    """Generic constrained decoding using the model abstraction layer."""
-    
-    # Get model backend and config
-    backend = model_manager.get_backend(model_name)
-    config = model_manager.get_model_config(model_name)
-    
-    # Format messages for the specific model
-    messages = format_messages_for_model(prompt, model_name)
-    
-    # Prepare generation parameters
+
+def generation_params(
+    config: ModelConfig, gen_kwargs: Dict[str, Any], json_mode: bool = True
+) -> Dict[str, Any]:
     gen_params = {
         "temperature": gen_kwargs.get("temperature", config.temperature),
         "max_tokens": gen_kwargs.get("max_tokens", config.max_tokens),
         "top_p": gen_kwargs.get("top_p", config.top_p),
     }
-    
+
     # Add JSON schema if supported
-    if config.json_mode_supported:
+    if json_mode and config.json_mode_supported:
         json_schema = get_json_schema()
         gen_params["response_format"] = {
             "type": "json_schema",
             "json_schema": {"name": "ReportExtraction", "schema": json_schema}
         }
-    
-    # Generate response
-    text = backend.generate(messages, **gen_params)
-    
+    return gen_params
+
+
+@retry(stop=stop_after_attempt(2), wait=wait_fixed(0.2))
+def constrained_json_completion(
+    prompt: Dict[str, Any],
+    model_name: str,
+    validation_engine: str = "pydantic",
+    diagnostics: Optional[Dict[str, Any]] = None,
+    budget: Optional[int] = None,
+    logprobs: Optional[bool] = None,
+    **gen_kwargs,
+) -> ReportExtraction:
+    """Generic constrained decoding using the model abstraction layer.
+
+    If `diagnostics` is given, the raw completion (``text``), generated token count
+    (``completion_tokens``) and number of continuations are stored there, plus token
+    log-probabilities (``token_logprobs``) unless `logprobs` is False.
+
+    `budget` caps the first generation below the static `max_tokens`; output that is cut
+    off by it is continued from where it stopped, never past the static limit.
+    """
+
+    config = model_manager.get_model_config(model_name)
+
+    # Format messages for the specific model
+    with stage("prompt"):
+        messages = format_messages_for_model(prompt, model_name)
+
+    # Prepare generation parameters; tabular prompts are not JSON, so they get no
+    # schema-guided decoding
+    prompt_version = prompt.get("prompt_version", "v1")
+    gen_params = generation_params(
+        config, gen_kwargs, json_mode=not is_tabular(prompt_version)
+    )
+    if logprobs is None:
+        logprobs = diagnostics is not None
+    if logprobs:
+        gen_params["logprobs"] = True
+    cap = gen_params["max_tokens"]
+    if budget is not None:
+        gen_params["max_tokens"] = min(budget, cap)
+
+    # Generate response; the backend is pinned so eviction cannot close it mid-call
+    with model_manager.using(model_name) as backend, stage("generate"):
+        backend.last_logprobs = None
+        parts = [backend.generate(messages, **gen_params)]
+        token_logprobs = list(backend.last_logprobs or []) if logprobs else None
+        used = backend.last_completion_tokens or 0
+        while (
+            backend.last_finish_reason == "length"
+            and backend.last_completion_tokens
+            and used < cap
+        ):
+            # Resume the truncated assistant turn; schema-guided decoding cannot start
+            # mid-document
+            params = {k: v for k, v in gen_params.items() if k != "response_format"}
+            params.update(max_tokens=cap - used, assistant_prefix="".join(parts))
+            parts.append(backend.generate(messages, **params))
+            used += backend.last_completion_tokens or 0
+            if token_logprobs is not None:
+                token_logprobs.extend(backend.last_logprobs or [])
+        text = "".join(parts).strip()
+        if diagnostics is not None:
+            diagnostics["text"] = text
+            diagnostics["token_logprobs"] = token_logprobs
+            diagnostics["completion_tokens"] = used
+            diagnostics["continuations"] = len(parts) - 1
+
     # Parse and validate JSON
-    return coerce_and_validate(text)
+    return parse_completion(text, validation_engine, prompt_version)
+
+
+def stream_completion(
+    prompt: Dict[str, Any],
+    model_name: str,
+    diagnostics: Optional[Dict[str, Any]] = None,
+    **gen_kwargs,
+) -> Iterator[str]:
+    """Yield the raw completion in chunks as the backend generates it.
+
+    Backends without streaming yield it in one piece. Nothing is validated here; once
+    the stream ends `diagnostics`, if given, receives ``text``, ``completion_tokens``
+    and ``finish_reason``.
+    """
+    config = model_manager.get_model_config(model_name)
+    with stage("prompt"):
+        messages = format_messages_for_model(prompt, model_name)
+    prompt_version = prompt.get("prompt_version", "v1")
+    gen_params = generation_params(
+        config, gen_kwargs, json_mode=not is_tabular(prompt_version)
+    )
+    parts = []
+    with model_manager.using(model_name) as backend:
+        for chunk in backend.generate_stream(messages, **gen_params):
+            parts.append(chunk)
+            yield chunk
+        if diagnostics is not None:
+            diagnostics["text"] = "".join(parts).strip()
+            diagnostics["completion_tokens"] = backend.last_completion_tokens
+            diagnostics["finish_reason"] = backend.last_finish_reason
+
+
+def sample_completions(
+    prompt: Dict[str, Any],
+    model_name: str,
+    n: int,
+    validation_engine: str = "pydantic",
+    **gen_kwargs,
+) -> Tuple[List[ReportExtraction], int]:
+    """Draw `n` samples from one prefill and validate each.
+
+    Returns the valid extractions and the number of samples that failed validation.
+    """
+    config = model_manager.get_model_config(model_name)
+    messages = format_messages_for_model(prompt, model_name)
+    prompt_version = prompt.get("prompt_version", "v1")
+    gen_params = generation_params(
+        config, gen_kwargs, json_mode=not is_tabular(prompt_version)
+    )
+    with model_manager.using(model_name) as backend, stage("generate"):
+        texts = backend.generate_n(messages, n, **gen_params)
+    valid = []
+    for text in texts:
+        try:
+            valid.append(parse_completion(text, validation_engine, prompt_version))
+        except (ExtractionValidationError, ValidationError, ValueError):
+            continue
+    return valid, len(texts) - len(valid)
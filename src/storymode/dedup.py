@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import copy
+import hashlib
+import re
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .postprocess import normalize_units_and_cleanup
+
+# Extraction fields that identify the report rather than describe it
+IDENTITY_FIELDS = ("patient_id", "study_date", "report_id")
+
+
+@dataclass(frozen=True)
+class HeaderRule:
+    """A header line dropped before hashing; `field` takes the pattern's first group"""
+
+    pattern: str  # matched against a whole stripped line, case-insensitively
+    field: Optional[str] = None
+
+
+# First matching rule wins, so date of birth is caught before study dates
+PHI_HEADER_RULES = (
+    HeaderRule(r"(?:dob|date of birth)\s*[:#].*"),
+    HeaderRule(
+        r"(?:mrn|medical record(?: number| no\.?)?|patient id)\s*[:#]\s*(\S+)",
+        "patient_id",
+    ),
+    HeaderRule(
+        r"(?:accession|acc)(?: number| no\.?|\s*#)?\s*[:#]?\s*([A-Z0-9-]*\d[A-Z0-9-]*)",
+        "report_id",
+    ),
+    HeaderRule(
+        r"(?:(?:study|exam|report|service) )?date"
+        r"(?: of (?:service|exam|study))?\s*:\s*(.+)",
+        "study_date",
+    ),
+    HeaderRule(r"(?:patient|patient name|name)\s*:.*"),
+    HeaderRule(r"(?:(?:electronically )?signed|dictated|transcribed)(?: by)?\b.*"),
+)
+
+
+@lru_cache(maxsize=None)
+def _compile(rules: Tuple[HeaderRule, ...]) -> List[Tuple["re.Pattern", Optional[str]]]:
+    return [(re.compile(r.pattern, re.IGNORECASE), r.field) for r in rules]
+
+
+@dataclass(frozen=True)
+class DedupPolicy:
+    """How report text is normalized before exact-match deduplication.
+
+    Header lines matching `header_rules` are dropped (their captured values are
+    restored on every duplicate served from the cache), whitespace runs collapse to
+    one space and, with `casefold`, case is ignored. Extractions of up to
+    `cache_size` unique texts are kept for reuse.
+    """
+
+    header_rules: Tuple[HeaderRule, ...] = PHI_HEADER_RULES
+    collapse_whitespace: bool = True
+    casefold: bool = True
+    cache_size: int = 100_000
+
+    def normalize(self, text: str) -> Tuple[str, Dict[str, str]]:
+        """Normalized text and the identity values captured from dropped header lines"""
+        kept, captured = [], {}
+        rules = _compile(self.header_rules)
+        for line in text.splitlines():
+            stripped = line.strip()
+            for rx, field in rules:
+                match = rx.fullmatch(stripped)
+                if match:
+                    if field is not None and match.group(1).strip():
+                        captured.setdefault(field, match.group(1).strip())
+                    break
+            else:
+                kept.append(line)
+        norm = "\n".join(kept)
+        if self.collapse_whitespace:
+            norm = " ".join(norm.split())
+        if self.casefold:
+            norm = norm.casefold()
+        return norm, captured
+
+    def key(self, text: str) -> Tuple[str, Dict[str, str]]:
+        norm, captured = self.normalize(text)
+        return (
+            hashlib.blake2b(norm.encode("utf-8"), digest_size=16).hexdigest(),
+            captured,
+        )
+
+
+def restore_identity(
+    data: Dict[str, Any], captured: Dict[str, str], source_captured: Dict[str, str]
+):
+    """Give a copy its own identity fields.
+
+    Values captured from the report's headers win; a field that came from a header of
+    the report the extraction was copied from, and that this report lacks, is dropped.
+    """
+    for field in IDENTITY_FIELDS:
+        if field in captured:
+            data[field] = captured[field]
+        elif field in source_captured:
+            data.pop(field, None)
+
+
+def fan_out(
+    data: Dict[str, Any],
+    text: str,
+    captured: Dict[str, str],
+    source_captured: Dict[str, str],
+) -> Dict[str, Any]:
+    """Copy an extraction onto a duplicate: identity restored, evidence re-aligned"""
+    out = copy.deepcopy(data)
+    restore_identity(out, captured, source_captured)
+    for lesion in out.get("lesions", []):
+        for key in ("evidence_start", "evidence_end", "evidence_status"):
+            lesion.pop(key, None)
+    return normalize_units_and_cleanup(out, original_text=text)
+
+
+class Deduplicator:
+    """Runs inference once per normalized text within a run.
+
+    `admit` filters each chunk down to the reports that need the model; extractions
+    passed to `store` are cached, and `resolve` yields copies for the duplicates held
+    back so far. Duplicates whose source extraction is not cached (yet) stay pending;
+    `leftovers` returns them once the run is over.
+    """
+
+    def __init__(self, policy: DedupPolicy = DedupPolicy()):
+        self.policy = policy
+        self.stats = Counter()
+        self._cache: "OrderedDict[str, Tuple[Dict[str, Any], Dict[str, str]]]" = (
+            OrderedDict()
+        )
+        self._sources: Dict[
+            str, Tuple[str, Dict[str, str]]
+        ] = {}  # fname -> (key, captured)
+        self._pending: List[Tuple[str, str, str, Dict[str, str]]] = []
+
+    def admit(self, reports: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        unique, keys = [], {key for key, _ in self._sources.values()}
+        for fname, text in reports:
+            key, captured = self.policy.key(text)
+            self.stats["dedup_reports"] += 1
+            if key in self._cache or key in keys:
+                self.stats["dedup_duplicates"] += 1
+                self._pending.append((fname, text, key, captured))
+            else:
+                keys.add(key)
+                self._sources[fname] = (key, captured)
+                unique.append((fname, text))
+        return unique
+
+    def store(self, fname: str, data: Dict[str, Any]):
+        """Cache an untouched copy of an admitted report's extraction.
+
+        Only the copies served to its duplicates get their header identity.
+        """
+        if fname not in self._sources:
+            return
+        key, captured = self._sources.pop(fname)
+        self._cache[key] = (copy.deepcopy(data), captured)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.policy.cache_size:
+            self._cache.popitem(last=False)
+
+    def resolve(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        waiting = []
+        for fname, text, key, captured in self._pending:
+            if key not in self._cache:
+                waiting.append((fname, text, key, captured))
+                continue
+            data, source_captured = self._cache[key]
+            self._cache.move_to_end(key)
+            yield fname, fan_out(data, text, captured, source_captured)
+        self._pending = waiting
+
+    def leftovers(self) -> List[Tuple[str, str]]:
+        """Duplicates whose source extraction was evicted or never made"""
+        out = [(fname, text) for fname, text, _, _ in self._pending]
+        self.stats["dedup_duplicates"] -= len(out)
+        self._pending = []
+        return out
+
+    @property
+    def ratio(self) -> float:
+        """Fraction of reports served from another report's extraction"""
+        return (
+            self.stats["dedup_duplicates"] / self.stats["dedup_reports"]
+            if self.stats["dedup_reports"]
+            else 0.0
+        )
@@ -1,17 +1,40 @@
 from __future__ import annotations
-import os, json, math
-from typing import Dict, Any, List, Tuple
+
+import json
+import math
+import os
 from collections import Counter, defaultdict
-from sklearn.metrics import precision_recall_fscore_support, accuracy_score
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import orjson
+from sklearn.metrics import accuracy_score, precision_recall_fscore_support
+
+from .columnar import (
+    EVAL_LESION_COLUMNS,
+    EVAL_REPORT_COLUMNS,
+    is_columnar_dir,
+    iter_dir_columnar,
+    load_dir_columnar,
+)
+from .utils import RUN_STATS_FILE, read_json
+
 
 def load_dir_json(d: str) -> Dict[str, Dict[str, Any]]:
     out = {}
     for fn in os.listdir(d):
-        if fn.endswith('.json'):
+        if fn.endswith(".json") and fn != RUN_STATS_FILE:
             with open(os.path.join(d, fn), 'r') as f:
                 out[fn] = json.load(f)
     return out
 
+
+def load_dir(d: str) -> Dict[str, Dict[str, Any]]:
+    """Load per-report JSON files, or the columnar tables cut to the columns scored"""
+    if is_columnar_dir(d):
+        return load_dir_columnar(d, EVAL_REPORT_COLUMNS, EVAL_LESION_COLUMNS)
+    return load_dir_json(d)
+
+
 def _safe_get(d, *keys):
     for k in keys:
         if d is None:
@@ -44,62 +67,123 @@ def pair_lesions(pred: List[Dict[str,Any]], ref: List[Dict[str,Any]]) -> List[Tu
             pairs.append((p, ref[best]))
     return pairs
 
+
+def _size_errors(pairs: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> List[float]:
+    """Absolute size_mm error of each pair where both lesions have a size"""
+    return [
+        abs(p["size_mm"] - r["size_mm"])
+        for p, r in pairs
+        if p.get("size_mm") is not None and r.get("size_mm") is not None
+    ]
+
+
+def _mae(errors: List[float]) -> float:
+    return sum(errors) / len(errors) if errors else math.nan
+
+
+def _hits(errors: List[float], tol_mm: float) -> Tuple[int, int]:
+    return sum(e <= tol_mm for e in errors), len(errors)
+
+
 def numeric_mae_mm(pairs: List[Tuple[Dict[str,Any], Dict[str,Any]]]) -> float:
-    errs = []
-    for p, r in pairs:
-        pv, rv = p.get('size_mm'), r.get('size_mm')
-        if pv is not None and rv is not None:
-            errs.append(abs(pv - rv))
-    return sum(errs)/len(errs) if errs else math.nan
+    return _mae(_size_errors(pairs))
 
 def within_tolerance(pairs, tol_mm=2):
-    hits = 0
-    total = 0
-    for p, r in pairs:
-        pv, rv = p.get('size_mm'), r.get('size_mm')
-        if pv is not None and rv is not None:
-            total += 1
-            hits += int(abs(pv-rv) <= tol_mm)
-    return hits, total
+    return _hits(_size_errors(pairs), tol_mm)
+
+
+def iter_dir_json(d: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for fn in sorted(os.listdir(d)):
+        if fn.endswith(".json") and fn != RUN_STATS_FILE:
+            yield fn, read_json(os.path.join(d, fn))
+
+
+def iter_jsonl(fp: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """One extraction per line, named by its ``doc_id`` (else its ``report_id``)"""
+    with open(fp, "rb") as f:
+        for line in f:
+            if line.strip():
+                doc = orjson.loads(line)
+                doc_id = doc.pop("doc_id", None) or doc.get("report_id")
+                yield f"{doc_id}.json", doc
+
+
+def iter_predictions(source: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Stream ``("<doc_id>.json", extraction)`` from a JSON/columnar dir or JSONL"""
+    if os.path.isfile(source):
+        return iter_jsonl(source)
+    if is_columnar_dir(source):
+        return iter_dir_columnar(source, EVAL_REPORT_COLUMNS, EVAL_LESION_COLUMNS)
+    return iter_dir_json(source)
 
-def evaluate(pred_dir: str, ref_dir: str) -> Dict[str, Any]:
-    P = load_dir_json(pred_dir)
-    R = load_dir_json(ref_dir)
-    assert set(P.keys()) == set(R.keys()), "Prediction and reference files must match by name"
 
+def score_document(p: Dict[str, Any], r: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-document tallies; `summarize_scores` turns a run's tallies into metrics"""
+    pred_lesions, ref_lesions = p.get("lesions", []), r.get("lesions", [])
+    # doc-level mets present
+    y_pred = int(_safe_get(p, "summary", "metastasis_present") or 0)
+    y_true = int(_safe_get(r, "summary", "metastasis_present") or 0)
+    pairs = pair_lesions(pred_lesions, ref_lesions)
+    score = {
+        "mets_correct": int(y_pred == y_true),
+        "pred_lesions": len(pred_lesions),
+        "ref_lesions": len(ref_lesions),
+        "paired_lesions": len(pairs),
+        "size_errors": _size_errors(pairs),
+    }
+    # categorical slots (site and node station presence)
+    for slot in ["body_site", "node_station", "finding_type"]:
+        # rough proxy: the closer these are, the better (can expand with span-based scoring later)
+        score[f"{slot}_pred"] = sum(
+            ls.get(slot) not in (None, "", "unknown") for ls in pred_lesions
+        )
+        score[f"{slot}_true"] = sum(
+            ls.get(slot) not in (None, "", "unknown") for ls in ref_lesions
+        )
+    return score
+
+
+def summarize_scores(scores: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
     entity_counts = Counter()
-    numeric_pairs_all = []
-
-    for fn in sorted(P.keys()):
-        p, r = P[fn], R[fn]
-        # doc-level mets present
-        y_pred = int(_safe_get(p, 'summary', 'metastasis_present') or 0)
-        y_true = int(_safe_get(r, 'summary', 'metastasis_present') or 0)
-        entity_counts.update({"doc_total": 1, "doc_correct": int(y_pred == y_true)})
-
-        # lesions
-        pairs = pair_lesions(p.get('lesions', []), r.get('lesions', []))
-        numeric_pairs_all.extend(pairs)
-
-        # categorical slots (site and node station presence)
-        def collect_slots(lesions, slot):
-            vals = [1 if (ls.get(slot) not in (None, "", "unknown")) else 0 for ls in lesions]
-            return sum(vals), len(vals)
-
-        for slot in ["body_site", "node_station", "finding_type"]:
-            p_have, p_tot = collect_slots(p.get('lesions', []), slot)
-            r_have, r_tot = collect_slots(r.get('lesions', []), slot)
-            # rough proxy: the closer these are, the better (can expand with span-based scoring later)
-            entity_counts.update({f"{slot}_pred": p_have, f"{slot}_true": r_have})
-
-    mae = numeric_mae_mm(numeric_pairs_all)
-    hits2, tot2 = within_tolerance(numeric_pairs_all, tol_mm=2)
-    hits10p, tot10p = within_tolerance(numeric_pairs_all, tol_mm=0)  # placeholder; adjust to % tolerance if desired
-
-    results = {
-        "doc_accuracy_mets_present": entity_counts["doc_correct"] / entity_counts["doc_total"],
-        "size_mae_mm": mae,
-        "size_within_2mm": None if tot2==0 else hits2/tot2,
-        "counts": entity_counts
+    errors = []
+    for score in scores:
+        errors.extend(score["size_errors"])
+        entity_counts.update(
+            {
+                "doc_total": 1,
+                "doc_correct": score["mets_correct"],
+                "pred_lesions": score["pred_lesions"],
+                "ref_lesions": score["ref_lesions"],
+                "paired_lesions": score["paired_lesions"],
+            }
+        )
+        entity_counts.update(
+            {k: v for k, v in score.items() if k.endswith(("_pred", "_true"))}
+        )
+    hits2, tot2 = _hits(errors, 2)
+    return {
+        "doc_accuracy_mets_present": entity_counts["doc_correct"]
+        / entity_counts["doc_total"]
+        if entity_counts["doc_total"]
+        else math.nan,
+        "size_mae_mm": _mae(errors),
+        "size_within_2mm": None if tot2 == 0 else hits2 / tot2,
+        "lesion_precision": entity_counts["paired_lesions"]
+        / entity_counts["pred_lesions"]
+        if entity_counts["pred_lesions"]
+        else math.nan,
+        "lesion_recall": entity_counts["paired_lesions"] / entity_counts["ref_lesions"]
+        if entity_counts["ref_lesions"]
+        else math.nan,
+        "counts": entity_counts,
     }
-    return results
+
+
+def evaluate(pred_dir: str, ref_dir: str) -> Dict[str, Any]:
+    R = load_dir(ref_dir)
+    scores = {}
+    for fn, p in iter_predictions(pred_dir):
+        assert fn in R, "Prediction and reference files must match by name"
+        scores[fn] = score_document(p, R[fn])
+    assert set(scores) == set(R), "Prediction and reference files must match by name"
+    return summarize_scores(scores[fn] for fn in sorted(scores))
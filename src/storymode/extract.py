@@ -1,54 +1,805 @@
 from __future__ import annotations
-import os, json, time
-from typing import Dict, Any, List
+
+import json
+import os
+import time
+from collections import Counter
+from contextlib import nullcontext
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
 from dotenv import load_dotenv
-from .schema import ReportExtraction
-from .decode import constrained_json_completion, get_json_schema, coerce_and_validate
+from tenacity import RetryError
+
+from .batching import BatchPlanner, BatchPolicy
+from .cascade import CascadePolicy, cascade_summary, escalation_signals
+from .columnar import ColumnarWriter
+from .corpus import PackedCorpus, is_packed_corpus, shard_of, write_run_stats
+from .decode import (
+    coerce_and_validate,
+    constrained_json_completion,
+    format_messages_for_model,
+    generation_params,
+    get_json_schema,
+    parse_completion,
+    sample_completions,
+    stream_completion,
+    validate_part,
+)
+from .dedup import Deduplicator, DedupPolicy
+from .models import MemoryUsage, model_manager
 from .postprocess import normalize_units_and_cleanup
-from .prompts import SYSTEM_PROMPT, FEW_SHOT
-from .utils import read_txt, dump_json, Timer
-from .models import model_manager
+from .profiling import Profiler, format_summary, stage
+from .prompts import FEW_SHOT, SYSTEM_PROMPT, TABULAR_SYSTEM_PROMPT
+from .schema import Lesion, ReportExtraction, Summary
+from .sections import PrunedReport, SectionPolicy, parse_exam, prune_report
+from .selfconsistency import SelfConsistencyConfig, merge_samples
+from .streaming import StreamEvent, StreamParser
+from .tabular import PROMPT_VERSIONS, format_instructions, is_tabular, render_table
+from .textindex import ReportIndex, build_index, build_indexes
+from .tokenbudget import TokenBudget, budget_summary
+from .utils import Timer, chunked, dump_json, read_txt
+
 
 def build_prompt(report_text: str, prompt_version: str = "v1") -> Dict[str, Any]:
+    """Chat prompt for one report. "v1" asks for JSON against the schema; "t1" asks for
+    the compact row protocol of `storymode.tabular`, with FEW_SHOT rendered to match."""
+    if prompt_version not in PROMPT_VERSIONS:
+        raise ValueError(
+            f"Unknown prompt version: {prompt_version}. Available: {PROMPT_VERSIONS}"
+        )
+    tabular = is_tabular(prompt_version)
+
     # Few-shot messages for OpenAI-style API
     few = []
     for ex in FEW_SHOT:
         few.append({"role": "user", "content": ex["report"]})
-        few.append({"role": "assistant", "content": json.dumps(ex["json"])})
+        few.append(
+            {
+                "role": "assistant",
+                "content": render_table(ex["json"])
+                if tabular
+                else json.dumps(ex["json"]),
+            }
+        )
 
-    # JSON Schema for the user instruction context
-    schema = get_json_schema()
-    user = f"""Extract structured JSON conforming to the following JSON Schema:
-{json.dumps(schema, indent=2)}
+    if tabular:
+        instructions = f"""{format_instructions()}
 Report:
-{report_text}
 """
+    else:
+        # JSON Schema for the user instruction context
+        schema = get_json_schema()
+        instructions = (
+            "Extract structured JSON conforming to the following JSON Schema:\n"
+            f"{json.dumps(schema, indent=2)}\nReport:\n"
+        )
     return {
-        "system": SYSTEM_PROMPT + f"\nPROMPT_VERSION={prompt_version}",
+        "system": (TABULAR_SYSTEM_PROMPT if tabular else SYSTEM_PROMPT)
+        + f"\nPROMPT_VERSION={prompt_version}",
         "fewshot_messages": few,
-        "user": user
+        "user": f"{instructions}{report_text}\n",
+        # Leading characters of "user" shared by all reports; tokenized only once
+        "user_static_chars": len(instructions),
+        "prompt_version": prompt_version,
     }
 
-def extract_from_text(report_text: str, model_name: str, **gen_kwargs) -> Dict[str, Any]:
-    prompt = build_prompt(report_text, prompt_version="v1")
-    raw = constrained_json_completion(prompt, model_name=model_name, **gen_kwargs)
-    post = normalize_units_and_cleanup(raw, original_text=report_text)
+
+def _fill_summary_from_exam(
+    data: Dict[str, Any], report_text: str, pruned: PrunedReport
+):
+    # The EXAM line is cheap to parse; trust it when the model could not see it or
+    # did not say
+    summary = data.setdefault("summary", {})
+    exam_sent = "EXAM" in pruned.kept
+    for key, value in zip(
+        ("modality", "body_region"), parse_exam(report_text, pruned.sections)
+    ):
+        if value != "UNKNOWN" and (
+            not exam_sent or summary.get(key) in (None, "UNKNOWN")
+        ):
+            summary[key] = value
+
+
+def extract_from_text(
+    report_text: str,
+    model_name: str,
+    section_policy: Optional[SectionPolicy] = None,
+    stats: Optional[Counter] = None,
+    index: Optional[ReportIndex] = None,
+    token_budget: Optional[TokenBudget] = None,
+    prompt_version: str = "v1",
+    **gen_kwargs,
+) -> Dict[str, Any]:
+    """Extract one report. `section_policy` prunes boilerplate sections before prompting
+    (None sends the full report); `stats`, if given, accumulates per-run counters;
+    `index` is a prebuilt text index for the report (see `build_indexes`);
+    `token_budget` sizes `max_tokens` to the report instead of reserving the static
+    limit; `prompt_version` "t1" has the model emit compact rows instead of JSON (see
+    `storymode.tabular`)."""
+    with stage("prompt"):
+        pruned = prune_report(report_text, section_policy, index)
+        prompt = build_prompt(pruned.text, prompt_version=prompt_version)
+    raw = _complete(
+        prompt, report_text, model_name, token_budget, stats, index, **gen_kwargs
+    )
+    with stage("postprocess"):
+        post = normalize_units_and_cleanup(raw, original_text=report_text, index=index)
+        _fill_summary_from_exam(post, report_text, pruned)
+    if stats is not None:
+        stats.update(
+            {
+                "reports": 1,
+                "report_tokens": pruned.original_tokens,
+                "report_tokens_sent": pruned.kept_tokens,
+            }
+        )
     return post
 
-def batch_extract(in_dir: str, out_dir: str, model: str, max_workers: int = 4, **gen_kwargs):
-    os.makedirs(out_dir, exist_ok=True)
+
+def _complete(
+    prompt: Dict[str, Any],
+    report_text: str,
+    model_name: str,
+    token_budget: Optional[TokenBudget],
+    stats: Optional[Counter],
+    index: Optional[ReportIndex],
+    **gen_kwargs,
+):
+    config = model_manager.get_model_config(model_name)
+    cap = gen_kwargs.get("max_tokens", config.max_tokens)
+    budget = (
+        None
+        if token_budget is None
+        else token_budget.predict(index or build_index(report_text), cap)
+    )
+    diagnostics = gen_kwargs.pop("diagnostics", None)
+    if diagnostics is None:
+        diagnostics = {}
+        gen_kwargs.setdefault("logprobs", False)
+    raw = constrained_json_completion(
+        prompt,
+        model_name=model_name,
+        diagnostics=diagnostics,
+        budget=budget,
+        **gen_kwargs,
+    )
+    if stats is not None:
+        _count_generation(
+            stats,
+            config,
+            diagnostics["completion_tokens"],
+            budget,
+            cap,
+            diagnostics["continuations"],
+        )
+    return raw
+
+
+def _count_generation(
+    stats: Counter,
+    config,
+    completion_tokens: Optional[int],
+    budget: Optional[int],
+    cap: int,
+    continuations: int = 0,
+):
+    # Backends that cannot count generated tokens report 0
+    stats["completion_tokens"] += completion_tokens or 0
+    if budget is not None:
+        stats.update(
+            {
+                "budget_reports": 1,
+                "budget_hits": int(continuations == 0),
+                "budget_continuations": continuations,
+                "budget_tokens": budget,
+                "budget_static_tokens": cap,
+                "budget_kv_saved_bytes": (cap - budget) * config.kv_bytes_per_token,
+            }
+        )
+
+
+def extract_batch(
+    reports: List[Tuple[str, ReportIndex]],
+    model_name: str,
+    planner: BatchPlanner,
+    section_policy: Optional[SectionPolicy] = None,
+    stats: Optional[Counter] = None,
+    token_budget: Optional[TokenBudget] = None,
+    prompt_version: str = "v1",
+    **gen_kwargs,
+) -> List[Dict[str, Any]]:
+    """Extract several (report text, index) pairs with batched generation.
+
+    `planner` sizes the `generate_batch` calls (see `storymode.batching`). Items whose
+    completion is truncated or fails validation are re-run one at a time through
+    `extract_from_text`, which retries and continues them.
+    """
+    stats = stats if stats is not None else Counter()
+    config = model_manager.get_model_config(model_name)
+    cap = gen_kwargs.get("max_tokens", config.max_tokens)
+    validation_engine = gen_kwargs.get("validation_engine", "pydantic")
+    with stage("prompt"):
+        pruned = [prune_report(text, section_policy, index) for text, index in reports]
+        messages = [
+            format_messages_for_model(build_prompt(p.text, prompt_version), model_name)
+            for p in pruned
+        ]
+    budgets = [
+        cap if token_budget is None else token_budget.predict(index, cap)
+        for _, index in reports
+    ]
+    gen_params = generation_params(
+        config, gen_kwargs, json_mode=not is_tabular(prompt_version)
+    )
+    del gen_params["max_tokens"]  # per item, from `budgets`
+    with model_manager.using(model_name) as backend, stage("generate"):
+        lengths = [backend.prompt_tokens(m) for m in messages]
+        results = planner.run(backend, messages, lengths, budgets, **gen_params)
+
+    out = []
+    for (text, index), p, (completion, reason, n), budget in zip(
+        reports, pruned, results, budgets
+    ):
+        try:
+            if reason == "length":
+                raise ValueError("completion truncated at max_tokens")
+            raw = parse_completion(completion, validation_engine, prompt_version)
+        except ValueError:
+            stats["batch_fallbacks"] += 1
+            out.append(
+                extract_from_text(
+                    text,
+                    model_name,
+                    section_policy=section_policy,
+                    stats=stats,
+                    index=index,
+                    token_budget=token_budget,
+                    prompt_version=prompt_version,
+                    **gen_kwargs,
+                )
+            )
+            continue
+        with stage("postprocess"):
+            post = normalize_units_and_cleanup(raw, original_text=text, index=index)
+            _fill_summary_from_exam(post, text, p)
+        _count_generation(
+            stats, config, n, None if token_budget is None else budget, cap
+        )
+        stats.update(
+            {
+                "reports": 1,
+                "report_tokens": p.original_tokens,
+                "report_tokens_sent": p.kept_tokens,
+            }
+        )
+        out.append(post)
+    return out
+
+
+def extract_stream(
+    report_text: str,
+    model_name: str,
+    section_policy: Optional[SectionPolicy] = None,
+    stats: Optional[Counter] = None,
+    index: Optional[ReportIndex] = None,
+    prompt_version: str = "v1",
+    diagnostics: Optional[Dict[str, Any]] = None,
+    **gen_kwargs,
+) -> Iterator[StreamEvent]:
+    """Extract one report while it is being generated.
+
+    Yields a "summary" event and one "lesion" event per lesion as soon as its JSON
+    object (or row) is complete, each validated on its own, then a "result" event with
+    the postprocessed ReportExtraction validated from the whole completion. If that
+    fails (e.g. output truncated at `max_tokens`) the report is re-run through
+    `extract_from_text`, which retries and continues it. `diagnostics`, if given,
+    receives ``first_token_ms``, ``first_lesion_ms`` and ``total_ms`` (from sending the
+    request) plus the raw completion.
+    """
+    diagnostics = diagnostics if diagnostics is not None else {}
+    validation_engine = gen_kwargs.pop("validation_engine", "pydantic")
+    with stage("prompt"):
+        pruned = prune_report(report_text, section_policy, index)
+        prompt = build_prompt(pruned.text, prompt_version=prompt_version)
+    parser = StreamParser(prompt_version)
+    start = time.perf_counter()
+
+    def elapsed() -> float:
+        return (time.perf_counter() - start) * 1000.0
+
+    def events(parts):
+        for kind, obj in parts:
+            try:
+                item = validate_part(Summary if kind == "summary" else Lesion, obj)
+            except ValueError:
+                parser.skipped += 1
+                continue
+            if kind == "lesion":
+                diagnostics.setdefault("first_lesion_ms", elapsed())
+            yield StreamEvent(kind, item, elapsed())
+
+    for chunk in stream_completion(
+        prompt, model_name, diagnostics=diagnostics, **gen_kwargs
+    ):
+        diagnostics.setdefault("first_token_ms", elapsed())
+        yield from events(parser.feed(chunk))
+    yield from events(parser.close())
+    try:
+        raw = parse_completion(diagnostics["text"], validation_engine, prompt_version)
+    except ValueError:
+        if stats is not None:
+            stats["stream_fallbacks"] += 1
+        post = extract_from_text(
+            report_text,
+            model_name,
+            section_policy=section_policy,
+            stats=stats,
+            index=index,
+            prompt_version=prompt_version,
+            validation_engine=validation_engine,
+            **gen_kwargs,
+        )
+    else:
+        with stage("postprocess"):
+            post = normalize_units_and_cleanup(
+                raw, original_text=report_text, index=index
+            )
+            _fill_summary_from_exam(post, report_text, pruned)
+        if stats is not None:
+            config = model_manager.get_model_config(model_name)
+            _count_generation(
+                stats,
+                config,
+                diagnostics["completion_tokens"],
+                None,
+                gen_kwargs.get("max_tokens", config.max_tokens),
+            )
+            stats.update(
+                {
+                    "reports": 1,
+                    "report_tokens": pruned.original_tokens,
+                    "report_tokens_sent": pruned.kept_tokens,
+                }
+            )
+    diagnostics["total_ms"] = elapsed()
+    diagnostics["skipped_parts"] = parser.skipped
+    if stats is not None:
+        stats.update(
+            {
+                "stream_reports": 1,
+                "stream_lesion_reports": int("first_lesion_ms" in diagnostics),
+            }
+        )
+        stats["stream_first_lesion_ms"] += diagnostics.get("first_lesion_ms", 0.0)
+    yield StreamEvent(
+        "result", ReportExtraction.model_validate(post), diagnostics["total_ms"]
+    )
+
+
+def extract_self_consistent(
+    report_text: str,
+    model_name: str,
+    n: int = 5,
+    temperature: float = 0.7,
+    section_policy: Optional[SectionPolicy] = None,
+    stats: Optional[Counter] = None,
+    index: Optional[ReportIndex] = None,
+    size_tolerance_mm: int = 2,
+    prompt_version: str = "v1",
+    **gen_kwargs,
+) -> Dict[str, Any]:
+    """Sample `n` extractions from one prefill and merge them by field-wise majority"""
+    pruned = prune_report(report_text, section_policy, index)
+    prompt = build_prompt(pruned.text, prompt_version=prompt_version)
+    gen_kwargs.pop("diagnostics", None)
+    gen_kwargs.pop("token_budget", None)
+    samples, invalid = sample_completions(
+        prompt, model_name=model_name, n=n, temperature=temperature, **gen_kwargs
+    )
+    if not samples:
+        raise ValueError(f"All {n} self-consistency samples failed validation")
+    index = index or build_index(report_text)
+    posts = [
+        normalize_units_and_cleanup(sample, original_text=report_text, index=index)
+        for sample in samples
+    ]
+    merged = merge_samples(posts, size_tolerance_mm=size_tolerance_mm)
+    _fill_summary_from_exam(merged, report_text, pruned)
+    if stats is not None:
+        stats.update(
+            {
+                "reports": 1,
+                "report_tokens": pruned.original_tokens,
+                "report_tokens_sent": pruned.kept_tokens,
+                "sc_samples": n,
+                "sc_invalid_samples": invalid,
+            }
+        )
+    return merged
+
+
+def _extract_with_self_consistency(
+    report_text: str,
+    model_name: str,
+    config: SelfConsistencyConfig,
+    stats: Counter,
+    index: ReportIndex,
+    **gen_kwargs,
+) -> Dict[str, Any]:
+    if config.only_uncertain is not None:
+        diagnostics, attempt = {}, Counter()
+        try:
+            data = extract_from_text(
+                report_text,
+                model_name=model_name,
+                stats=attempt,
+                index=index,
+                diagnostics=diagnostics,
+                **gen_kwargs,
+            )
+            signals = escalation_signals(
+                data, diagnostics, index, config.only_uncertain
+            )
+        except RetryError:
+            if not config.only_uncertain.escalate_on_failure:
+                raise
+            signals = ["failure"]
+        # A sampled report counts once, for its samples; the greedy try is kept apart
+        stats.update(
+            {("sc_greedy_" if signals else "") + k: v for k, v in attempt.items()}
+        )
+        if not signals:
+            return data
+        stats.update(f"uncertain_{s}" for s in signals)
+    stats["sc_reports"] += 1
+    # Samples are drawn at the configured temperature, not the greedy one of the run
+    gen_kwargs = dict(gen_kwargs, temperature=config.temperature)
+    return extract_self_consistent(
+        report_text,
+        model_name,
+        n=config.n,
+        stats=stats,
+        index=index,
+        size_tolerance_mm=config.size_tolerance_mm,
+        **gen_kwargs,
+    )
+
+
+# Reports indexed per regex pass over the joined text
+INDEX_BATCH_SIZE = 256
+
+
+def list_reports(in_dir: str) -> List[str]:
     files = [f for f in os.listdir(in_dir) if f.lower().endswith(".txt")]
     files.sort()
+    return files
+
+
+def iter_reports(
+    in_dir: str, shard: Optional[Tuple[int, int]] = None
+) -> Iterator[Tuple[str, str]]:
+    """(name, text) for each report in a folder of .txt files or a packed corpus.
+
+    With `shard=(i, n)` only the reports `shard_of` assigns to shard i are yielded.
+    """
+    if is_packed_corpus(in_dir):
+        with PackedCorpus(in_dir) as corpus:
+            for i, name in enumerate(corpus.names):
+                if shard is None or shard_of(name, shard[1]) == shard[0]:
+                    yield name, corpus.text(i)
+        return
+    for fname in list_reports(in_dir):
+        if shard is None or shard_of(fname, shard[1]) == shard[0]:
+            yield fname, read_txt(os.path.join(in_dir, fname))
+
+
+def _extract_reports(
+    reports: Iterable[Tuple[str, str]],
+    out_dir: str,
+    model: str,
+    output_format: str = "json",
+    cascade: Optional[CascadePolicy] = None,
+    self_consistency: Optional[SelfConsistencyConfig] = None,
+    batching: Optional[BatchPolicy] = None,
+    profiler: Optional[Profiler] = None,
+    dedup: Optional[DedupPolicy] = None,
+    **gen_kwargs,
+) -> Counter:
+    if cascade is not None and self_consistency is not None:
+        raise ValueError("Use either a cascade or self-consistency sampling, not both")
+    if batching is not None and (cascade is not None or self_consistency is not None):
+        raise ValueError(
+            "Batched generation does not support cascades or self-consistency sampling"
+        )
+    os.makedirs(out_dir, exist_ok=True)
+    writer = ColumnarWriter(out_dir) if output_format == "parquet" else None
+    stats = Counter()
+    escalated = []
+    # Every unit of work (a report, or a chunk when batching) may be profiled
+    sample = profiler.sample if profiler is not None else lambda label: nullcontext()
+    deduper = None if dedup is None else Deduplicator(dedup)
+
+    def emit(fname: str, data: Dict[str, Any], model_name: str, elapsed_ms: float):
+        data["model_name"] = model_name
+        data["prompt_version"] = gen_kwargs.get("prompt_version", "v1")
+        if deduper is not None:
+            deduper.store(fname, data)
+        stats["outputs"] += 1
+        stats.update(
+            f"evidence_{lesion['evidence_status']}"
+            for lesion in data.get("lesions", [])
+            if lesion.get("evidence_status")
+        )
+        doc_id = os.path.splitext(fname)[0]
+        if writer is not None:
+            writer.write(doc_id, data)
+        else:
+            dump_json(data, os.path.join(out_dir, doc_id + ".json"))
+        print(f"Processed {fname} with {model_name} in {elapsed_ms:.1f} ms")
+
+    def emit_duplicates():
+        for fname, data in deduper.resolve():
+            emit(fname, data, data["model_name"], 0.0)
+
+    try:
+        first_model = cascade.small_model if cascade else model
+        planner = (
+            None
+            if batching is None
+            else BatchPlanner(model_manager.get_model_config(model), batching)
+        )
+        for chunk in chunked(reports, INDEX_BATCH_SIZE):
+            if deduper is not None:
+                # Duplicates held back from the previous chunk, then this chunk's
+                # unique texts
+                emit_duplicates()
+                chunk = deduper.admit(chunk)
+                if not chunk:
+                    continue
+            indexes = build_indexes([report_text for _, report_text in chunk])
+            if planner is not None:
+                with sample(chunk[0][0]), Timer() as t:
+                    datas = extract_batch(
+                        [
+                            (report_text, index)
+                            for (_, report_text), index in zip(chunk, indexes)
+                        ],
+                        model,
+                        planner,
+                        stats=stats,
+                        **gen_kwargs,
+                    )
+                for (fname, _), data in zip(chunk, datas):
+                    emit(fname, data, model, t.elapsed_ms / len(chunk))
+                continue
+            for (fname, report_text), index in zip(chunk, indexes):
+                if cascade is None:
+                    with sample(fname), Timer() as t:
+                        if self_consistency is None:
+                            data = extract_from_text(
+                                report_text,
+                                model_name=model,
+                                stats=stats,
+                                index=index,
+                                **gen_kwargs,
+                            )
+                        else:
+                            data = _extract_with_self_consistency(
+                                report_text,
+                                model,
+                                self_consistency,
+                                stats,
+                                index,
+                                **gen_kwargs,
+                            )
+                    emit(fname, data, model, t.elapsed_ms)
+                    continue
+                diagnostics, attempt = {}, Counter()
+                with sample(fname), Timer() as t:
+                    try:
+                        data = extract_from_text(
+                            report_text,
+                            model_name=first_model,
+                            stats=attempt,
+                            index=index,
+                            diagnostics=diagnostics,
+                            **gen_kwargs,
+                        )
+                        signals = escalation_signals(data, diagnostics, index, cascade)
+                    except RetryError:
+                        if not cascade.escalate_on_failure:
+                            raise
+                        signals = ["failure"]
+                # An escalated report counts once, for the large model; the small
+                # model's attempt is kept apart
+                stats.update(
+                    {
+                        ("cascade_small_" if signals else "") + k: v
+                        for k, v in attempt.items()
+                    }
+                )
+                stats.update(
+                    {"cascade_reports": 1, "cascade_escalated": int(bool(signals))}
+                )
+                stats.update(f"escalate_{s}" for s in signals)
+                if signals:
+                    escalated.append((fname, report_text, index))
+                else:
+                    emit(fname, data, first_model, t.elapsed_ms)
+
+        # Second, model-major pass: free the small model before loading the large one
+        if escalated:
+            model_manager.close_backend(first_model)
+            for fname, report_text, index in escalated:
+                with sample(fname), Timer() as t:
+                    data = extract_from_text(
+                        report_text,
+                        model_name=cascade.large_model,
+                        stats=stats,
+                        index=index,
+                        **gen_kwargs,
+                    )
+                emit(fname, data, cascade.large_model, t.elapsed_ms)
+
+        if deduper is not None:
+            emit_duplicates()
+            # Their source extraction was evicted from the cache; rare, so no cascade
+            # or sampling
+            for fname, report_text in deduper.leftovers():
+                with sample(fname), Timer() as t:
+                    data = extract_from_text(
+                        report_text, model_name=first_model, stats=stats, **gen_kwargs
+                    )
+                emit(fname, data, first_model, t.elapsed_ms)
+    finally:
+        if writer is not None:
+            writer.close()
+    if stats["reports"] and stats["report_tokens_sent"] < stats["report_tokens"]:
+        saved = stats["report_tokens"] - stats["report_tokens_sent"]
+        print(
+            f"Section pruning saved {saved / stats['reports']:.1f} report tokens "
+            "per report on average"
+        )
+    if stats["evidence_unsupported"]:
+        print(
+            f"{stats['evidence_unsupported']} evidence spans were not found "
+            "in their report"
+        )
+    if deduper is not None:
+        stats.update(deduper.stats)
+        print(
+            f"Deduplication: {stats['dedup_duplicates']}/{stats['dedup_reports']} "
+            f"reports ({deduper.ratio:.1%}) reused the extraction of an identical "
+            "normalized text"
+        )
+    if batching is not None and planner.stats["batches"]:
+        stats.update(planner.stats)
+        print(
+            f"Batched generation: {planner.stats['batches']} batches, "
+            f"{planner.stats['batch_items'] / planner.stats['batches']:.1f} reports "
+            f"per batch on average (max {planner.stats['batch_max_size']}), "
+            f"{planner.stats['batch_oom_splits']} out-of-memory splits, "
+            f"{stats['batch_fallbacks']} reports re-run singly; "
+            f"memory estimate scale {planner.scale:.2f}"
+        )
+    if stats["completion_tokens"]:
+        print(
+            f"Generated {stats['completion_tokens'] / stats['reports']:.0f} tokens "
+            "per report on average "
+            f"(prompt version {gen_kwargs.get('prompt_version', 'v1')})"
+        )
+    if stats["budget_reports"]:
+        summary = budget_summary(stats)
+        per_batch = (
+            ""
+            if "kv_saved_mb_per_batch" not in summary
+            else (
+                f", {summary['kv_saved_mb_per_batch']:.0f} MB per generate batch "
+                f"({summary['reports_per_batch']:.1f} reports on average)"
+            )
+        )
+        print(
+            f"Adaptive max_tokens: {summary['hit_rate']:.1%} of reports fit the "
+            f"predicted budget ({summary['continuations']} continuations); reserved "
+            f"{summary['avg_reserved_tokens']:.0f} vs "
+            f"{summary['avg_static_tokens']:.0f} tokens per report, saving "
+            f"{summary['kv_saved_mb_per_report']:.1f} MB KV cache per report{per_batch}"
+        )
+    if self_consistency is not None:
+        print(
+            f"Self-consistency sampled {stats['sc_reports']}/{stats['outputs']} "
+            f"reports with n={self_consistency.n}"
+        )
+    if cascade is not None:
+        summary = cascade_summary(stats, cascade)
+        print(
+            f"Cascade escalated {summary['escalated']}/{summary['reports']} reports "
+            f"({summary['escalation_rate']:.1%}) to {cascade.large_model}; "
+            f"estimated cost saved vs. {cascade.large_model} everywhere: "
+            f"{summary['cost_saved']:.1%}"
+        )
+    if profiler is not None:
+        print(format_summary(profiler.write()))
+        print(f"Profiles written to {profiler.out_dir}")
+    return stats
+
+
+def batch_extract(
+    in_dir: str,
+    out_dir: str,
+    model: str,
+    max_workers: int = 4,
+    output_format: str = "json",
+    record_to: Optional[str] = None,
+    shard: Optional[Tuple[int, int]] = None,
+    **gen_kwargs,
+) -> Counter:
+    """Extract every report in `in_dir` and return the run counters.
+
+    `in_dir` is a folder of .txt reports or a packed corpus (see `storymode.corpus`);
+    `shard=(i, n)` extracts only shard i of n, and `merge_shards` combines the outputs.
+    `output_format` is "json" (one file per report) or "parquet" (`reports` and
+    `lesions` tables, see `storymode.columnar`). Pass `section_policy` to send only
+    some report sections to the model, and `cascade` to run a small model first and
+    re-run only uncertain reports with a larger one (`model` is then ignored), or
+    `self_consistency` to sample and vote on (uncertain) reports. `token_budget` sizes
+    each report's `max_tokens` from its content (see `storymode.tokenbudget`),
+    `prompt_version="t1"` switches to the compact row output protocol, and `batching`
+    generates several reports per call (see `storymode.batching`). `record_to` appends
+    every raw completion to a store that `ModelManager.register_replay` can serve,
+    `profiler` profiles a sample of the reports (see `storymode.profiling`), and `dedup`
+    extracts each normalized text once and copies the result to its duplicates (see
+    `storymode.dedup`).
+    The counters are also written to `run_stats.json` in `out_dir`.
+    """
+    if output_format not in ("json", "parquet"):
+        raise ValueError(f"Unknown output format: {output_format}")
+    if record_to:
+        model_manager.start_recording(record_to)
+    try:
+        stats = _extract_reports(
+            iter_reports(in_dir, shard),
+            out_dir,
+            model,
+            output_format=output_format,
+            **gen_kwargs,
+        )
+    finally:
+        model_manager.stop_recording()
+        # Clean up model backends
+        model_manager.close_all()
+    write_run_stats(out_dir, stats, shard)
+    return stats
+
+
+def sweep_models(
+    models: List[str], in_dir: str, out_dir: str, **gen_kwargs
+) -> Dict[str, Dict[str, Any]]:
+    """Run several models over one corpus, model-major, so each model loads only once.
 
-    for fname in files:
-        fp = os.path.join(in_dir, fname)
-        report_text = read_txt(fp)
+    Outputs go to ``out_dir/<model>/``. Each model's backend is closed before the next
+    one is loaded; the returned per-model stats include the memory the close released.
+    """
+    files = list_reports(in_dir)
+    reports = [(fname, read_txt(os.path.join(in_dir, fname))) for fname in files]
+    stats = {}
+    for model in models:
         with Timer() as t:
-            data = extract_from_text(report_text, model_name=model, **gen_kwargs)
-        data["model_name"] = model
-        data["prompt_version"] = "v1"
-        dump_json(data, os.path.join(out_dir, fname.replace(".txt", ".json")))
-        print(f"Processed {fname} in {t.elapsed_ms:.1f} ms")
-    
-    # Clean up model backends
-    model_manager.close_all()
\ No newline at end of file
+            _extract_reports(reports, os.path.join(out_dir, model), model, **gen_kwargs)
+        released = model_manager.close_backend(model)
+        loaded = model_manager.footprints.get(model, MemoryUsage())
+        stats[model] = {
+            "reports": len(reports),
+            "elapsed_ms": t.elapsed_ms,
+            "loaded_host_mb": loaded.host_bytes / 2**20,
+            "loaded_device_mb": loaded.device_bytes / 2**20,
+            "released_host_mb": released.host_bytes / 2**20,
+            "released_device_mb": released.device_bytes / 2**20,
+        }
+        print(
+            f"{model}: {len(reports)} reports in {t.elapsed_ms / 1000:.1f} s, "
+            f"released {released.host_bytes / 2**20:.0f} MB host / "
+            f"{released.device_bytes / 2**20:.0f} MB device"
+        )
+    model_manager.close_all()
+    return stats
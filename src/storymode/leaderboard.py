@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from .eval import iter_predictions, load_dir, score_document, summarize_scores
+
+# Metric -> True when higher is better
+LEADERBOARD_METRICS = {
+    "doc_accuracy_mets_present": True,
+    "size_mae_mm": False,
+    "size_within_2mm": True,
+    "lesion_precision": True,
+    "lesion_recall": True,
+}
+# Per-document fields compared by `diff_runs`
+DIFF_FIELDS = ("mets_correct", "pred_lesions", "paired_lesions", "size_errors")
+
+# References for worker processes, installed once per worker by the pool initializer
+_REFS: Dict[str, Dict[str, Any]] = {}
+
+
+def _init_worker(refs: Dict[str, Dict[str, Any]]):
+    global _REFS
+    _REFS = refs
+
+
+def evaluate_run(
+    source: str, refs: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """Score one run (JSON dir, columnar dir or JSONL file) against parsed references.
+
+    Predictions are streamed and reduced to per-document tallies as they are read.
+    Documents missing from the run count as empty predictions; extra ones are ignored.
+    """
+    refs = _REFS if refs is None else refs
+    scores, extra = {}, 0
+    for fn, pred in iter_predictions(source):
+        if fn in refs:
+            scores[fn] = score_document(pred, refs[fn])
+        else:
+            extra += 1
+    missing = [fn for fn in refs if fn not in scores]
+    for fn in missing:
+        scores[fn] = score_document({}, refs[fn])
+    metrics = summarize_scores(scores[fn] for fn in sorted(scores))
+    metrics.update(missing_docs=len(missing), extra_docs=extra)
+    return {"source": source, "metrics": metrics, "documents": scores}
+
+
+def run_names(sources: Sequence[str]) -> List[str]:
+    """Short display names: the base name, or the full path when base names collide"""
+    names = [
+        os.path.splitext(os.path.basename(os.path.normpath(s)))[0] for s in sources
+    ]
+    return [
+        n if names.count(n) == 1 else os.path.normpath(s)
+        for n, s in zip(names, sources)
+    ]
+
+
+def evaluate_runs(
+    sources: Sequence[str], ref_dir: str, max_workers: int = 4
+) -> Dict[str, Dict[str, Any]]:
+    """Evaluate many runs against one reference set, parsed once for all workers"""
+    refs = load_dir(ref_dir)
+    names = run_names(sources)
+    if max_workers <= 1 or len(sources) == 1:
+        results = [evaluate_run(s, refs) for s in sources]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(max_workers, len(sources)),
+            initializer=_init_worker,
+            initargs=(refs,),
+        ) as pool:
+            results = list(pool.map(evaluate_run, sources))
+    return dict(zip(names, results))
+
+
+def _missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def rank_runs(results: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Rows, best mean rank first; ties share a rank and missing metrics rank last"""
+    rows = {
+        name: {
+            "run": name,
+            **{m: res["metrics"].get(m) for m in LEADERBOARD_METRICS},
+            "missing_docs": res["metrics"]["missing_docs"],
+        }
+        for name, res in results.items()
+    }
+    for metric, higher in LEADERBOARD_METRICS.items():
+        values = [row[metric] for row in rows.values() if not _missing(row[metric])]
+        for row in rows.values():
+            value = row[metric]
+            if _missing(value):
+                row[f"{metric}_rank"] = len(values) + 1
+            else:
+                row[f"{metric}_rank"] = 1 + sum(
+                    (v > value) if higher else (v < value) for v in values
+                )
+    for row in rows.values():
+        row["mean_rank"] = sum(row[f"{m}_rank"] for m in LEADERBOARD_METRICS) / len(
+            LEADERBOARD_METRICS
+        )
+    return sorted(rows.values(), key=lambda row: (row["mean_rank"], row["run"]))
+
+
+def diff_runs(a: Dict[str, Any], b: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Documents whose tallies differ, as ``{"doc", field: (a, b), ...}``"""
+    rows = []
+    for fn in sorted(a["documents"]):
+        da, db = a["documents"][fn], b["documents"].get(fn, {})
+        changed = {
+            f: (da.get(f), db.get(f)) for f in DIFF_FIELDS if da.get(f) != db.get(f)
+        }
+        if changed:
+            rows.append({"doc": fn, **changed})
+    return rows
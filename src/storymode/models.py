@@ -1,13 +1,37 @@
 from __future__ import annotations
-import os
+
+import gc
 import json
+import os
+import threading
 import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional, Union
-from dataclasses import dataclass
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from itertools import count
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from .profiling import stage
+from .prompt_templates import PromptAssembler
 
-from transformers import AutoTokenizer, AutoModelForCausalLM
-import torch
+try:
+    import torch
+    from transformers import (
+        AutoModelForCausalLM,
+        AutoTokenizer,
+        StoppingCriteria,
+        StoppingCriteriaList,
+        TextIteratorStreamer,
+    )
+
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    # Replayed runs need neither; backends that do raise on construction
+    TRANSFORMERS_AVAILABLE = False
+    AutoTokenizer = AutoModelForCausalLM = TextIteratorStreamer = None
+    StoppingCriteria = StoppingCriteriaList = None
+    torch = None
 try:
     from vllm import LLM, SamplingParams
     VLLM_AVAILABLE = True
@@ -35,68 +59,308 @@ class ModelConfig:
     requires_system_prompt: bool = True
     json_mode_supported: bool = False
     context_window: int = 8192
+    relative_cost: float = (
+        1.0  # approximate per-report inference cost relative to a 7B dense model
+    )
+    # Attention geometry, used to size the KV cache a generation budget reserves
+    num_layers: int = 32
+    num_kv_heads: int = 8
+    head_dim: int = 128
+    kv_dtype_bytes: int = 2
+    # Used with the above to estimate prefill activations and logits for batch plans
+    hidden_size: int = 4096
+    vocab_size: int = 32000
+
+    @property
+    def kv_bytes_per_token(self) -> int:
+        """KV-cache bytes one token occupies (keys and values, all layers)"""
+        return (
+            2
+            * self.num_layers
+            * self.num_kv_heads
+            * self.head_dim
+            * self.kv_dtype_bytes
+        )
+
+
+@dataclass
+class MemoryUsage:
+    """Host (RSS) and device (CUDA) memory, in bytes"""
+
+    host_bytes: int = 0
+    device_bytes: int = 0
+
+    def __add__(self, other: "MemoryUsage") -> "MemoryUsage":
+        return MemoryUsage(
+            self.host_bytes + other.host_bytes, self.device_bytes + other.device_bytes
+        )
+
+    def __sub__(self, other: "MemoryUsage") -> "MemoryUsage":
+        return MemoryUsage(
+            self.host_bytes - other.host_bytes, self.device_bytes - other.device_bytes
+        )
+
+    def clamp(self) -> "MemoryUsage":
+        return MemoryUsage(max(self.host_bytes, 0), max(self.device_bytes, 0))
+
+
+def _host_rss_bytes() -> int:
+    try:
+        import psutil
+
+        return int(psutil.Process().memory_info().rss)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def current_memory_usage() -> MemoryUsage:
+    """Measure current process RSS and CUDA memory reserved by the caching allocator"""
+    device = 0
+    if torch is not None and torch.cuda.is_available():
+        device = sum(
+            torch.cuda.memory_reserved(i) for i in range(torch.cuda.device_count())
+        )
+    return MemoryUsage(host_bytes=_host_rss_bytes(), device_bytes=int(device))
+
+
+def release_memory():
+    """Run the garbage collector and hand cached CUDA blocks back to the driver"""
+    gc.collect()
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.empty_cache()
+        torch.cuda.ipc_collect()
+
+
+def _per_item(value: Any, n: int) -> List[Any]:
+    return list(value) if isinstance(value, (list, tuple)) else [value] * n
+
 
 class ModelBackend(ABC):
     """Abstract base class for model backends"""
-    
+
+    # (token text, log-probability) per generated token of the last logprobs=True call
+    last_logprobs: Optional[List[Tuple[str, float]]] = None
+    # "length" when the last call stopped at max_tokens, else "stop"; and its tokens
+    last_finish_reason: Optional[str] = None
+    last_completion_tokens: Optional[int] = None
+    # The same, per item, for the last generate_batch call
+    last_batch_finish_reasons: Optional[List[Optional[str]]] = None
+    last_batch_completion_tokens: Optional[List[Optional[int]]] = None
+
     @abstractmethod
     def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """Generate text from messages"""
         pass
-    
+
+    def generate_n(self, messages: List[Dict[str, str]], n: int, **kwargs) -> List[str]:
+        """Generate `n` samples for the same messages.
+
+        Backends override this to share one prefill across the samples.
+        """
+        return [self.generate(messages, **kwargs) for _ in range(n)]
+
+    def generate_batch(self, batch: List[List[Dict[str, str]]], **kwargs) -> List[str]:
+        """One completion per message list; `max_tokens` may be a per-item list.
+
+        Backends override this to run the batch in one forward pass.
+        """
+        caps = _per_item(kwargs.get("max_tokens"), len(batch))
+        texts, reasons, tokens = [], [], []
+        for messages, cap in zip(batch, caps):
+            params = dict(kwargs) if cap is None else dict(kwargs, max_tokens=cap)
+            texts.append(self.generate(messages, **params))
+            reasons.append(self.last_finish_reason)
+            tokens.append(self.last_completion_tokens)
+        self.last_batch_finish_reasons = reasons
+        self.last_batch_completion_tokens = tokens
+        return texts
+
+    def generate_stream(
+        self, messages: List[Dict[str, str]], **kwargs
+    ) -> Iterator[str]:
+        """Yield the completion in chunks as it is generated; `last_*` are set at end.
+
+        Backends override this to stream; by default the whole completion is one chunk.
+        """
+        yield self.generate(messages, **kwargs)
+
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        """Prompt length in tokens, estimated from the text if there is no tokenizer"""
+        from .sections import estimate_tokens
+
+        return sum(estimate_tokens(m["content"]) for m in messages)
+
     @abstractmethod
     def close(self):
         """Clean up resources"""
         pass
 
 
-
 class VLLMBackend(ModelBackend):
     """Backend for vLLM inference"""
-    
+
     def __init__(self, model_path: str, model_name: str = None, **kwargs):
         if not VLLM_AVAILABLE:
             raise ImportError("vLLM is not available. Please install vLLM or use transformers backend instead.")
         self.llm = LLM(model=model_path, **kwargs)
         self.model_name = model_name
+        self.assembler = PromptAssembler(self.llm.get_tokenizer(), model_name)
+        self._request_ids = count()
         self.sampling_params = SamplingParams(
             temperature=0.0,
             top_p=1.0,
             max_tokens=1200,
             stop=["<|im_end|>", "\n\n"]
         )
-    
-    def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
-        # Convert messages to prompt format
-        prompt = self._messages_to_prompt(messages)
-        
+
+    def _sampling_params(self, kwargs: Dict[str, Any], n: int = 1) -> "SamplingParams":
         # Update sampling params if provided
-        sampling_params = self.sampling_params
-        if kwargs:
-            sampling_params = SamplingParams(
-                temperature=kwargs.get("temperature", self.sampling_params.temperature),
-                top_p=kwargs.get("top_p", self.sampling_params.top_p),
-                max_tokens=kwargs.get("max_tokens", self.sampling_params.max_tokens),
-                stop=kwargs.get("stop", self.sampling_params.stop)
+        if not kwargs and n == 1:
+            return self.sampling_params
+        return SamplingParams(
+            n=n,
+            temperature=kwargs.get("temperature", self.sampling_params.temperature),
+            top_p=kwargs.get("top_p", self.sampling_params.top_p),
+            max_tokens=kwargs.get("max_tokens", self.sampling_params.max_tokens),
+            stop=kwargs.get("stop", self.sampling_params.stop),
+            logprobs=1 if kwargs.get("logprobs") else None,
+        )
+
+    def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self.generate_n(messages, 1, **kwargs)[0]
+
+    def generate_n(self, messages: List[Dict[str, str]], n: int, **kwargs) -> List[str]:
+        # Convert messages to prompt format; a prefix continues a partial assistant turn
+        prefix = kwargs.get("assistant_prefix", "")
+        with stage("tokenize"):
+            prompt = {"prompt_token_ids": self.assembler.encode(messages, prefix)}
+
+        # One request with n>1 shares the prompt prefill across all samples
+        outputs = self.llm.generate([prompt], self._sampling_params(kwargs, n))
+        completions = outputs[0].outputs
+        self.last_finish_reason = (
+            "length" if completions[0].finish_reason == "length" else "stop"
+        )
+        self.last_completion_tokens = len(completions[0].token_ids)
+        if kwargs.get("logprobs") and completions[0].logprobs is not None:
+            self.last_logprobs = [
+                (step[token_id].decoded_token or "", float(step[token_id].logprob))
+                for token_id, step in zip(
+                    completions[0].token_ids, completions[0].logprobs
+                )
+            ]
+        return [c.text if prefix else c.text.strip() for c in completions]
+
+    def generate_stream(
+        self, messages: List[Dict[str, str]], **kwargs
+    ) -> Iterator[str]:
+        # LLM.generate only returns finished requests; step the engine for partials
+        prefix = kwargs.get("assistant_prefix", "")
+        with stage("tokenize"):
+            prompt = {"prompt_token_ids": self.assembler.encode(messages, prefix)}
+        engine = self.llm.llm_engine
+        request_id = f"stream-{next(self._request_ids)}"
+        engine.add_request(request_id, prompt, self._sampling_params(kwargs))
+        sent, final = 0, None
+        try:
+            while final is None and engine.has_unfinished_requests():
+                for out in engine.step():
+                    if out.request_id != request_id:
+                        continue
+                    completion = out.outputs[0]
+                    if len(completion.text) > sent:
+                        yield completion.text[sent:]
+                        sent = len(completion.text)
+                    if out.finished:
+                        final = completion
+        finally:
+            if final is None:
+                engine.abort_request([request_id])
+        if final is None:
+            raise RuntimeError(
+                f"vLLM engine went idle before stream request {request_id} finished"
             )
-        
-        outputs = self.llm.generate([prompt], sampling_params)
-        return outputs[0].outputs[0].text.strip()
-    
+        self.last_finish_reason = (
+            "length" if final.finish_reason == "length" else "stop"
+        )
+        self.last_completion_tokens = len(final.token_ids)
+
+    def generate_batch(self, batch: List[List[Dict[str, str]]], **kwargs) -> List[str]:
+        # vLLM schedules the batch itself; per-item SamplingParams carry each max_tokens
+        caps = _per_item(
+            kwargs.get("max_tokens", self.sampling_params.max_tokens), len(batch)
+        )
+        with stage("tokenize"):
+            prompts = [
+                {"prompt_token_ids": self.assembler.encode(messages)}
+                for messages in batch
+            ]
+        params = [self._sampling_params(dict(kwargs, max_tokens=cap)) for cap in caps]
+        outputs = self.llm.generate(prompts, params)
+        completions = [out.outputs[0] for out in outputs]
+        self.last_batch_finish_reasons = [
+            "length" if c.finish_reason == "length" else "stop" for c in completions
+        ]
+        self.last_batch_completion_tokens = [len(c.token_ids) for c in completions]
+        return [c.text.strip() for c in completions]
+
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return len(self.assembler.encode(messages))
+
     def _messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         """Convert OpenAI-style messages to prompt string"""
-        from .prompt_templates import get_formatter
-        formatter = get_formatter(self.model_name or "mistral-7b-instruct")
-        return formatter(messages)
-    
+        return self.assembler.format(messages)
+
     def close(self):
         if hasattr(self, 'llm'):
             del self.llm
+        try:
+            from vllm.distributed.parallel_state import destroy_model_parallel
+
+            destroy_model_parallel()
+        except ImportError:
+            pass
+        release_memory()
+
+
+# Prompts longer than this are cut (as the tokenizer's truncation=True did)
+MAX_PROMPT_TOKENS = 4096
+
+
+class _StopOnEvent(StoppingCriteria or object):
+    """Stopping criterion that ends generate() once `event` is set"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(
+        self, input_ids: "torch.Tensor", scores: "torch.Tensor", **kwargs
+    ) -> "torch.Tensor":
+        return torch.full(
+            (input_ids.shape[0],),
+            self.event.is_set(),
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
 
 class TransformersBackend(ModelBackend):
     """Backend for local transformers inference"""
-    
-    def __init__(self, model_path: str, device: str = "auto", **kwargs):
+
+    def __init__(
+        self, model_path: str, model_name: str = None, device: str = "auto", **kwargs
+    ):
+        if not TRANSFORMERS_AVAILABLE:
+            raise ImportError(
+                "transformers/torch are not available. "
+                "Please install them or replay a recorded run instead."
+            )
         self.device = device if device != "auto" else ("cuda" if torch.cuda.is_available() else "cpu")
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
         self.model = AutoModelForCausalLM.from_pretrained(
@@ -105,21 +369,29 @@ class TransformersBackend(ModelBackend):
             device_map="auto" if self.device == "cuda" else None,
             **kwargs
         )
-        
+
         # Set pad token if not present
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
-    
+        self.model_name = model_name
+        self.assembler = PromptAssembler(self.tokenizer, model_name)
+
     def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
-        # Convert messages to prompt
-        prompt = self._messages_to_prompt(messages)
-        
-        # Tokenize
-        inputs = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=4096)
+        return self.generate_n(messages, 1, **kwargs)[0]
+
+    def generate_n(self, messages: List[Dict[str, str]], n: int, **kwargs) -> List[str]:
+        # Convert messages to prompt; a prefix continues a partial assistant turn
+        prefix = kwargs.get("assistant_prefix", "")
+        with stage("tokenize"):
+            input_ids = torch.tensor(
+                [self.assembler.encode(messages, prefix)[:MAX_PROMPT_TOKENS]]
+            )
+        inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
         if self.device == "cuda":
             inputs = {k: v.cuda() for k, v in inputs.items()}
-        
-        # Generate
+
+        # Generate; num_return_sequences expands the prompt after a single prefill
+        want_logprobs = bool(kwargs.get("logprobs"))
         with torch.no_grad():
             outputs = self.model.generate(
                 **inputs,
@@ -127,40 +399,154 @@ class TransformersBackend(ModelBackend):
                 temperature=kwargs.get("temperature", 0.0),
                 top_p=kwargs.get("top_p", 1.0),
                 do_sample=kwargs.get("temperature", 0.0) > 0,
+                num_return_sequences=n,
                 pad_token_id=self.tokenizer.eos_token_id,
                 eos_token_id=self.tokenizer.eos_token_id,
+                return_dict_in_generate=True,
+                output_scores=want_logprobs,
             )
-        
+        generated_ids = outputs.sequences[:, inputs["input_ids"].shape[1] :]
+        self._set_finish(generated_ids[0], kwargs.get("max_tokens", 1200))
+        if want_logprobs:
+            scores = self.model.compute_transition_scores(
+                outputs.sequences, outputs.scores, normalize_logits=True
+            )[0]
+            self.last_logprobs = [
+                (self.tokenizer.decode([token_id]), float(lp))
+                for token_id, lp in zip(generated_ids[0].tolist(), scores.tolist())
+            ]
+
         # Decode
-        generated_text = self.tokenizer.decode(outputs[0][inputs["input_ids"].shape[1]:], skip_special_tokens=True)
-        return generated_text.strip()
-    
+        texts = self.tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+        return texts if prefix else [text.strip() for text in texts]
+
+    def _set_finish(self, generated: "torch.Tensor", max_tokens: int):
+        finished = (generated == self.tokenizer.eos_token_id).any().item()
+        self.last_completion_tokens = int(
+            (generated != self.tokenizer.eos_token_id).sum().item()
+        )
+        self.last_finish_reason = (
+            "stop" if finished or len(generated) < max_tokens else "length"
+        )
+
+    def generate_stream(
+        self, messages: List[Dict[str, str]], **kwargs
+    ) -> Iterator[str]:
+        # generate() runs in a thread and pushes decoded text through the streamer
+        prefix = kwargs.get("assistant_prefix", "")
+        with stage("tokenize"):
+            input_ids = torch.tensor(
+                [self.assembler.encode(messages, prefix)[:MAX_PROMPT_TOKENS]]
+            )
+        if self.device == "cuda":
+            input_ids = input_ids.cuda()
+        streamer = TextIteratorStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True
+        )
+        cancel = (
+            threading.Event()
+        )  # set when the consumer stops reading, so generate() ends at the next token
+        result = {}
+
+        def run():
+            try:
+                with torch.no_grad():
+                    result["sequences"] = self.model.generate(
+                        input_ids=input_ids,
+                        attention_mask=torch.ones_like(input_ids),
+                        max_new_tokens=kwargs.get("max_tokens", 1200),
+                        temperature=kwargs.get("temperature", 0.0),
+                        top_p=kwargs.get("top_p", 1.0),
+                        do_sample=kwargs.get("temperature", 0.0) > 0,
+                        pad_token_id=self.tokenizer.eos_token_id,
+                        eos_token_id=self.tokenizer.eos_token_id,
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([_StopOnEvent(cancel)]),
+                    )
+            except BaseException as exc:
+                result["error"] = exc
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            cancel.set()
+            thread.join()
+        if "error" in result:
+            raise result["error"]
+        self._set_finish(
+            result["sequences"][0, input_ids.shape[1] :], kwargs.get("max_tokens", 1200)
+        )
+
+    def generate_batch(self, batch: List[List[Dict[str, str]]], **kwargs) -> List[str]:
+        caps = _per_item(kwargs.get("max_tokens", 1200), len(batch))
+        with stage("tokenize"):
+            ids = [
+                self.assembler.encode(messages)[:MAX_PROMPT_TOKENS]
+                for messages in batch
+            ]
+
+        # Left-pad so every prompt ends where generation starts
+        width = max(len(x) for x in ids)
+        pad = self.tokenizer.pad_token_id
+        input_ids = torch.tensor([[pad] * (width - len(x)) + x for x in ids])
+        attention_mask = torch.tensor(
+            [[0] * (width - len(x)) + [1] * len(x) for x in ids]
+        )
+        if self.device == "cuda":
+            input_ids, attention_mask = input_ids.cuda(), attention_mask.cuda()
+
+        with torch.no_grad():
+            sequences = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=max(caps),
+                temperature=kwargs.get("temperature", 0.0),
+                top_p=kwargs.get("top_p", 1.0),
+                do_sample=kwargs.get("temperature", 0.0) > 0,
+                pad_token_id=self.tokenizer.eos_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+            )
+
+        # Rows are cut at their own cap so each item sees the budget it asked for
+        texts, reasons, tokens = [], [], []
+        for row, cap in zip(sequences[:, width:].tolist(), caps):
+            eos = (
+                row.index(self.tokenizer.eos_token_id)
+                if self.tokenizer.eos_token_id in row
+                else len(row)
+            )
+            n = min(eos, cap)
+            reasons.append("stop" if eos < cap else "length")
+            tokens.append(n)
+            texts.append(
+                self.tokenizer.decode(row[:n], skip_special_tokens=True).strip()
+            )
+        self.last_batch_finish_reasons = reasons
+        self.last_batch_completion_tokens = tokens
+        return texts
+
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return min(len(self.assembler.encode(messages)), MAX_PROMPT_TOKENS)
+
     def _messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         """Convert OpenAI-style messages to prompt string"""
-        prompt = ""
-        for msg in messages:
-            role = msg["role"]
-            content = msg["content"]
-            
-            if role == "system":
-                prompt += f"<|im_start|>system\n{content}<|im_end|>\n"
-            elif role == "user":
-                prompt += f"<|im_start|>user\n{content}<|im_end|>\n"
-            elif role == "assistant":
-                prompt += f"<|im_start|>assistant\n{content}<|im_end|>\n"
-        
-        prompt += "<|im_start|>assistant\n"
-        return prompt
-    
+        return self.assembler.format(messages)
+
     def close(self):
         if hasattr(self, 'model'):
             del self.model
         if hasattr(self, 'tokenizer'):
             del self.tokenizer
+        release_memory()
 
 class ModelManager:
     """Manages different model backends and configurations"""
-    
+
     # Pre-configured model configurations
     MODEL_CONFIGS = {
         # General-purpose models
@@ -174,19 +560,20 @@ class ModelManager:
             user_prompt_template="[INST] {user} [/INST]",
             assistant_prompt_template="{assistant}",
             requires_system_prompt=False,
-            context_window=8192
+            context_window=8192,
         ),
         "mixtral-8x7b-instruct": ModelConfig(
             name="mixtral-8x7b-instruct",
             backend="transformers",
             model_path="mistralai/Mixtral-8x7B-Instruct-v0.1",
+            relative_cost=3.0,
             temperature=0.0,
             max_tokens=1200,
             system_prompt_template="<s>[INST] {system} [/INST]",
             user_prompt_template="[INST] {user} [/INST]",
             assistant_prompt_template="{assistant}",
             requires_system_prompt=False,
-            context_window=32768
+            context_window=32768,
         ),
         "qwen2.5-7b-instruct": ModelConfig(
             name="qwen2.5-7b-instruct",
@@ -198,21 +585,29 @@ class ModelManager:
             user_prompt_template="<|im_start|>user\n{user}<|im_end|>\n<|im_start|>assistant\n",
             assistant_prompt_template="{assistant}<|im_end|>",
             requires_system_prompt=True,
-            context_window=32768
+            context_window=32768,
+            num_layers=28,
+            num_kv_heads=4,
+            hidden_size=3584,
+            vocab_size=152064,
         ),
         "qwen2.5-14b-instruct": ModelConfig(
             name="qwen2.5-14b-instruct",
             backend="transformers",
             model_path="Qwen/Qwen2.5-14B-Instruct",
+            relative_cost=2.0,
             temperature=0.0,
             max_tokens=1200,
             system_prompt_template="<|im_start|>system\n{system}<|im_end|>\n<|im_start|>user\n{user}<|im_end|>\n<|im_start|>assistant\n",
             user_prompt_template="<|im_start|>user\n{user}<|im_end|>\n<|im_start|>assistant\n",
             assistant_prompt_template="{assistant}<|im_end|>",
             requires_system_prompt=True,
-            context_window=32768
+            context_window=32768,
+            num_layers=48,
+            num_kv_heads=8,
+            hidden_size=5120,
+            vocab_size=152064,
         ),
-        
         # Biomedical models
         "biomistral-7b": ModelConfig(
             name="biomistral-7b",
@@ -224,7 +619,7 @@ class ModelManager:
             user_prompt_template="[INST] {user} [/INST]",
             assistant_prompt_template="{assistant}",
             requires_system_prompt=False,
-            context_window=8192
+            context_window=8192,
         ),
         "meditron-7b": ModelConfig(
             name="meditron-7b",
@@ -236,45 +631,198 @@ class ModelManager:
             user_prompt_template="[INST] {user} [/INST]",
             assistant_prompt_template="{assistant}",
             requires_system_prompt=False,
-            context_window=8192
+            context_window=8192,
+            num_layers=32,
+            num_kv_heads=32,
         ),
-        
-
     }
-    
-    def __init__(self):
-        self.backends: Dict[str, ModelBackend] = {}
-    
+
+    def __init__(
+        self,
+        host_budget_bytes: Optional[int] = None,
+        device_budget_bytes: Optional[int] = None,
+    ):
+        # Backends in least- to most-recently-used order
+        self.backends: OrderedDict[str, ModelBackend] = OrderedDict()
+        self.host_budget_bytes = host_budget_bytes
+        self.device_budget_bytes = device_budget_bytes
+        # Memory measured around each backend load, kept after eviction to plan reloads
+        self.footprints: Dict[str, MemoryUsage] = {}
+        # Memory actually returned by each close, for verifying release
+        self.released: Dict[str, MemoryUsage] = {}
+        self._in_use: Counter = Counter()
+        self.recorder = None
+        # Replay models registered on this manager, looked up before MODEL_CONFIGS
+        self.replay_configs: Dict[str, ModelConfig] = {}
+
+    def set_memory_budget(
+        self, host_bytes: Optional[int] = None, device_bytes: Optional[int] = None
+    ):
+        """Set the host/device memory budget (None = unlimited) and evict to fit"""
+        self.host_budget_bytes = host_bytes
+        self.device_budget_bytes = device_bytes
+        self._evict_to_fit()
+
     def get_model_config(self, model_name: str) -> ModelConfig:
         """Get model configuration by name"""
+        if model_name in self.replay_configs:
+            return self.replay_configs[model_name]
         if model_name not in self.MODEL_CONFIGS:
             raise ValueError(f"Unknown model: {model_name}. Available models: {list(self.MODEL_CONFIGS.keys())}")
         return self.MODEL_CONFIGS[model_name]
-    
+
     def get_backend(self, model_name: str) -> ModelBackend:
-        """Get or create backend for a model"""
+        """Get or create backend for a model, evicting idle ones to stay in budget"""
         if model_name in self.backends:
+            self.backends.move_to_end(model_name)
             return self.backends[model_name]
-        
+
         config = self.get_model_config(model_name)
-        
-        if config.backend == "vllm":
-            backend = VLLMBackend(config.model_path, model_name=model_name)
-        
-        elif config.backend == "transformers":
-            backend = TransformersBackend(config.model_path)
-        
-        else:
-            raise ValueError(f"Unsupported backend: {config.backend}")
-        
+
+        # Make room using the footprint of a previous load when we have one
+        self._evict_to_fit(incoming=self.footprints.get(model_name, MemoryUsage()))
+
+        before = current_memory_usage()
+        backend = self._wrap(model_name, self._create_backend(config))
+        self.footprints[model_name] = (current_memory_usage() - before).clamp()
+
         self.backends[model_name] = backend
+        self._evict_to_fit(keep=model_name)
         return backend
-    
+
+    def _create_backend(self, config: ModelConfig) -> ModelBackend:
+        if config.backend == "vllm":
+            return VLLMBackend(config.model_path, model_name=config.name)
+
+        elif config.backend == "transformers":
+            return TransformersBackend(config.model_path, model_name=config.name)
+
+        elif config.backend == "replay":
+            from .replay import ReplayBackend
+
+            return ReplayBackend(
+                config.model_path, model_name=config.name.split(":", 1)[-1]
+            )
+
+        raise ValueError(f"Unsupported backend: {config.backend}")
+
+    def _wrap(self, model_name: str, backend: ModelBackend) -> ModelBackend:
+        if (
+            self.recorder is None
+            or self.get_model_config(model_name).backend == "replay"
+        ):
+            return backend
+        from .replay import RecordingBackend
+
+        return RecordingBackend(backend, self.recorder, model_name)
+
+    def start_recording(self, path: str):
+        """Record completions, prompts and generation params of each call to `path`"""
+        from .replay import CompletionRecorder
+
+        self.stop_recording()
+        self.recorder = CompletionRecorder(path)
+        for name, backend in self.backends.items():
+            self.backends[name] = self._wrap(name, backend)
+
+    def stop_recording(self):
+        from .replay import RecordingBackend
+
+        if self.recorder is None:
+            return
+        for name, backend in self.backends.items():
+            if isinstance(backend, RecordingBackend):
+                self.backends[name] = backend.inner
+        self.recorder.close()
+        self.recorder = None
+
+    def register_replay(self, store_path: str, model_name: Optional[str] = None) -> str:
+        """Register a replay model serving completions recorded for `model_name`.
+
+        The replay config copies the recorded model's settings so prompts and
+        generation parameters (and therefore replay keys) match. Returns the name to
+        pass as `model`, ``replay:<model_name>``.
+        """
+        from .replay import recorded_models
+
+        if model_name is None:
+            models = recorded_models(store_path)
+            if len(models) != 1:
+                raise ValueError(
+                    f"{store_path} holds completions for {models}; "
+                    "pass the model to replay"
+                )
+            model_name = models[0]
+        name = f"replay:{model_name}"
+        self.replay_configs[name] = replace(
+            self.get_model_config(model_name),
+            name=name,
+            backend="replay",
+            model_path=store_path,
+        )
+        return name
+
+    @contextmanager
+    def using(self, model_name: str) -> Iterator[ModelBackend]:
+        """Pin a backend for the duration of a call so it cannot be evicted"""
+        backend = self.get_backend(model_name)
+        self._in_use[model_name] += 1
+        try:
+            yield backend
+        finally:
+            self._in_use[model_name] -= 1
+            if self._in_use[model_name] <= 0:
+                del self._in_use[model_name]
+
+    def resident_memory(self) -> MemoryUsage:
+        """Sum of the measured footprints of all loaded backends"""
+        total = MemoryUsage()
+        for name in self.backends:
+            total = total + self.footprints.get(name, MemoryUsage())
+        return total
+
+    def _over_budget(self, usage: MemoryUsage) -> bool:
+        if (
+            self.host_budget_bytes is not None
+            and usage.host_bytes > self.host_budget_bytes
+        ):
+            return True
+        if (
+            self.device_budget_bytes is not None
+            and usage.device_bytes > self.device_budget_bytes
+        ):
+            return True
+        return False
+
+    def _evict_to_fit(
+        self, incoming: Optional[MemoryUsage] = None, keep: Optional[str] = None
+    ):
+        """Close idle backends in LRU order until resident + incoming fits the budget"""
+        incoming = incoming or MemoryUsage()
+        for name in list(self.backends):
+            if not self._over_budget(self.resident_memory() + incoming):
+                break
+            if name == keep or self._in_use.get(name):
+                continue
+            self.close_backend(name)
+
+    def close_backend(self, model_name: str) -> MemoryUsage:
+        """Close one backend and return the host/device memory actually released"""
+        backend = self.backends.pop(model_name, None)
+        if backend is None:
+            return MemoryUsage()
+        before = current_memory_usage()
+        backend.close()
+        del backend
+        release_memory()
+        released = (before - current_memory_usage()).clamp()
+        self.released[model_name] = released
+        return released
+
     def close_all(self):
         """Close all backends"""
-        for backend in self.backends.values():
-            backend.close()
-        self.backends.clear()
+        for model_name in list(self.backends):
+            self.close_backend(model_name)
 
 # Global model manager instance
 model_manager = ModelManager()
@@ -1,27 +1,64 @@
 from __future__ import annotations
-import re
-from typing import Dict, Any
-
-def _cm_to_mm(val: float) -> int:
-    return int(round(val * 10))
-
-def normalize_units_and_cleanup(obj: Dict[str, Any], original_text: str) -> Dict[str, Any]:
-    """Ensure mm units, basic cleanup, best-effort evidence span checks."""
-    # Convert any 'size_mm' that look like centimeters in evidence to mm
-    for ls in obj.get("lesions", []):
-        ev = (ls.get("evidence_span") or "").lower()
-        if " cm" in ev and isinstance(ls.get("size_mm"), (int, float)):
-            # If evidence used cm but size_mm is a magnitude like 2 -> assume cm -> convert
-            # Heuristic: if <= 10 and integer, treat as cm
-            v = ls["size_mm"]
-            if v is not None and v <= 10:
-                ls["size_mm"] = _cm_to_mm(float(v))
-        # Clamp negatives and nulls
-        if ls.get("size_mm") is not None and ls["size_mm"] < 0:
-            ls["size_mm"] = 0
+
+from typing import Any, Dict, Optional, Union
+
+from .schema import Lesion, ReportExtraction
+from .textindex import ReportIndex, build_index
+
+
+def _reconcile_size(ls: Lesion, index: ReportIndex):
+    """Check size_mm against the measurements inside the lesion's evidence span.
+
+    A value that matches a mention in mm is kept. A value that matches the number as
+    written in a cm mention (the model copied "2.1 cm" as 2) is converted using that
+    mention. A missing size is filled only when the span holds exactly one mention.
+    """
+    mentions = index.measurements_in(ls.evidence_start, ls.evidence_end)
+    if not mentions:
+        return
+    if ls.size_mm is None:
+        if len(mentions) == 1:
+            ls.size_mm = int(round(mentions[0].axis_mm(ls.measure_axis)))
+        return
+    if any(abs(ls.size_mm - d) <= 0.5 for m in mentions for d in m.dims_mm):
+        return
+    for m in mentions:
+        if m.unit == "cm" and any(ls.size_mm in (d, round(d)) for d in m.dims):
+            ls.size_mm = int(round(m.axis_mm(ls.measure_axis)))
+            return
+
+
+def normalize_units_and_cleanup(
+    obj: Union[ReportExtraction, Dict[str, Any]],
+    original_text: str,
+    index: Optional[ReportIndex] = None,
+) -> Dict[str, Any]:
+    """Ensure mm units, basic cleanup, evidence span checks against the report.
+
+    Works on the typed ReportExtraction from validation (plain dicts are validated
+    first) and returns the JSON-ready dict of the fields that were set. Evidence spans
+    are aligned to report offsets (`evidence_start`/`evidence_end`); spans that cannot
+    be found are marked `evidence_status="unsupported"`. Pass a prebuilt `index` to
+    avoid re-indexing the report.
+    """
+    if isinstance(obj, dict):
+        obj = ReportExtraction.model_validate(obj)
+    index = index or build_index(original_text)
+    for ls in obj.lesions:
+        if not ls.evidence_span:
+            continue
+        match = index.align(ls.evidence_span)
+        if match is None:
+            ls.evidence_status = "unsupported"
+            continue
+        ls.evidence_start, ls.evidence_end = match.start, match.end
+        ls.evidence_status = "exact" if match.exact else "fuzzy"
+        _reconcile_size(ls, index)
     # Count lesions
-    obj.setdefault("summary", {}).setdefault("total_lesion_count", len(obj.get("lesions", [])))
+    if obj.summary.total_lesion_count is None:
+        obj.summary.total_lesion_count = len(obj.lesions)
     # metastasis_present flag
-    any_met = any(l.get("finding_type") == "met" for l in obj.get("lesions", []))
-    obj["summary"]["metastasis_present"] = any_met
-    return obj
+    obj.summary.metastasis_present = any(
+        lesion.finding_type == "met" for lesion in obj.lesions
+    )
+    return obj.model_dump(exclude_unset=True)
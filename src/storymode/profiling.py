@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import cProfile
+import os
+import pstats
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+import orjson
+
+# Named ranges in the extraction hot path; "repair" nests inside "parse" and
+# "tokenize" inside "generate"
+STAGES = ("prompt", "tokenize", "generate", "parse", "repair", "postprocess")
+TRACE_FILE = "stages.trace.json"
+CPROFILE_FILE = "cprofile.prof"
+
+# Profiler of the unit being sampled right now; None keeps `stage` a no-op
+_active: Optional["Profiler"] = None
+_NULL = nullcontext()
+
+
+def stage(name: str):
+    """Named range around a pipeline stage; a no-op unless a unit is being sampled"""
+    if _active is None:
+        return _NULL
+    return _active._range(name)
+
+
+class Profiler:
+    """Profile a sampled subset of work units (reports, or batches of reports).
+
+    Every `every`-th unit, starting with the first, runs under cProfile and, when torch
+    is importable and `use_torch` is set, `torch.profiler`, until `max_samples` units
+    were profiled. `write()` puts the following in `out_dir`:
+
+      stages.trace.json   Chrome trace of the stage ranges (chrome://tracing, Perfetto)
+      cprofile.prof       pstats dump over all sampled units (snakeviz, gprof2dot)
+      torch-<unit>.json   torch.profiler Chrome trace of one unit, ops under the stages
+    """
+
+    def __init__(
+        self,
+        out_dir: str,
+        every: int = 100,
+        max_samples: int = 20,
+        use_torch: bool = True,
+    ):
+        from .models import torch
+
+        self.out_dir = out_dir
+        self.every = max(every, 1)
+        self.max_samples = max_samples
+        self.torch = torch if use_torch else None
+        self.seen = 0
+        self.samples = 0
+        self.stage_ms = Counter()
+        self.stage_calls = Counter()
+        self._events: List[Dict[str, Any]] = []
+        self._cprofile = cProfile.Profile()
+        self._t0 = time.perf_counter()
+        os.makedirs(out_dir, exist_ok=True)
+
+    @contextmanager
+    def _range(self, name: str, cat: str = "stage") -> Iterator[None]:
+        start = time.perf_counter()
+        with self.torch.profiler.record_function(
+            name
+        ) if self.torch is not None else _NULL:
+            try:
+                yield
+            finally:
+                end = time.perf_counter()
+                self._events.append(
+                    {
+                        "name": name,
+                        "cat": cat,
+                        "ph": "X",
+                        "ts": (start - self._t0) * 1e6,
+                        "dur": (end - start) * 1e6,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                    }
+                )
+                if cat == "stage":
+                    self.stage_ms[name] += (end - start) * 1000.0
+                    self.stage_calls[name] += 1
+
+    @contextmanager
+    def sample(self, label: str) -> Iterator[bool]:
+        """Wrap one unit of work; yields whether it is being profiled"""
+        global _active
+        sampled = (
+            _active is None
+            and self.seen % self.every == 0
+            and self.samples < self.max_samples
+        )
+        self.seen += 1
+        if not sampled:
+            yield False
+            return
+        self.samples += 1
+        tprof = None
+        if self.torch is not None:
+            activities = [self.torch.profiler.ProfilerActivity.CPU]
+            if self.torch.cuda.is_available():
+                activities.append(self.torch.profiler.ProfilerActivity.CUDA)
+            tprof = self.torch.profiler.profile(activities=activities)
+            tprof.__enter__()
+        _active = self
+        self._cprofile.enable()
+        try:
+            with self._range(label, cat="unit"):
+                yield True
+        finally:
+            self._cprofile.disable()
+            _active = None
+            if tprof is not None:
+                tprof.__exit__(None, None, None)
+                fn = "torch-" + re.sub(r"[^\w.-]", "_", label) + ".json"
+                tprof.export_chrome_trace(os.path.join(self.out_dir, fn))
+
+    def hotspots(self, top: int = 10) -> List[Dict[str, Any]]:
+        """Functions with the most own time across sampled units"""
+        if not self.samples:
+            return []
+        stats = pstats.Stats(self._cprofile).stats
+        rows = sorted(stats.items(), key=lambda kv: kv[1][2], reverse=True)[:top]
+        return [
+            {
+                "function": f"{os.path.basename(fn)}:{line}({func})",
+                "calls": nc,
+                "self_ms": tt * 1000.0,
+                "cumulative_ms": ct * 1000.0,
+            }
+            for (fn, line, func), (_, nc, tt, ct, _) in rows
+        ]
+
+    def summary(self, top: int = 10) -> Dict[str, Any]:
+        return {
+            "units": self.seen,
+            "samples": self.samples,
+            "stages": {
+                name: {
+                    "ms": self.stage_ms[name],
+                    "calls": self.stage_calls[name],
+                    "ms_per_sample": self.stage_ms[name] / self.samples,
+                }
+                for name in STAGES
+                if self.stage_calls[name]
+            },
+            "hotspots": self.hotspots(top),
+        }
+
+    def write(self) -> Dict[str, Any]:
+        """Write the traces and pstats dump; returns `summary()`"""
+        with open(os.path.join(self.out_dir, TRACE_FILE), "wb") as f:
+            f.write(
+                orjson.dumps({"traceEvents": self._events, "displayTimeUnit": "ms"})
+            )
+        if self.samples:
+            self._cprofile.dump_stats(os.path.join(self.out_dir, CPROFILE_FILE))
+        return self.summary()
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    lines = [
+        f"Profiled {summary['samples']}/{summary['units']} units; "
+        "stage time per profiled unit (inclusive):"
+    ]
+    lines += [
+        f"  {name:<12} {s['ms_per_sample']:9.2f} ms  ({s['calls']} calls)"
+        for name, s in summary["stages"].items()
+    ]
+    if summary["hotspots"]:
+        lines.append("Top hot spots by own time:")
+        lines += [
+            f"  {h['self_ms']:9.2f} ms  {h['calls']:>7}  {h['function']}"
+            for h in summary["hotspots"]
+        ]
+    return "\n".join(lines)
@@ -1,78 +1,81 @@
 from __future__ import annotations
-from typing import Dict, List, Any
+
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 
 class PromptFormatter:
     """Handles model-specific prompt formatting"""
-    
+
     @staticmethod
     def format_mistral(messages: List[Dict[str, str]]) -> str:
         """Format messages for Mistral models"""
-        prompt = "<s>"
+        parts = ["<s>"]
         for msg in messages:
             role = msg["role"]
             content = msg["content"]
-            
+
             if role == "system":
-                prompt += f"[INST] {content} [/INST]"
+                parts.append(f"[INST] {content} [/INST]")
             elif role == "user":
-                prompt += f"[INST] {content} [/INST]"
+                parts.append(f"[INST] {content} [/INST]")
             elif role == "assistant":
-                prompt += f" {content}"
-        
-        return prompt
-    
+                parts.append(f" {content}")
+
+        return "".join(parts)
+
     @staticmethod
     def format_qwen(messages: List[Dict[str, str]]) -> str:
         """Format messages for Qwen models"""
-        prompt = ""
+        parts = []
         for msg in messages:
             role = msg["role"]
             content = msg["content"]
-            
+
             if role == "system":
-                prompt += f"<|im_start|>system\n{content}<|im_end|>\n"
+                parts.append(f"<|im_start|>system\n{content}<|im_end|>\n")
             elif role == "user":
-                prompt += f"<|im_start|>user\n{content}<|im_end|>\n"
+                parts.append(f"<|im_start|>user\n{content}<|im_end|>\n")
             elif role == "assistant":
-                prompt += f"<|im_start|>assistant\n{content}<|im_end|>\n"
-        
-        prompt += "<|im_start|>assistant\n"
-        return prompt
-    
+                parts.append(f"<|im_start|>assistant\n{content}<|im_end|>\n")
+
+        parts.append("<|im_start|>assistant\n")
+        return "".join(parts)
+
     @staticmethod
     def format_llama(messages: List[Dict[str, str]]) -> str:
         """Format messages for Llama models"""
-        prompt = ""
+        parts = []
         for msg in messages:
             role = msg["role"]
             content = msg["content"]
-            
+
             if role == "system":
-                prompt += f"<s>[INST] <<SYS>>\n{content}\n<</SYS>>\n\n"
+                parts.append(f"<s>[INST] <<SYS>>\n{content}\n<</SYS>>\n\n")
             elif role == "user":
-                prompt += f"{content} [/INST]"
+                parts.append(f"{content} [/INST]")
             elif role == "assistant":
-                prompt += f" {content} </s><s>[INST] "
-        
-        return prompt
-    
+                parts.append(f" {content} </s><s>[INST] ")
+
+        return "".join(parts)
+
     @staticmethod
     def format_generic(messages: List[Dict[str, str]]) -> str:
         """Generic format for OpenAI-compatible models"""
-        prompt = ""
+        parts = []
         for msg in messages:
             role = msg["role"]
             content = msg["content"]
-            
+
             if role == "system":
-                prompt += f"<|im_start|>system\n{content}<|im_end|>\n"
+                parts.append(f"<|im_start|>system\n{content}<|im_end|>\n")
             elif role == "user":
-                prompt += f"<|im_start|>user\n{content}<|im_end|>\n"
+                parts.append(f"<|im_start|>user\n{content}<|im_end|>\n")
             elif role == "assistant":
-                prompt += f"<|im_start|>assistant\n{content}<|im_end|>\n"
-        
-        prompt += "<|im_start|>assistant\n"
-        return prompt
+                parts.append(f"<|im_start|>assistant\n{content}<|im_end|>\n")
+
+        parts.append("<|im_start|>assistant\n")
+        return "".join(parts)
 
 # Model-specific formatters
 MODEL_FORMATTERS = {
@@ -86,7 +89,112 @@ MODEL_FORMATTERS = {
     "gpt-4o": PromptFormatter.format_generic,
 }
 
-def get_formatter(model_name: str):
-    """Get the appropriate formatter for a model"""
-    return MODEL_FORMATTERS.get(model_name, PromptFormatter.format_generic)
 
+def get_formatter(model_name: Optional[str]) -> Callable[[List[Dict[str, str]]], str]:
+    """Get the appropriate formatter for a model.
+
+    Models without their own formatter follow their config's template family.
+    """
+    if model_name in MODEL_FORMATTERS:
+        return MODEL_FORMATTERS[model_name]
+    from .models import ModelManager
+
+    config = ModelManager.MODEL_CONFIGS.get(model_name)
+    if config is not None and "[INST]" in config.system_prompt_template:
+        return PromptFormatter.format_mistral
+    return PromptFormatter.format_generic
+
+
+# Message key marking how many leading characters of its content are static across
+# reports (instructions, schema); set by `decode.format_messages_for_model`
+STATIC_PREFIX_KEY = "static_prefix"
+_SENTINEL = (
+    "\ue000"  # private-use character marking the split; a report may contain it too
+)
+_ANCHOR = "\n"
+
+
+class PromptAssembler:
+    """Formats messages with the model's formatter and tokenizes them at token-ID level.
+
+    Everything before the static mark (system prompt, few-shot turns, schema and
+    instructions) is tokenized once and cached; per call only the report text and the
+    closing template are tokenized. The result equals tokenizing the formatted string
+    (`add_special_tokens=False`, the formatters write their own special tokens): the
+    cached head must end on a newline and the tail must not start with whitespace, and
+    each head is checked against a full tokenization the first time it is seen.
+    """
+
+    def __init__(
+        self,
+        tokenizer,
+        model_name: Optional[str] = None,
+        formatter: Optional[Callable[[List[Dict[str, str]]], str]] = None,
+        cache_size: int = 8,
+    ):
+        self.tokenizer = tokenizer
+        self.formatter = formatter or get_formatter(model_name)
+        self.cache_size = cache_size
+        # head text -> token ids, or None when splitting there does not reproduce the
+        # full tokenization
+        self._heads: OrderedDict[str, Optional[List[int]]] = OrderedDict()
+        self._anchor_ids = self._encode(_ANCHOR)
+        self.stats = Counter()
+
+    def _encode(self, text: str) -> List[int]:
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def format(self, messages: List[Dict[str, Any]]) -> str:
+        return self.formatter(messages)
+
+    def split(self, messages: List[Dict[str, Any]]) -> Tuple[str, str]:
+        """Formatted prompt as (static head, per-report tail)"""
+        marked = list(messages)
+        for i in range(len(marked) - 1, -1, -1):
+            k = marked[i].get(STATIC_PREFIX_KEY)
+            if k is not None:
+                content = marked[i]["content"]
+                marked[i] = {
+                    "role": marked[i]["role"],
+                    "content": content[:k] + _SENTINEL + content[k:],
+                }
+                # The first sentinel is ours: anything before the mark is static text
+                head, tail = self.formatter(marked).split(_SENTINEL, 1)
+                return head, tail
+        return "", self.formatter(messages)
+
+    def _encode_tail(self, tail: str) -> Optional[List[int]]:
+        ids = self._encode(_ANCHOR + tail)
+        n = len(self._anchor_ids)
+        return ids[n:] if ids[:n] == self._anchor_ids else None
+
+    def encode(
+        self, messages: List[Dict[str, Any]], assistant_prefix: str = ""
+    ) -> List[int]:
+        """Token ids of the formatted prompt, continued by `assistant_prefix`"""
+        head, tail = self.split(messages)
+        tail += assistant_prefix
+        if not head.endswith("\n") or not tail[:1].strip():
+            self.stats["full"] += 1
+            return self._encode(head + tail)
+        tail_ids = self._encode_tail(tail)
+        if head in self._heads:
+            self._heads.move_to_end(head)
+            head_ids = self._heads[head]
+        else:
+            head_ids = self._encode(head)
+            full = self._encode(head + tail)
+            if tail_ids is None or head_ids + tail_ids != full:
+                head_ids = None
+            self._heads[head] = head_ids
+            if len(self._heads) > self.cache_size:
+                self._heads.popitem(last=False)
+            if head_ids is None:
+                self.stats["full"] += 1
+                return full
+        if head_ids is None or tail_ids is None:
+            self.stats["full"] += 1
+            return self._encode(head + tail)
+        self.stats["cached"] += 1
+        self.stats["cached_tokens"] += len(head_ids)
+        return head_ids + tail_ids
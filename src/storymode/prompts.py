@@ -7,6 +7,16 @@ If a field is not stated, omit it rather than guessing.
 For lymph nodes, record the SHORT AXIS in mm when available. Include an evidence_span for each numeric or categorical value when possible.
 """
 
+# Same rules for the compact row protocol (prompt_version "t1", see storymode.tabular)
+TABULAR_SYSTEM_PROMPT = """You are a meticulous clinical information extraction system.
+Extract ONLY facts that are explicitly stated in the report. Do not infer.
+Return ONLY the delimited rows described in the instructions, no prose or code fences.
+Use millimeters for size.
+If a field is not stated, leave its cell empty rather than guessing.
+For lymph nodes, record the SHORT AXIS in mm when available.
+Include an evidence_span for each lesion when possible.
+"""
+
 # Minimal few-shot exemplars (edit/expand with your synthetic styles)
 FEW_SHOT = [
     {
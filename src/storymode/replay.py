@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import hashlib
+import os
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import orjson
+
+from .models import ModelBackend, _per_item
+
+# Generation parameters that change what a model returns; part of the replay key
+KEY_PARAMS = ("temperature", "top_p", "max_tokens", "stop", "assistant_prefix")
+
+
+def _digest(data: Any) -> str:
+    return hashlib.blake2b(orjson.dumps(data), digest_size=16).hexdigest()
+
+
+def completion_key(
+    messages: List[Dict[str, str]], params: Dict[str, Any], n: int = 1
+) -> str:
+    """Stable key for one generation request"""
+    return _digest(
+        [[m["role"], m["content"]] for m in messages]
+        + [{k: params.get(k) for k in KEY_PARAMS}, n]
+    )
+
+
+class CompletionRecorder:
+    """Append-only JSONL store of raw completions.
+
+    Each request line holds the model, key, generation parameters, completions and
+    (when requested) token log-probabilities. Message contents are stored once as
+    ``blob`` lines and referenced by hash, so the shared system prompt, schema and
+    few-shot turns are not repeated for every report.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._blobs: Set[str] = set()
+        if os.path.exists(path):
+            for rec in iter_records(path):
+                if "blob" in rec:
+                    self._blobs.add(rec["blob"])
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._fh = open(path, "ab")
+
+    def record(
+        self,
+        model_name: str,
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        completions: List[str],
+        logprobs: Optional[list] = None,
+        finish_reason: Optional[str] = None,
+        completion_tokens: Optional[int] = None,
+    ):
+        lines = []
+        refs = []
+        for m in messages:
+            h = _digest(m["content"])
+            if h not in self._blobs:
+                self._blobs.add(h)
+                lines.append({"blob": h, "text": m["content"]})
+            refs.append([m["role"], h])
+        rec = {
+            "model": model_name,
+            "key": completion_key(messages, params, len(completions)),
+            "messages": refs,
+            "params": {k: params[k] for k in KEY_PARAMS if k in params},
+            "completions": completions,
+        }
+        if finish_reason is not None:
+            rec["finish_reason"] = finish_reason
+        if completion_tokens is not None:
+            rec["completion_tokens"] = completion_tokens
+        if logprobs is not None:
+            rec["logprobs"] = logprobs
+        lines.append(rec)
+        self._fh.write(b"".join(orjson.dumps(line) + b"\n" for line in lines))
+        self._fh.flush()
+
+    def close(self):
+        self._fh.close()
+
+
+def iter_records(path: str):
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield orjson.loads(line)
+
+
+def recorded_models(path: str) -> List[str]:
+    return sorted({rec["model"] for rec in iter_records(path) if "model" in rec})
+
+
+class RecordingBackend(ModelBackend):
+    """Wraps a live backend and writes every request and completion to a recorder"""
+
+    def __init__(
+        self, inner: ModelBackend, recorder: CompletionRecorder, model_name: str
+    ):
+        self.inner = inner
+        self.recorder = recorder
+        self.model_name = model_name
+
+    def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self._record(messages, 1, kwargs)[0]
+
+    def generate_n(self, messages: List[Dict[str, str]], n: int, **kwargs) -> List[str]:
+        return self._record(messages, n, kwargs)
+
+    def generate_batch(self, batch: List[List[Dict[str, str]]], **kwargs) -> List[str]:
+        # Each item is stored as its own request, so replay serves it batched or not
+        completions = self.inner.generate_batch(batch, **kwargs)
+        self.last_batch_finish_reasons = self.inner.last_batch_finish_reasons
+        self.last_batch_completion_tokens = self.inner.last_batch_completion_tokens
+        caps = _per_item(kwargs.get("max_tokens"), len(batch))
+        reasons = self.last_batch_finish_reasons or [None] * len(batch)
+        tokens = self.last_batch_completion_tokens or [None] * len(batch)
+        for messages, text, cap, reason, n in zip(
+            batch, completions, caps, reasons, tokens
+        ):
+            params = dict(kwargs) if cap is None else dict(kwargs, max_tokens=cap)
+            self.recorder.record(
+                self.model_name, messages, params, [text], None, reason, n
+            )
+        return completions
+
+    def generate_stream(
+        self, messages: List[Dict[str, str]], **kwargs
+    ) -> Iterator[str]:
+        # Stored like a generate call once the stream ends; replay serves it either way
+        parts = []
+        for chunk in self.inner.generate_stream(messages, **kwargs):
+            parts.append(chunk)
+            yield chunk
+        text = "".join(parts)
+        self.last_finish_reason = self.inner.last_finish_reason
+        self.last_completion_tokens = self.inner.last_completion_tokens
+        self.recorder.record(
+            self.model_name,
+            messages,
+            kwargs,
+            [text if kwargs.get("assistant_prefix") else text.strip()],
+            None,
+            self.last_finish_reason,
+            self.last_completion_tokens,
+        )
+
+    def prompt_tokens(self, messages: List[Dict[str, str]]) -> int:
+        return self.inner.prompt_tokens(messages)
+
+    def _record(
+        self, messages: List[Dict[str, str]], n: int, kwargs: Dict[str, Any]
+    ) -> List[str]:
+        self.inner.last_logprobs = None
+        completions = (
+            [self.inner.generate(messages, **kwargs)]
+            if n == 1
+            else self.inner.generate_n(messages, n, **kwargs)
+        )
+        self.last_logprobs = self.inner.last_logprobs
+        self.last_finish_reason = self.inner.last_finish_reason
+        self.last_completion_tokens = self.inner.last_completion_tokens
+        self.recorder.record(
+            self.model_name,
+            messages,
+            kwargs,
+            completions,
+            self.last_logprobs,
+            self.last_finish_reason,
+            self.last_completion_tokens,
+        )
+        return completions
+
+    def close(self):
+        self.inner.close()
+
+
+class ReplayMiss(KeyError):
+    """The store has no completion for this exact request"""
+
+
+class ReplayBackend(ModelBackend):
+    """Serves recorded completions instead of running a model.
+
+    Requests are matched on messages and generation parameters, so any change that
+    only touches validation, postprocessing or evaluation replays exactly; a prompt
+    change raises ReplayMiss.
+    """
+
+    def __init__(self, store_path: str, model_name: Optional[str] = None):
+        self.store_path = store_path
+        self.model_name = model_name
+        self.records: Dict[str, Dict[str, Any]] = {}
+        for rec in iter_records(store_path):
+            if "key" in rec and (model_name is None or rec["model"] == model_name):
+                self.records[rec["key"]] = rec
+
+    def _lookup(
+        self, messages: List[Dict[str, str]], n: int, kwargs: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        rec = self.records.get(completion_key(messages, kwargs, n))
+        if rec is None:
+            raise ReplayMiss(
+                f"No recorded completion in {self.store_path} "
+                f"for this prompt and parameters (n={n})"
+            )
+        self.last_logprobs = (
+            [tuple(t) for t in rec["logprobs"]] if rec.get("logprobs") else None
+        )
+        self.last_finish_reason = rec.get("finish_reason")
+        self.last_completion_tokens = rec.get("completion_tokens")
+        return rec
+
+    def generate(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self._lookup(messages, 1, kwargs)["completions"][0]
+
+    def generate_n(self, messages: List[Dict[str, str]], n: int, **kwargs) -> List[str]:
+        return list(self._lookup(messages, n, kwargs)["completions"])
+
+    def close(self):
+        self.records.clear()
@@ -1,6 +1,9 @@
 from __future__ import annotations
+
+from typing import Dict, List, Literal, Optional
+
 from pydantic import BaseModel, Field, field_validator
-from typing import List, Optional, Literal
+from pydantic.json_schema import SkipJsonSchema
 
 MM = int  # store sizes as integer millimeters
 
@@ -20,6 +23,15 @@ class Lesion(BaseModel):
     note: Optional[str] = None
     evidence_span: Optional[str] = Field(None, description="Verbatim supporting text from the report")
 
+    # Set by postprocessing from the report text index; hidden from the model schema
+    evidence_start: SkipJsonSchema[Optional[int]] = None
+    evidence_end: SkipJsonSchema[Optional[int]] = None
+    evidence_status: SkipJsonSchema[
+        Optional[Literal["exact", "fuzzy", "unsupported"]]
+    ] = None
+    # Set by self-consistency merging: field -> fraction of samples agreeing
+    agreement: SkipJsonSchema[Optional[Dict[str, float]]] = None
+
     @field_validator("size_mm")
     @classmethod
     def non_negative(cls, v):
@@ -34,6 +46,7 @@ class Summary(BaseModel):
     tn_stage_reported: Optional[str] = None  # if explicit in text
     metastasis_present: Optional[bool] = None
     total_lesion_count: Optional[int] = None
+    agreement: SkipJsonSchema[Optional[Dict[str, float]]] = None
 
 
 class ReportExtraction(BaseModel):
@@ -46,4 +59,3 @@ class ReportExtraction(BaseModel):
     model_name: Optional[str] = None
     prompt_version: Optional[str] = None
     schema_version: Literal["1.0"] = "1.0"
-
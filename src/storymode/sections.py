@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Optional, Tuple
+
+from .textindex import ReportIndex, build_index
+
+# Canonical section name -> header spellings seen in radiology reports
+SECTION_ALIASES = {
+    "EXAM": ["EXAM", "EXAMINATION", "STUDY", "PROCEDURE"],
+    "CLINICAL_HISTORY": [
+        "CLINICAL HISTORY",
+        "HISTORY",
+        "CLINICAL INDICATION",
+        "INDICATION",
+        "INDICATIONS",
+        "REASON FOR EXAM",
+        "REASON FOR STUDY",
+        "CLINICAL INFORMATION",
+    ],
+    "TECHNIQUE": ["TECHNIQUE", "PROTOCOL"],
+    "COMPARISON": ["COMPARISON", "COMPARISONS", "PRIOR STUDIES"],
+    "DOSE": ["RADIATION DOSE", "DOSE", "DOSE REPORT", "CTDIVOL", "DLP"],
+    "FINDINGS": ["FINDINGS"],
+    "IMPRESSION": [
+        "IMPRESSION",
+        "IMPRESSIONS",
+        "CONCLUSION",
+        "CONCLUSIONS",
+        "ASSESSMENT",
+    ],
+}
+PREAMBLE = "PREAMBLE"  # text before the first recognized header
+
+_CANONICAL = {
+    alias: name for name, aliases in SECTION_ALIASES.items() for alias in aliases
+}
+# Candidate headers; `_is_header` keeps the uppercase ones and those alone on their line
+_HEADER_RE = re.compile(
+    r"^[ \t]*(?P<header>"
+    + "|".join(re.escape(a) for a in sorted(_CANONICAL, key=len, reverse=True))
+    + r")[ \t]*:",
+    re.IGNORECASE | re.MULTILINE,
+)
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@dataclass
+class Section:
+    name: str  # canonical name, or PREAMBLE
+    start: int  # offsets into the report, header included
+    end: int
+
+    def text(self, report_text: str) -> str:
+        return report_text[self.start : self.end]
+
+
+@dataclass(frozen=True)
+class SectionPolicy:
+    """Which sections are sent to the model"""
+
+    include: FrozenSet[str] = frozenset({"FINDINGS", "IMPRESSION"})
+    keep_preamble: bool = True
+
+    def keeps(self, name: str) -> bool:
+        return name in self.include or (name == PREAMBLE and self.keep_preamble)
+
+    @classmethod
+    def from_names(cls, names: str) -> "SectionPolicy":
+        """Policy from comma-separated section names; ValueError on an unknown name"""
+        include = frozenset(
+            n.strip().upper().replace(" ", "_") for n in names.split(",") if n.strip()
+        )
+        unknown = sorted(include - set(SECTION_ALIASES))
+        if unknown:
+            raise ValueError(
+                f"Unknown sections {unknown}. Available: {list(SECTION_ALIASES)}"
+            )
+        return cls(include=include)
+
+
+DEFAULT_SECTION_POLICY = SectionPolicy()
+
+
+@dataclass
+class PrunedReport:
+    text: str
+    sections: List[Section]
+    kept: List[str] = field(default_factory=list)
+    original_tokens: int = 0
+    kept_tokens: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.original_tokens - self.kept_tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Tokenizer-free token estimate (words and punctuation), for relative savings"""
+    return len(_TOKEN_RE.findall(text))
+
+
+def _is_header(report_text: str, m: "re.Match") -> bool:
+    """Uppercase or alone on its line; "History: ..." inside findings is prose"""
+    if m.group("header").isupper():
+        return True
+    line_end = report_text.find("\n", m.end())
+    return not report_text[
+        m.end() : len(report_text) if line_end < 0 else line_end
+    ].strip()
+
+
+def parse_sections(report_text: str) -> List[Section]:
+    sections = []
+    matches = [
+        m for m in _HEADER_RE.finditer(report_text) if _is_header(report_text, m)
+    ]
+    if not matches or report_text[: matches[0].start()].strip():
+        first = matches[0].start() if matches else len(report_text)
+        sections.append(Section(PREAMBLE, 0, first))
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(report_text)
+        sections.append(Section(_CANONICAL[m.group("header").upper()], m.start(), end))
+    return sections
+
+
+def prune_report(
+    report_text: str,
+    policy: Optional[SectionPolicy] = DEFAULT_SECTION_POLICY,
+    index: Optional[ReportIndex] = None,
+) -> PrunedReport:
+    """Keep only the sections the policy allows, verbatim, so evidence spans match.
+
+    Sections with a measurement mention are never dropped. Falls back to the full
+    report when no header is recognized or none of the policy's headed sections is
+    present (the preamble alone rarely holds the findings). `index` is the report's
+    text index, built here when needed and not given.
+    """
+    sections = parse_sections(report_text)
+    original_tokens = estimate_tokens(report_text)
+    wanted = [s for s in sections if policy is not None and policy.keeps(s.name)]
+    if policy is None or all(s.name == PREAMBLE for s in wanted):
+        return PrunedReport(
+            report_text,
+            sections,
+            [s.name for s in sections],
+            original_tokens,
+            original_tokens,
+        )
+    index = index or build_index(report_text)
+    kept = [
+        s
+        for s in sections
+        if policy.keeps(s.name) or index.measurements_in(s.start, s.end)
+    ]
+    text = "\n".join(s.text(report_text).strip("\n") for s in kept)
+    return PrunedReport(
+        text, sections, [s.name for s in kept], original_tokens, estimate_tokens(text)
+    )
+
+
+_MODALITY_PATTERNS = [
+    ("PETCT", r"\bPET\s*[/-]?\s*CT\b"),
+    ("MRI", r"\bMRI?\b|\bMAGNETIC RESONANCE\b"),
+    ("CT", r"\bCT\b|\bCOMPUTED TOMOGRAPHY\b"),
+    ("XR", r"\bX-?RAY\b|\bXR\b|\bRADIOGRAPH"),
+    ("US", r"\bUS\b|\bULTRASOUND\b|\bSONOGRA"),
+]
+_MODALITY_RES = [(m, re.compile(p, re.IGNORECASE)) for m, p in _MODALITY_PATTERNS]
+_WHOLE_BODY_RE = re.compile(
+    r"\bWHOLE[\s-]*BODY\b|\bSKULL\s+BASE\s+TO\s+(MID-?)?THIGH", re.IGNORECASE
+)
+_REGION_RES = [
+    ("C", re.compile(r"\bCHEST\b|\bTHORA", re.IGNORECASE)),
+    ("A", re.compile(r"\bABD(OMEN|OMINAL)?\b", re.IGNORECASE)),
+    ("P", re.compile(r"\bPELVI(S|C)\b", re.IGNORECASE)),
+]
+
+
+def parse_exam(
+    report_text: str, sections: Optional[List[Section]] = None
+) -> Tuple[str, str]:
+    """Modality and body region from the EXAM line as `Summary` literals, or UNKNOWN"""
+    sections = sections if sections is not None else parse_sections(report_text)
+    exam = next((s for s in sections if s.name == "EXAM"), None)
+    if exam is None:
+        return "UNKNOWN", "UNKNOWN"
+    line = exam.text(report_text).split(":", 1)[1].strip().split("\n", 1)[0]
+    modality = next((m for m, rx in _MODALITY_RES if rx.search(line)), "UNKNOWN")
+    if _WHOLE_BODY_RE.search(line):
+        return modality, "WB"
+    regions = "".join(r for r, rx in _REGION_RES if rx.search(line))
+    return modality, regions if regions in ("C", "A", "P", "CAP") else "UNKNOWN"
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+from .cascade import UncertaintyPolicy
+from .eval import lesion_match_key
+from .schema import Lesion, ReportExtraction, Summary
+
+# Postprocessing-owned fields are not voted on; offsets follow the winning evidence span
+_DERIVED = {
+    "lesion_id",
+    "size_mm",
+    "evidence_start",
+    "evidence_end",
+    "evidence_status",
+    "agreement",
+}
+VOTED_LESION_FIELDS = [f for f in Lesion.model_fields if f not in _DERIVED]
+VOTED_SUMMARY_FIELDS = [
+    f
+    for f in Summary.model_fields
+    if f not in ("metastasis_present", "total_lesion_count", "agreement")
+]
+VOTED_REPORT_FIELDS = ["patient_id", "study_date", "report_id"]
+
+
+@dataclass
+class SelfConsistencyConfig:
+    """Sample `n` outputs at `temperature` and merge them by field-wise vote.
+
+    With `only_uncertain` set, a greedy extraction runs first and sampling happens
+    only when one of its uncertainty signals fires; None samples every report.
+    """
+
+    n: int = 5
+    temperature: float = 0.7
+    only_uncertain: Optional[UncertaintyPolicy] = field(
+        default_factory=UncertaintyPolicy
+    )
+    size_tolerance_mm: int = 2
+
+
+def _vote(values: List[Any]) -> tuple:
+    """Majority value (first seen wins ties) and the fraction of votes it got"""
+    value, count = Counter(values).most_common(1)[0]
+    return value, count / len(values)
+
+
+def _vote_fields(
+    objs: List[Dict[str, Any]],
+    fields: List[str],
+    out: Dict[str, Any],
+    agreement: Dict[str, float],
+):
+    for name in fields:
+        value, score = _vote([o.get(name) for o in objs])
+        agreement[name] = score
+        if value is not None:
+            out[name] = value
+
+
+def align_lesions(
+    samples: List[List[Dict[str, Any]]]
+) -> List[Dict[int, Dict[str, Any]]]:
+    """Group lesions across samples: same (finding_type, body_site, node_station),
+    at most one lesion per sample per group, ties broken by closest size."""
+    clusters: List[Dict[int, Dict[str, Any]]] = []
+    keys: List[tuple] = []
+    for si, lesions in enumerate(samples):
+        for lesion in lesions:
+            key = lesion_match_key(lesion)
+            best, best_gap = None, None
+            for ci, members in enumerate(clusters):
+                if keys[ci] != key or si in members:
+                    continue
+                sizes = [
+                    m["size_mm"]
+                    for m in members.values()
+                    if m.get("size_mm") is not None
+                ]
+                gap = (
+                    abs(lesion["size_mm"] - median(sizes))
+                    if sizes and lesion.get("size_mm") is not None
+                    else float("inf")
+                )
+                if best is None or gap < best_gap:
+                    best, best_gap = ci, gap
+            if best is None:
+                clusters.append({si: lesion})
+                keys.append(key)
+            else:
+                clusters[best][si] = lesion
+    return clusters
+
+
+def merge_samples(
+    samples: List[Dict[str, Any]], size_tolerance_mm: int = 2
+) -> Dict[str, Any]:
+    """Merge postprocessed extractions into one, with per-field agreement scores.
+
+    A lesion is kept when a majority of samples contain it; categorical fields take
+    the majority value and `size_mm` the median of the non-null sizes. Each lesion and
+    the summary get an `agreement` map of field -> fraction of samples that agree
+    (`presence` for how many samples had the lesion at all).
+    """
+    n = len(samples)
+    merged: Dict[str, Any] = {}
+    _vote_fields(samples, VOTED_REPORT_FIELDS, merged, {})
+
+    summary: Dict[str, Any] = {}
+    summary_agreement: Dict[str, float] = {}
+    _vote_fields(
+        [s.get("summary") or {} for s in samples],
+        VOTED_SUMMARY_FIELDS,
+        summary,
+        summary_agreement,
+    )
+
+    lesions = []
+    for members in align_lesions([s.get("lesions") or [] for s in samples]):
+        if len(members) * 2 <= n:
+            continue
+        group = list(members.values())
+        lesion: Dict[str, Any] = {"lesion_id": f"L{len(lesions) + 1}"}
+        agreement = {"presence": len(group) / n}
+        _vote_fields(group, VOTED_LESION_FIELDS, lesion, agreement)
+        sizes = [m["size_mm"] for m in group if m.get("size_mm") is not None]
+        if len(sizes) * 2 > len(group):
+            lesion["size_mm"] = int(round(median(sizes)))
+            agreement["size_mm"] = sum(
+                abs(v - lesion["size_mm"]) <= size_tolerance_mm for v in sizes
+            ) / len(group)
+        else:
+            agreement["size_mm"] = (len(group) - len(sizes)) / len(group)
+        source = next(
+            (m for m in group if m.get("evidence_span") == lesion.get("evidence_span")),
+            None,
+        )
+        for name in ("evidence_start", "evidence_end", "evidence_status"):
+            if source is not None and source.get(name) is not None:
+                lesion[name] = source[name]
+        lesion["agreement"] = agreement
+        lesions.append(lesion)
+
+    summary["total_lesion_count"] = len(lesions)
+    summary["metastasis_present"] = any(
+        lesion.get("finding_type") == "met" for lesion in lesions
+    )
+    summary["agreement"] = summary_agreement
+    merged["summary"] = summary
+    merged["lesions"] = lesions
+    # Votes only pick values the samples produced, but check the merged shape anyway
+    ReportExtraction.model_validate(merged)
+    return merged
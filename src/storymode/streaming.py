@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+
+from .tabular import TableFormatError, is_tabular, parse_row
+
+
+@dataclass
+class StreamEvent:
+    """One item from `extract_stream`: the summary, a lesion, or the final result"""
+
+    kind: str  # "summary", "lesion" or "result"
+    item: Any  # Summary, Lesion or the postprocessed ReportExtraction
+    elapsed_ms: float  # since the request was sent
+
+
+class StreamParser:
+    """Incremental parser over a streamed completion.
+
+    `feed` takes the next chunk of text and returns ``("summary" | "lesion", dict)`` for
+    every part completed by it: the ``summary`` object and each object of the
+    ``lesions`` array as soon as its closing brace arrives (JSON), or each finished
+    row (the "t1" row protocol). Parts that do not parse are skipped; the complete
+    text is still validated, with repair, once the stream ends.
+    """
+
+    def __init__(self, prompt_version: str = "v1"):
+        self.tabular = is_tabular(prompt_version)
+        self.text = ""
+        self.skipped = 0
+        self._pos = 0
+        # JSON scanner state: open containers, string/escape flags, top-level key
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._key: Optional[str] = None
+        self._part_start = 0
+        # Row protocol state
+        self._lines = 0
+        self._lesions = 0
+
+    def feed(self, chunk: str) -> List[Tuple[str, Dict[str, Any]]]:
+        self.text += chunk
+        return self._rows() if self.tabular else self._objects()
+
+    def _load(self, kind: str, text: str) -> List[Tuple[str, Dict[str, Any]]]:
+        try:
+            return [(kind, orjson.loads(text))]
+        except orjson.JSONDecodeError:
+            self.skipped += 1
+            return []
+
+    def _objects(self) -> List[Tuple[str, Dict[str, Any]]]:
+        parts = []
+        text, stack = self.text, self._stack
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(stack) == 1 and self._expect_key:
+                        self._key = text[self._string_start : i]
+                        self._expect_key = False
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch in "{[":
+                if ch == "{" and self._key == "summary" and stack == ["{"]:
+                    self._part_start = i
+                elif ch == "{" and self._key == "lesions" and stack == ["{", "["]:
+                    self._part_start = i
+                stack.append(ch)
+                self._expect_key = ch == "{" and len(stack) == 1
+            elif ch in "}]" and stack:
+                stack.pop()
+                if ch == "}" and self._key == "summary" and stack == ["{"]:
+                    parts += self._load("summary", text[self._part_start : i + 1])
+                elif ch == "}" and self._key == "lesions" and stack == ["{", "["]:
+                    parts += self._load("lesion", text[self._part_start : i + 1])
+            elif ch == "," and len(stack) == 1:
+                self._expect_key = True
+        self._pos = len(text)
+        return parts
+
+    def _rows(self) -> List[Tuple[str, Dict[str, Any]]]:
+        parts = []
+        end = self.text.rfind("\n") + 1
+        for row in self.text[self._pos : end].splitlines():
+            parts += self._row(row)
+        self._pos = max(self._pos, end)
+        return parts
+
+    def _row(self, row: str) -> List[Tuple[str, Dict[str, Any]]]:
+        row = row.strip()
+        if not row:
+            return []
+        self._lines += 1
+        try:
+            kind, fields = parse_row(row, self._lines)
+        except TableFormatError:
+            self.skipped += 1
+            return []
+        if kind == "S":
+            return [("summary", fields)]
+        self._lesions += 1
+        return [("lesion", {"lesion_id": f"L{self._lesions}", **fields})]
+
+    def close(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Parts completed by the end of the stream (a last row without a newline)"""
+        if not self.tabular or self._pos >= len(self.text):
+            return []
+        row, self._pos = self.text[self._pos :], len(self.text)
+        return self._row(row)
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Tuple
+
+# Compact output protocol: one "S|..." summary row, then one "L|..." row per lesion.
+# Columns are positional, empty cells mean "not stated", booleans are y/n and lesion
+# ids are assigned in row order, so no key is ever generated.
+TABULAR_PROMPT_VERSION = "t1"
+PROMPT_VERSIONS = ("v1", TABULAR_PROMPT_VERSION)
+DELIMITER = "|"
+
+SUMMARY_COLUMNS = (
+    "modality",
+    "body_region",
+    "tn_stage_reported",
+    "metastasis_present",
+    "total_lesion_count",
+)
+# evidence_span is last so a stray delimiter inside the quote cannot shift other columns
+LESION_COLUMNS = (
+    "finding_type",
+    "body_site",
+    "metastatic_site",
+    "is_node",
+    "node_station",
+    "laterality",
+    "measure_axis",
+    "size_mm",
+    "certainty",
+    "date_relative",
+    "note",
+    "evidence_span",
+)
+
+
+class TableFormatError(ValueError):
+    """Completion does not follow the row protocol; `line` is 1-based"""
+
+    def __init__(self, line: int, msg: str):
+        self.line = line
+        super().__init__(f"line {line}: {msg}")
+
+
+def is_tabular(prompt_version: str) -> bool:
+    return prompt_version == TABULAR_PROMPT_VERSION
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "y" if value else "n"
+    return " ".join(str(value).replace(DELIMITER, "/").split())
+
+
+def render_table(data: Dict[str, Any]) -> str:
+    """Serialize an extraction (dict form) the way the model is asked to emit it"""
+    summary = data.get("summary", {})
+    rows = [DELIMITER.join(["S"] + [_cell(summary.get(c)) for c in SUMMARY_COLUMNS])]
+    for lesion in data.get("lesions", []):
+        rows.append(
+            DELIMITER.join(["L"] + [_cell(lesion.get(c)) for c in LESION_COLUMNS])
+        )
+    return "\n".join(rows)
+
+
+def format_instructions() -> str:
+    """User-prompt description of the row protocol (replaces the JSON Schema)"""
+    return (
+        "Answer with rows only, cells separated by '|', "
+        "empty cell = not stated, booleans y/n.\n"
+        f"First row: S|{'|'.join(SUMMARY_COLUMNS)}\n"
+        f"Then one row per lesion: L|{'|'.join(LESION_COLUMNS)}\n"
+        "modality: CT, PETCT, MRI, XR, US, UNKNOWN; "
+        "body_region: C, A, P, CAP, WB, UNKNOWN; "
+        "finding_type: primary, ln, met, indeterminate, benign; "
+        "laterality: left, right, midline, bilateral, unknown; "
+        "measure_axis: longest, short_axis, perpendicular, unknown; "
+        "certainty: present, possible, unlikely; "
+        "size_mm: integer millimeters."
+    )
+
+
+def _cells(row: str, columns: tuple, line: int) -> List[str]:
+    cells = row.split(DELIMITER, len(columns))[1:]
+    if len(cells) != len(columns):
+        raise TableFormatError(line, f"expected {len(columns)} cells, got {len(cells)}")
+    return [c.strip() for c in cells]
+
+
+def parse_row(row: str, line: int = 1) -> Tuple[str, Dict[str, Any]]:
+    """One non-blank row -> ("S", summary fields) or ("L", lesion fields sans id)"""
+    kind = row.split(DELIMITER, 1)[0]
+    if kind == "S":
+        return kind, {
+            c: v
+            for c, v in zip(SUMMARY_COLUMNS, _cells(row, SUMMARY_COLUMNS, line))
+            if v
+        }
+    if kind == "L":
+        return kind, {
+            c: v for c, v in zip(LESION_COLUMNS, _cells(row, LESION_COLUMNS, line)) if v
+        }
+    raise TableFormatError(line, f"unknown row type {kind[:20]!r}")
+
+
+def parse_table(text: str) -> Dict[str, Any]:
+    """Expand rows into a ReportExtraction-shaped dict; the caller validates values.
+
+    Strict: blank lines are skipped, anything else must be the single leading summary
+    row or a lesion row with exactly the expected number of cells.
+    """
+    summary = None
+    lesions = []
+    for line, row in enumerate(text.strip().splitlines(), start=1):
+        row = row.strip()
+        if not row:
+            continue
+        kind, fields = parse_row(row, line)
+        if kind == "S":
+            if summary is not None or lesions:
+                raise TableFormatError(
+                    line, "summary row must come first and only once"
+                )
+            summary = fields
+        else:
+            if summary is None:
+                raise TableFormatError(line, "lesion row before the summary row")
+            lesions.append({"lesion_id": f"L{len(lesions) + 1}", **fields})
+    if summary is None:
+        raise TableFormatError(1, "missing summary row")
+    return {"summary": summary, "lesions": lesions}
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import re
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Iterable, List, Optional, Tuple
+
+_NUM = r"\d+(?:\.\d+)?"
+_UNIT = r"(?:mm|cm|millimeters?|centimeters?)"
+_SEP = r"\s*(?:x|×|by)\s*"
+# "28 mm", "0.8 cm", "2.1 x 1.5 cm", "2.1 cm x 1.5 cm", "3 x 2 x 1 cm"
+MEASUREMENT_RE = re.compile(
+    rf"(?<![\w.])({_NUM})(?:\s*{_UNIT})?"
+    rf"(?:{_SEP}({_NUM})(?:\s*{_UNIT})?)?"
+    rf"(?:{_SEP}({_NUM}))?\s*(?P<unit>{_UNIT})\b",
+    re.IGNORECASE,
+)
+_RUN_RE = re.compile(r"\S+")
+# Comparison wording right before a mention, e.g. "(previously 22 mm)", "prior: 9 mm"
+_PRIOR_RE = re.compile(
+    r"\b(?:previously|prior|formerly|was|compared to|from)\W{0,3}$", re.IGNORECASE
+)
+_BATCH_SEP = "\n\x00\n"
+
+
+@dataclass
+class Measurement:
+    """A size mention in the report; offsets point into the original text"""
+
+    start: int
+    end: int
+    dims: Tuple[float, ...]  # in the unit as written
+    unit: str  # "mm" or "cm"
+    prior: bool = False  # a comparison value, not a current size
+
+    @property
+    def dims_mm(self) -> Tuple[float, ...]:
+        scale = 10.0 if self.unit == "cm" else 1.0
+        return tuple(d * scale for d in self.dims)
+
+    def axis_mm(self, measure_axis: Optional[str]) -> float:
+        """Short axis is the smallest dimension; everything else reports the longest"""
+        return min(self.dims_mm) if measure_axis == "short_axis" else max(self.dims_mm)
+
+
+@dataclass
+class SpanMatch:
+    start: int
+    end: int
+    score: float  # 1.0 for an exact (normalized) match
+
+    @property
+    def exact(self) -> bool:
+        return self.score >= 1.0
+
+
+@dataclass
+class ReportIndex:
+    """Per-report lookup structures, built once, shared by postprocessing and routing.
+
+    `norm` is the report lowercased with whitespace runs collapsed to one space;
+    `_run_norm`/`_run_orig` map the start of each whitespace-free run between the two.
+    """
+
+    text: str
+    norm: str
+    measurements: List[Measurement] = field(default_factory=list)
+    _run_norm: List[int] = field(default_factory=list, repr=False)
+    _run_orig: List[int] = field(default_factory=list, repr=False)
+
+    def to_original(self, norm_pos: int) -> int:
+        i = bisect_right(self._run_norm, norm_pos) - 1
+        if i < 0:
+            return 0
+        return self._run_orig[i] + (norm_pos - self._run_norm[i])
+
+    def align(self, span: str, min_score: float = 0.85) -> Optional[SpanMatch]:
+        """Locate `span` in the report: exact once normalized, else best fuzzy window"""
+        needle = normalize(span)
+        if not needle:
+            return None
+        pos = self.norm.find(needle)
+        if pos >= 0:
+            return self._match(pos, pos + len(needle), 1.0)
+        best = None
+        for start, end in self._candidate_windows(needle):
+            matcher = SequenceMatcher(
+                None, needle, self.norm[start:end], autojunk=False
+            )
+            if matcher.quick_ratio() < min_score:
+                continue
+            score = matcher.ratio()
+            if score >= min_score and (best is None or score > best[2]):
+                best = (start, end, score)
+        return None if best is None else self._match(*best)
+
+    def _candidate_windows(self, needle: str) -> Iterable[Tuple[int, int]]:
+        # Anchor on occurrences of the span's first and last words, allowing ~10%
+        # length drift
+        words = needle.split(" ")
+        slack = max(1, len(needle) // 10)
+        lengths = (len(needle) - slack, len(needle), len(needle) + slack)
+        first, last = words[0], words[-1]
+        pos = self.norm.find(first)
+        while pos >= 0:
+            for n in lengths:
+                yield pos, min(pos + n, len(self.norm))
+            pos = self.norm.find(first, pos + 1)
+        pos = self.norm.find(last)
+        while pos >= 0:
+            end = pos + len(last)
+            for n in lengths:
+                yield max(end - n, 0), end
+            pos = self.norm.find(last, pos + 1)
+
+    def _match(self, norm_start: int, norm_end: int, score: float) -> SpanMatch:
+        start = self.to_original(norm_start)
+        end = self.to_original(norm_end - 1) + 1 if norm_end > norm_start else start
+        return SpanMatch(start, end, score)
+
+    def measurements_in(self, start: int, end: int) -> List[Measurement]:
+        return [m for m in self.measurements if m.start < end and m.end > start]
+
+    @property
+    def current_measurements(self) -> List[Measurement]:
+        return [m for m in self.measurements if not m.prior]
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def _unit(raw: str) -> str:
+    return "cm" if raw.lower().startswith("c") else "mm"
+
+
+def _measurements(
+    text: str, base: int = 0, limit: Optional[int] = None
+) -> List[Measurement]:
+    """Mentions in ``text[base:limit]``, offsets relative to `base`.
+
+    Lookbehinds stop at `base`, so a scan never sees the text before it.
+    """
+    out = []
+    for m in MEASUREMENT_RE.finditer(text, base, len(text) if limit is None else limit):
+        dims = tuple(float(g) for g in m.groups()[:3] if g is not None)
+        prior = bool(_PRIOR_RE.search(text, max(m.start() - 20, base), m.start()))
+        out.append(
+            Measurement(
+                m.start() - base, m.end() - base, dims, _unit(m.group("unit")), prior
+            )
+        )
+    return out
+
+
+def _build(text: str, measurements: List[Measurement]) -> ReportIndex:
+    parts, run_norm, run_orig = [], [], []
+    pos = 0
+    for m in _RUN_RE.finditer(text):
+        run = m.group(0)
+        lowered = run.lower()
+        run_norm.append(pos)
+        run_orig.append(m.start())
+        parts.append(lowered if len(lowered) == len(run) else run)
+        pos += len(run) + 1
+    return ReportIndex(text, " ".join(parts), measurements, run_norm, run_orig)
+
+
+def build_index(text: str) -> ReportIndex:
+    return _build(text, _measurements(text))
+
+
+def build_indexes(texts: List[str]) -> List[ReportIndex]:
+    """Index many reports over one joined buffer, each scanned within its own bounds.
+
+    Bounding every scan to its report keeps the comparison lookback from reading the
+    end of the previous report, so the result matches `build_index` per report.
+    """
+    joined = _BATCH_SEP.join(texts)
+    indexes, pos = [], 0
+    for t in texts:
+        indexes.append(_build(t, _measurements(joined, pos, pos + len(t))))
+        pos += len(t) + len(_BATCH_SEP)
+    return indexes
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict
+
+from .textindex import ReportIndex
+
+# Nouns that introduce a reportable lesion; one per line/sentence is counted
+LESION_KEYWORD_RE = re.compile(
+    r"\b(?:mass(?:es)?|nodules?|lesions?|nodes?|lymphadenopathy|adenopathy|"
+    r"metasta\w*|foc(?:us|i)|"
+    r"implants?|deposits?|tumou?rs?|opacit(?:y|ies))\b",
+    re.IGNORECASE,
+)
+_NEGATED_RE = re.compile(
+    r"^\W*(?:\d+[.)]\s*)?(?:no|without|negative for)\b", re.IGNORECASE
+)
+_SENTENCE_RE = re.compile(r"[^\n.;]+")
+
+
+def count_lesion_mentions(text: str) -> int:
+    """Sentences naming a lesion, skipping negated ones ("No distant metastasis")"""
+    return sum(
+        1
+        for s in _SENTENCE_RE.findall(text)
+        if LESION_KEYWORD_RE.search(s) and not _NEGATED_RE.match(s)
+    )
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    """Predicts how many output tokens a report's extraction needs.
+
+    The summary object costs roughly `base_tokens` and each lesion `tokens_per_lesion`;
+    the lesion count is the larger of the current size mentions and the (non-negated)
+    lesion sentences. `margin` absorbs the error, `min_tokens` covers empty reports.
+    """
+
+    base_tokens: int = 64
+    tokens_per_lesion: int = 96
+    margin: float = 1.25
+    min_tokens: int = 128
+
+    def predict_lesions(self, index: ReportIndex) -> int:
+        return max(len(index.current_measurements), count_lesion_mentions(index.text))
+
+    def predict(self, index: ReportIndex, cap: int) -> int:
+        """Output-token budget for the report, never above the static `cap`"""
+        tokens = (
+            self.base_tokens + self.tokens_per_lesion * self.predict_lesions(index)
+        ) * self.margin
+        return min(cap, max(self.min_tokens, int(tokens)))
+
+
+def budget_summary(stats: Counter) -> Dict[str, Any]:
+    """Prediction hit rate and KV-cache reserved vs. the static `max_tokens`.
+
+    A hit is a report whose output fit the predicted budget without a continuation.
+    With batched generation (`batches` counted) the saving is also given per planned
+    `generate_batch` group, at the average group size.
+    """
+    reports = stats["budget_reports"]
+    saved_mb = stats["budget_kv_saved_bytes"] / 2**20
+    summary = {
+        "reports": reports,
+        "hit_rate": stats["budget_hits"] / reports if reports else 0.0,
+        "continuations": stats["budget_continuations"],
+        "avg_reserved_tokens": stats["budget_tokens"] / reports if reports else 0.0,
+        "avg_static_tokens": stats["budget_static_tokens"] / reports
+        if reports
+        else 0.0,
+        "kv_saved_mb_per_report": saved_mb / reports if reports else 0.0,
+    }
+    if reports and stats["batches"]:
+        summary["reports_per_batch"] = stats["batch_items"] / stats["batches"]
+        summary["kv_saved_mb_per_batch"] = (
+            summary["kv_saved_mb_per_report"] * summary["reports_per_batch"]
+        )
+    return summary
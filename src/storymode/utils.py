@@ -1,7 +1,12 @@
 from __future__ import annotations
-import os, time
+
+import os
+import time
 from contextlib import contextmanager
 
+# Per-run counters written next to batch_extract outputs (not an extraction)
+RUN_STATS_FILE = "run_stats.json"
+
 class Timer:
     def __init__(self): self.start = None; self.elapsed_ms = 0.0
     def __enter__(self):
@@ -9,9 +14,30 @@ class Timer:
     def __exit__(self, *exc):
         self.elapsed_ms = (time.time() - self.start) * 1000.0
 
+
+def chunked(items, size: int):
+    """Yield lists of up to `size` items from any iterable"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def read_txt(fp: str) -> str:
     with open(fp, 'r', encoding='utf-8') as f: return f.read()
 
+
+def read_json(fp: str):
+    import orjson
+
+    with open(fp, "rb") as f:
+        return orjson.loads(f.read())
+
+
 def dump_json(obj, fp: str):
     import orjson
     with open(fp, 'wb') as f:
@@ -0,0 +1,33 @@
+import pytest
+
+from storymode.models import ModelBackend, model_manager
+
+# Reference label of each example report, keyed by a size only that report mentions
+LABELS = {"28 mm": "examples/labels/001.json", "8 mm": "examples/labels/002.json"}
+
+
+class LabelBackend(ModelBackend):
+    """Answers with the reference label of the example report in the prompt"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, messages, **kwargs):
+        self.calls += 1
+        report = messages[-1]["content"].split("Report:")[-1]
+        with open(next(fp for k, fp in LABELS.items() if k in report)) as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def label_backend(monkeypatch):
+    """A `LabelBackend` serving every model.
+
+    Tests that alter answers wrap it and re-patch `_create_backend`.
+    """
+    backend = LabelBackend()
+    monkeypatch.setattr(model_manager, "_create_backend", lambda config: backend)
+    return backend
@@ -0,0 +1,90 @@
+import json
+
+from storymode.batching import BatchPlanner, BatchPolicy
+from storymode.extract import batch_extract
+from storymode.models import ModelBackend, current_memory_usage, model_manager
+
+
+class _OOMBackend(ModelBackend):
+    """Answers with the reference label; batches over `limit` run out of memory"""
+
+    def __init__(self, labels, limit):
+        self.labels = labels
+        self.limit = limit
+        self.sizes = []
+
+    def generate(self, messages, **kwargs):
+        return self.labels.generate(messages, **kwargs)
+
+    def generate_batch(self, batch, **kwargs):
+        if len(batch) > self.limit:
+            raise MemoryError("simulated out of memory")
+        self.sizes.append(len(batch))
+        return super().generate_batch(batch, **kwargs)
+
+    def close(self):
+        pass
+
+
+def test_plan_fits_estimated_memory():
+    planner = BatchPlanner(model_manager.get_model_config("mistral-7b-instruct"))
+    one = planner.sequence_bytes(500, 400)
+    planner.available_bytes = lambda: int(3.5 * one)
+    lengths = [100, 500, 300, 200, 50, 400, 450]
+    batches = planner.plan(lengths, [400] * 7)
+    # Prompts are grouped by length, so short ones pack more per batch than the
+    # longest would allow
+    assert batches == [[4, 0, 3, 2], [5, 6, 1]]
+    assert all(
+        planner.batch_bytes([lengths[i] for i in b], [400] * len(b)) <= 3.5 * one
+        for b in batches
+    )
+
+
+def test_cpu_cap_is_measured_against_rss():
+    rss = current_memory_usage().host_bytes
+    planner = BatchPlanner(
+        model_manager.get_model_config("mistral-7b-instruct"),
+        BatchPolicy(memory_cap_bytes=rss + 2**30, safety=1.0),
+    )
+    assert 0 < planner.available_bytes() <= 2**30
+
+
+def test_out_of_memory_splits_without_losing_reports(
+    tmp_path, monkeypatch, label_backend
+):
+    backend = _OOMBackend(label_backend, limit=1)
+    monkeypatch.setattr(model_manager, "_create_backend", lambda config: backend)
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        batching=BatchPolicy(batch_size=2),
+    )
+    assert stats["batch_oom_splits"] == 1 and backend.sizes == [1, 1]
+    assert stats["outputs"] == 2
+    assert len(json.loads((tmp_path / "001.json").read_text())["lesions"]) == 3
+
+
+def test_invalid_batch_item_falls_back_with_the_jsonschema_engine(
+    tmp_path, monkeypatch, label_backend
+):
+    def generate_batch(batch, **kwargs):
+        bad = json.loads(label_backend.generate(batch[0]))
+        bad["lesions"][0]["size_mm"] = "large"
+        return [json.dumps(bad)] + [
+            label_backend.generate(messages) for messages in batch[1:]
+        ]
+
+    monkeypatch.setattr(label_backend, "generate_batch", generate_batch)
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        batching=BatchPolicy(batch_size=2),
+        validation_engine="jsonschema",
+    )
+    assert stats["batch_fallbacks"] == 1 and stats["outputs"] == 2
+    assert (
+        json.loads((tmp_path / "001.json").read_text())["lesions"][0]["size_mm"] == 28
+    )
@@ -0,0 +1,75 @@
+import json
+
+from storymode.cascade import CascadePolicy, key_field_logprob
+from storymode.extract import batch_extract
+from storymode.models import ModelBackend, model_manager
+
+
+class _MissingLesionBackend(ModelBackend):
+    """Drops the last lesion of 001 from the reference label (small-model mistake)"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def generate(self, messages, **kwargs):
+        data = json.loads(self.labels.generate(messages, **kwargs))
+        if "28 mm" in messages[-1]["content"].split("Report:")[-1]:
+            data["lesions"].pop()
+        return json.dumps(data)
+
+    def close(self):
+        pass
+
+
+def test_key_field_logprob_only_looks_at_key_values():
+    tokens = [
+        ('{"', -0.1),
+        ("note", -5.0),
+        ('":"', -0.1),
+        ("x", -6.0),
+        ('","', -0.1),
+        ("size_mm", -0.2),
+        ('":', -0.1),
+        ("2", -1.5),
+        ("8", -0.3),
+        ("}", -0.1),
+    ]
+    assert key_field_logprob(tokens) == -1.5
+    assert key_field_logprob(None) is None
+
+
+def test_cascade_escalates_only_disagreeing_reports(
+    tmp_path, monkeypatch, label_backend
+):
+    small = _MissingLesionBackend(label_backend)
+    monkeypatch.setattr(
+        model_manager,
+        "_create_backend",
+        lambda config: small if config.name == "mistral-7b-instruct" else label_backend,
+    )
+    # A single missed lesion is within the default count gap
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        model="unused",
+        cascade=CascadePolicy("mistral-7b-instruct", "qwen2.5-14b-instruct"),
+    )
+    assert stats["cascade_escalated"] == 0
+
+    policy = CascadePolicy(
+        "mistral-7b-instruct", "qwen2.5-14b-instruct", max_count_gap=0
+    )
+    stats = batch_extract(
+        "examples/reports", str(tmp_path), model="unused", cascade=policy
+    )
+    assert stats["cascade_reports"] == 2
+    assert stats["cascade_escalated"] == 1 and stats["escalate_count_mismatch"] == 1
+    # The small model's attempt at the escalated report is not a report of the run
+    assert stats["reports"] == 2 and stats["cascade_small_reports"] == 1
+    out = json.loads((tmp_path / "001.json").read_text())
+    assert out["model_name"] == "qwen2.5-14b-instruct"
+    assert len(out["lesions"]) == 3
+    assert (
+        json.loads((tmp_path / "002.json").read_text())["model_name"]
+        == "mistral-7b-instruct"
+    )
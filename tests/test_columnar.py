@@ -0,0 +1,35 @@
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from storymode.columnar import (  # noqa: E402
+    LESIONS_FILE,
+    convert_json_dir,
+    load_dir_columnar,
+)
+from storymode.eval import evaluate, load_dir_json  # noqa: E402
+
+LABELS = "examples/labels"
+
+
+def test_columnar_roundtrip(tmp_path):
+    assert convert_json_dir(LABELS, str(tmp_path), row_group_size=1) == 2
+    assert pq.ParquetFile(tmp_path / LESIONS_FILE).metadata.num_row_groups == 2
+    schema = pq.read_schema(tmp_path / LESIONS_FILE)
+    assert str(schema.field("finding_type").type).startswith("dictionary")
+
+    ref = load_dir_json(LABELS)
+    got = load_dir_columnar(str(tmp_path))
+    assert set(got) == set(ref)
+    for fn, doc in ref.items():
+        assert got[fn]["summary"]["modality"] == doc["summary"]["modality"]
+        assert [lesion["size_mm"] for lesion in got[fn]["lesions"]] == [
+            lesion.get("size_mm") for lesion in doc["lesions"]
+        ]
+
+
+def test_evaluate_reads_columnar_predictions(tmp_path):
+    convert_json_dir(LABELS, str(tmp_path))
+    res = evaluate(str(tmp_path), LABELS)
+    assert res["doc_accuracy_mets_present"] == 1.0
+    assert res["size_mae_mm"] == 0
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from storymode.corpus import (
+    PackedCorpus,
+    merge_shards,
+    pack_reports,
+    parse_shard,
+    shard_of,
+)
+from storymode.eval import evaluate
+from storymode.extract import batch_extract, iter_reports
+
+REPORTS = "examples/reports"
+
+
+def test_pack_roundtrip(tmp_path):
+    src = tmp_path / "txt"
+    src.mkdir()
+    texts = {f"{i:03d}.txt": f"report {i}\nIMPRESSION: {'x' * i} é" for i in range(7)}
+    texts["empty.txt"] = ""
+    for name, text in texts.items():
+        (src / name).write_text(text, encoding="utf-8")
+    assert pack_reports(str(src), str(tmp_path / "packed"), shard_bytes=40) == len(
+        texts
+    )
+
+    with PackedCorpus(str(tmp_path / "packed")) as corpus:
+        assert (
+            len(
+                json.loads((tmp_path / "packed" / "manifest.json").read_text())[
+                    "shards"
+                ]
+            )
+            > 1
+        )
+        assert corpus.names == sorted(texts)
+        assert dict(corpus) == texts
+        assert corpus[3] == ("003.txt", texts["003.txt"])
+    assert list(iter_reports(str(tmp_path / "packed"))) == list(iter_reports(str(src)))
+
+
+def test_shards_partition_the_corpus():
+    names = [f"{i:05d}.txt" for i in range(500)]
+    parts = [{n for n in names if shard_of(n, 4) == i} for i in range(4)]
+    assert set().union(*parts) == set(names)
+    assert sum(map(len, parts)) == len(names)
+    assert all(len(p) > 50 for p in parts)
+    assert parse_shard("1/4") == (1, 4)
+    for bad in ("4/4", "x", "1/2/3"):
+        with pytest.raises(ValueError):
+            parse_shard(bad)
+
+
+@pytest.mark.parametrize("output_format", ["json", "parquet"])
+def test_extract_shards_then_merge(tmp_path, label_backend, output_format):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    pack_reports(REPORTS, str(tmp_path / "packed"))
+    dirs = []
+    for i in range(3):
+        dirs.append(str(tmp_path / f"shard{i}"))
+        batch_extract(
+            str(tmp_path / "packed"),
+            dirs[-1],
+            "mistral-7b-instruct",
+            output_format=output_format,
+            shard=(i, 3),
+        )
+
+    with pytest.raises(ValueError):
+        merge_shards(dirs[:2], str(tmp_path / "partial"))
+    stats = merge_shards(dirs[::-1], str(tmp_path / "merged"))
+    assert stats["outputs"] == 2
+    res = evaluate(str(tmp_path / "merged"), "examples/labels")
+    assert res["doc_accuracy_mets_present"] == 1.0
+    assert res["size_mae_mm"] == 0
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from storymode.bench import load_completions
+from storymode.decode import (
+    ExtractionValidationError,
+    parse_completion,
+    validate_extraction,
+)
+
+
+def test_engines_agree_on_reference_completions():
+    for text in load_completions("examples/labels"):
+        assert parse_completion(text, "pydantic") == parse_completion(
+            text, "jsonschema"
+        )
+
+
+def test_field_repair_normalizes_enums_and_drops_bad_optionals():
+    text = json.dumps(
+        {
+            "summary": {"modality": "ct"},
+            "lesions": [
+                {
+                    "lesion_id": "L1",
+                    "body_site": "liver",
+                    "laterality": "Left",
+                    "certainty": "maybe",
+                    "size_mm": -4,
+                }
+            ],
+        }
+    )
+    obj = validate_extraction(text)
+    assert obj.summary.modality == "CT"
+    assert obj.lesions[0].laterality == "left"
+    assert "certainty" not in obj.lesions[0].model_fields_set
+    assert (
+        obj.lesions[0].size_mm == 0
+    )  # clamped, as postprocessing did before field repair
+
+
+def test_unrepairable_errors_are_path_addressable():
+    text = "{'summary': {}, 'lesions': [{'lesion_id': 'L1'}]}"
+    with pytest.raises(ExtractionValidationError) as exc:
+        validate_extraction(text)
+    assert [e["path"] for e in exc.value.errors] == ["lesions.0.body_site"]
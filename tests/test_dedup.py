@@ -0,0 +1,85 @@
+import json
+
+from storymode.dedup import DedupPolicy
+from storymode.extract import batch_extract
+
+
+def test_normalization_drops_headers_and_keeps_identity():
+    text = open("examples/reports/001.txt").read()
+    variant = (
+        "MRN: 555\nAccession #: A-17\nStudy Date: 2024-03-01\nDOB: 1950-01-01\n\n"
+        + text.upper().replace("\n", "  \n")
+    )
+    policy = DedupPolicy()
+    key, captured = policy.key(variant)
+    assert key == policy.key(text)[0]
+    assert captured == {
+        "patient_id": "555",
+        "report_id": "A-17",
+        "study_date": "2024-03-01",
+    }
+    assert DedupPolicy(casefold=False).key(variant)[0] != key
+
+
+def test_batch_extract_runs_each_normalized_text_once(tmp_path, label_backend):
+    text = open("examples/reports/001.txt").read()
+    reports = {
+        "a.txt": "MRN: 111\nAccession: 9001\n" + text,
+        "b.txt": "MRN: 222\nAccession: 9002\n\n" + text.replace(" ", "   "),
+        "c.txt": text,
+        "d.txt": open("examples/reports/002.txt").read(),
+    }
+    in_dir, out_dir = tmp_path / "in", tmp_path / "out"
+    in_dir.mkdir()
+    for name, body in reports.items():
+        (in_dir / name).write_text(body)
+    stats = batch_extract(
+        str(in_dir), str(out_dir), "mistral-7b-instruct", dedup=DedupPolicy()
+    )
+
+    assert label_backend.calls == 2
+    assert (stats["dedup_reports"], stats["dedup_duplicates"], stats["outputs"]) == (
+        4,
+        2,
+        4,
+    )
+    out = {
+        name: json.loads((out_dir / name.replace(".txt", ".json")).read_text())
+        for name in reports
+    }
+    assert "patient_id" not in out["a.txt"]  # the model's answer, untouched
+    assert (out["b.txt"]["patient_id"], out["b.txt"]["report_id"]) == ("222", "9002")
+    assert "patient_id" not in out["c.txt"] and "report_id" not in out["c.txt"]
+    assert [lesion["size_mm"] for lesion in out["b.txt"]["lesions"]] == [
+        lesion["size_mm"] for lesion in out["a.txt"]["lesions"]
+    ]
+    for name in ("a.txt", "b.txt", "c.txt"):
+        for lesion in out[name]["lesions"]:
+            span = reports[name][lesion["evidence_start"] : lesion["evidence_end"]]
+            assert " ".join(span.split()) == lesion["evidence_span"]
+
+
+def test_unique_reports_keep_the_models_identity(tmp_path, monkeypatch, label_backend):
+    label = label_backend.generate
+    monkeypatch.setattr(
+        label_backend,
+        "generate",
+        lambda messages, **kwargs: json.dumps(
+            {**json.loads(label(messages)), "patient_id": "model-7", "report_id": "R1"}
+        ),
+    )
+    text = open("examples/reports/001.txt").read()
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    (in_dir / "a.txt").write_text("MRN: 111\nAccession: 9001\n" + text)
+    (in_dir / "b.txt").write_text("MRN: 222\n" + text)
+    (in_dir / "d.txt").write_text(open("examples/reports/002.txt").read())
+    batch_extract(
+        str(in_dir), str(tmp_path / "on"), "mistral-7b-instruct", dedup=DedupPolicy()
+    )
+    batch_extract(str(in_dir), str(tmp_path / "off"), "mistral-7b-instruct")
+
+    for fn in ("a.json", "d.json"):
+        assert (tmp_path / "on" / fn).read_text() == (tmp_path / "off" / fn).read_text()
+    dup = json.loads((tmp_path / "on" / "b.json").read_text())
+    assert dup["patient_id"] == "222" and "report_id" not in dup
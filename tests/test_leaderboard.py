@@ -0,0 +1,70 @@
+import json
+import shutil
+
+from storymode.eval import (
+    evaluate,
+    numeric_mae_mm,
+    pair_lesions,
+    score_document,
+    summarize_scores,
+    within_tolerance,
+)
+from storymode.leaderboard import diff_runs, evaluate_runs, rank_runs
+
+LABELS = "examples/labels"
+
+
+def _runs(tmp_path):
+    perfect = tmp_path / "perfect"
+    shutil.copytree(LABELS, perfect)
+    worse = tmp_path / "worse.jsonl"
+    with open(worse, "w") as f:
+        for doc_id in ("001", "002"):
+            with open(f"{LABELS}/{doc_id}.json") as g:
+                doc = json.load(g)
+            if doc_id == "001":
+                doc["lesions"][0]["size_mm"] = 25
+            f.write(json.dumps({"doc_id": doc_id, **doc}) + "\n")
+    return [str(perfect), str(worse)]
+
+
+def test_leaderboard_ranks_runs_and_matches_single_eval(tmp_path):
+    sources = _runs(tmp_path)
+    results = evaluate_runs(sources, LABELS, max_workers=2)
+    assert list(results) == ["perfect", "worse"]
+    assert (
+        results["perfect"]["metrics"]["size_mae_mm"]
+        == evaluate(sources[0], LABELS)["size_mae_mm"]
+        == 0
+    )
+    board = rank_runs(results)
+    assert [row["run"] for row in board] == ["perfect", "worse"]
+    assert (
+        board[1]["size_mae_mm_rank"] == 2
+        and board[1]["doc_accuracy_mets_present_rank"] == 1
+    )
+
+    rows = diff_runs(results["perfect"], results["worse"])
+    assert rows == [{"doc": "001.json", "size_errors": ([0, 0, 0], [3, 0, 0])}]
+
+
+def test_missing_documents_score_as_empty(tmp_path):
+    run = tmp_path / "partial"
+    run.mkdir()
+    shutil.copy(f"{LABELS}/002.json", run)
+    res = evaluate_runs([str(run)], LABELS)["partial"]
+    assert res["metrics"]["missing_docs"] == 1
+    assert res["metrics"]["lesion_recall"] == 2 / 5
+
+
+def test_size_helpers_match_the_run_metrics():
+    pred = json.loads(open(f"{LABELS}/001.json").read())
+    ref = json.loads(open(f"{LABELS}/001.json").read())
+    pred["lesions"][0]["size_mm"] += 3
+    pairs = pair_lesions(pred["lesions"], ref["lesions"])
+    assert numeric_mae_mm(pairs) == 1.0 and within_tolerance(pairs) == (2, 3)
+    metrics = summarize_scores([score_document(pred, ref)])
+    assert (
+        metrics["size_mae_mm"] == numeric_mae_mm(pairs)
+        and metrics["size_within_2mm"] == 2 / 3
+    )
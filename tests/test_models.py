@@ -0,0 +1,49 @@
+from storymode.models import MemoryUsage, ModelBackend, ModelConfig, ModelManager
+
+
+class _BufferBackend(ModelBackend):
+    """Stand-in backend whose 'weights' are a plain host buffer"""
+
+    def __init__(self, nbytes: int):
+        self.weights = bytearray(b"\x01" * nbytes)
+
+    def generate(self, messages, **kwargs):
+        return "{}"
+
+    def close(self):
+        del self.weights
+
+
+def _manager(nbytes=64 * 2**20, **budget):
+    manager = ModelManager(**budget)
+    manager.MODEL_CONFIGS = {
+        name: ModelConfig(name=name, backend="test", model_path=name)
+        for name in ("a", "b", "c")
+    }
+    manager._create_backend = lambda config: _BufferBackend(nbytes)
+    return manager
+
+
+def test_close_releases_host_memory():
+    manager = _manager()
+    manager.get_backend("a")
+    assert manager.footprints["a"].host_bytes > 32 * 2**20
+    released = manager.close_backend("a")
+    assert released.host_bytes > 32 * 2**20
+    assert "a" not in manager.backends
+
+
+def test_lru_eviction_respects_budget_and_pins():
+    manager = _manager()
+    manager.footprints = {name: MemoryUsage(host_bytes=64 * 2**20) for name in "abc"}
+    manager.host_budget_bytes = 150 * 2**20
+    manager.get_backend("a")
+    manager.get_backend("b")
+    manager.get_backend("a")  # touch: "b" is now least recently used
+    with manager.using("b"):
+        manager.get_backend("c")  # "b" is pinned, so "a" goes instead
+        assert list(manager.backends) == ["b", "c"]
+    manager.get_backend("a")
+    assert list(manager.backends) == ["c", "a"]
+    manager.close_all()
+    assert not manager.backends
@@ -0,0 +1,37 @@
+import json
+
+from storymode import profiling
+from storymode.extract import batch_extract
+from storymode.profiling import Profiler, stage
+
+
+def test_stage_is_a_noop_outside_sampled_units(tmp_path):
+    assert stage("parse") is stage("generate")
+    profiler = Profiler(str(tmp_path), every=2, use_torch=False)
+    for i in range(4):
+        with profiler.sample(f"r{i}") as sampled:
+            assert sampled == (i % 2 == 0)
+            assert (profiling._active is profiler) == sampled
+            with stage("parse"):
+                pass
+    assert profiler.samples == 2 and profiler.stage_calls["parse"] == 2
+
+
+def test_extract_with_profiler_writes_traces(tmp_path, label_backend):
+    profiler = Profiler(str(tmp_path / "profile"), every=1)
+    batch_extract(
+        "examples/reports",
+        str(tmp_path / "out"),
+        "mistral-7b-instruct",
+        profiler=profiler,
+    )
+
+    summary = profiler.summary()
+    assert summary["samples"] == 2
+    assert {"prompt", "generate", "parse", "postprocess"} <= set(summary["stages"])
+    assert summary["hotspots"]
+    trace = json.loads((tmp_path / "profile" / profiling.TRACE_FILE).read_text())
+    assert {e["name"] for e in trace["traceEvents"]} >= {"001.txt", "generate", "parse"}
+    assert (tmp_path / "profile" / profiling.CPROFILE_FILE).exists()
+    if profiler.torch is not None:
+        assert (tmp_path / "profile" / "torch-001.txt.json").exists()
@@ -0,0 +1,82 @@
+import glob
+
+import pytest
+
+from storymode.decode import format_messages_for_model
+from storymode.extract import build_prompt
+from storymode.prompt_templates import PromptAssembler, PromptFormatter, get_formatter
+
+tokenizers = pytest.importorskip("tokenizers")
+transformers = pytest.importorskip("transformers")
+
+SPECIAL = ["<s>", "</s>", "<|im_start|>", "<|im_end|>"]
+REPORTS = [open(fp).read() for fp in sorted(glob.glob("examples/reports/*.txt"))]
+
+
+def _tokenizer(kind):
+    """Small BPE tokenizer trained on the prompts.
+
+    `kind` is "bytelevel" (GPT/Qwen style) or "metaspace" (Llama/Mistral style).
+    """
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+
+    if kind == "bytelevel":
+        tok = Tokenizer(models.BPE())
+        tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+        tok.decoder = decoders.ByteLevel()
+        trainer = trainers.BpeTrainer(
+            vocab_size=600,
+            special_tokens=SPECIAL,
+            initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+        )
+    else:
+        tok = Tokenizer(models.BPE(byte_fallback=True))
+        tok.pre_tokenizer = pre_tokenizers.Metaspace(
+            replacement="▁", prepend_scheme="first"
+        )
+        tok.decoder = decoders.Metaspace()
+        trainer = trainers.BpeTrainer(
+            vocab_size=600,
+            special_tokens=SPECIAL + [f"<0x{i:02X}>" for i in range(256)],
+        )
+    tok.train_from_iterator(
+        REPORTS + [str(build_prompt("", v)) for v in ("v1", "t1")], trainer
+    )
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tok, bos_token="<s>", eos_token="</s>"
+    )
+
+
+def test_formatter_follows_config_template_family():
+    assert get_formatter("biomistral-7b") is PromptFormatter.format_mistral
+    assert get_formatter("qwen2.5-14b-instruct") is PromptFormatter.format_qwen
+    assert get_formatter("replay:meditron-7b") is PromptFormatter.format_generic
+
+
+@pytest.mark.parametrize("kind", ["bytelevel", "metaspace"])
+@pytest.mark.parametrize("model_name", ["mistral-7b-instruct", "qwen2.5-7b-instruct"])
+def test_assembled_ids_match_tokenized_formatter_output(kind, model_name):
+    tok = _tokenizer(kind)
+    assembler = PromptAssembler(tok, model_name)
+    for version in ("v1", "t1"):
+        for report in REPORTS + [
+            "1. Mass 3 cm.",
+            "  leading whitespace\n",
+            "Mass \ue000 3 cm \ue000.",
+        ]:
+            messages = format_messages_for_model(
+                build_prompt(report, version), model_name
+            )
+            expected = tok(
+                get_formatter(model_name)(messages), add_special_tokens=False
+            )["input_ids"]
+            assert assembler.encode(messages) == expected
+            assert (
+                assembler.encode(messages, assistant_prefix='{"summary"')
+                == tok(
+                    get_formatter(model_name)(messages) + '{"summary"',
+                    add_special_tokens=False,
+                )["input_ids"]
+            )
+    # Instructions and few-shot turns were tokenized once per prompt version
+    assert assembler.stats["cached"] > assembler.stats["full"]
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from storymode.extract import batch_extract
+from storymode.models import ModelManager, model_manager
+from storymode.replay import ReplayBackend
+
+
+def test_record_then_replay_without_a_model(tmp_path, monkeypatch, label_backend):
+    store = str(tmp_path / "run.jsonl")
+    batch_extract(
+        "examples/reports",
+        str(tmp_path / "live"),
+        "mistral-7b-instruct",
+        record_to=store,
+    )
+    monkeypatch.undo()  # replay must not reach the live backend
+    assert label_backend.calls == 2
+
+    # Shared prompt parts are stored once: 2 requests, the system/few-shot blobs and
+    # 2 report blobs
+    lines = [json.loads(line) for line in open(store)]
+    assert sum("key" in rec for rec in lines) == 2
+    assert sum("blob" in rec for rec in lines) == 4
+
+    name = model_manager.register_replay(store)
+    assert name == "replay:mistral-7b-instruct"
+    assert name not in model_manager.MODEL_CONFIGS  # registered on this manager only
+    with pytest.raises(ValueError):
+        ModelManager().get_model_config(name)
+    batch_extract("examples/reports", str(tmp_path / "replayed"), name)
+    assert label_backend.calls == 2
+    for fn in ("001.json", "002.json"):
+        live = json.loads((tmp_path / "live" / fn).read_text())
+        replayed = json.loads((tmp_path / "replayed" / fn).read_text())
+        assert replayed["lesions"] == live["lesions"]
+    assert len(ReplayBackend(store).records) == 2
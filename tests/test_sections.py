@@ -0,0 +1,76 @@
+import pytest
+
+from storymode.bench import bench_sections
+from storymode.sections import SectionPolicy, parse_exam, prune_report
+
+REPORT = """EXAM: MRI abdomen without and with contrast
+CLINICAL HISTORY: Colon cancer, restaging.
+TECHNIQUE: Multiplanar multisequence imaging.
+COMPARISON: CT 01/02/2024.
+FINDINGS:
+Liver: 0.8 cm lesion in segment 7.
+IMPRESSION:
+1. New 0.8 cm segment 7 liver lesion, suspicious for metastasis.
+"""
+
+
+def test_prune_drops_boilerplate_sections_verbatim():
+    pruned = prune_report(REPORT)
+    assert pruned.kept == ["FINDINGS", "IMPRESSION"]
+    assert "TECHNIQUE" not in pruned.text and "Colon cancer" not in pruned.text
+    assert "Liver: 0.8 cm lesion in segment 7." in pruned.text
+    assert pruned.tokens_saved > 0
+    # FINDINGS holds measurements, so it is kept even when only IMPRESSION is asked for
+    assert prune_report(REPORT, SectionPolicy.from_names("impression")).kept == [
+        "FINDINGS",
+        "IMPRESSION",
+    ]
+    assert prune_report(REPORT, SectionPolicy.from_names("exam,impression")).kept == [
+        "EXAM",
+        "FINDINGS",
+        "IMPRESSION",
+    ]
+
+
+def test_unstructured_report_is_sent_in_full():
+    text = "Left upper lobe mass measures 28 mm."
+    assert prune_report(text).text == text
+    # Headers, but none the policy keeps: the preamble alone would drop the findings
+    text = "CT chest.\nLeft upper lobe mass measures 28 mm.\nTECHNIQUE: Axial images.\n"
+    pruned = prune_report(text)
+    assert pruned.text == text and pruned.kept == ["PREAMBLE", "TECHNIQUE"]
+
+
+def test_header_like_prose_and_measured_sections_are_kept():
+    text = (
+        "EXAM: CT chest\nTECHNIQUE: Axial 5 mm images.\nCOMPARISON: None.\n"
+        "FINDINGS:\nHistory: prior smoker. New nodule 5 mm in RLL.\n"
+        "IMPRESSION:\nNodule.\n"
+    )
+    pruned = prune_report(text)
+    assert pruned.kept == ["TECHNIQUE", "FINDINGS", "IMPRESSION"]
+    assert "History: prior smoker. New nodule 5 mm in RLL." in pruned.text
+    assert "COMPARISON" not in pruned.text
+    assert [
+        s.name for s in prune_report("Findings:\nNodule.\nimpression: stable").sections
+    ] == ["FINDINGS"]
+
+
+def test_unknown_section_names_are_rejected():
+    assert SectionPolicy.from_names("findings, clinical history").include == {
+        "FINDINGS",
+        "CLINICAL_HISTORY",
+    }
+    with pytest.raises(ValueError, match="FINDING"):
+        SectionPolicy.from_names("finding,impression")
+
+
+def test_exam_line_parsing():
+    assert parse_exam(REPORT) == ("MRI", "A")
+    assert parse_exam("EXAM: PET/CT skull base to mid-thigh\n") == ("PETCT", "WB")
+
+
+def test_pruning_keeps_everything_the_example_labels_need():
+    res = bench_sections("examples/reports", "examples/labels")
+    assert res["evidence_spans_kept"] == 1.0
+    assert res["exam_parse_accuracy"] == 1.0
@@ -0,0 +1,88 @@
+import copy
+import json
+
+from storymode.cascade import UncertaintyPolicy
+from storymode.extract import batch_extract
+from storymode.selfconsistency import SelfConsistencyConfig, merge_samples
+
+with open("examples/labels/001.json") as f:
+    LABEL = json.load(f)
+
+
+def test_merge_votes_fields_and_takes_median_size():
+    a, b, c = (copy.deepcopy(LABEL) for _ in range(3))
+    b["lesions"][0]["size_mm"] = 30
+    b["lesions"][0]["laterality"] = "right"
+    c["lesions"].pop(2)  # sample misses the liver met
+    c["lesions"].append(
+        {"lesion_id": "L9", "finding_type": "benign", "body_site": "kidney"}
+    )  # lone lesion
+    merged = merge_samples([a, b, c])
+
+    assert [lesion["body_site"] for lesion in merged["lesions"]] == [
+        "lung upper lobe",
+        "mediastinum",
+        "liver",
+    ]
+    first = merged["lesions"][0]
+    assert first["size_mm"] == 28 and first["laterality"] == "left"
+    assert first["agreement"]["laterality"] == 2 / 3
+    assert first["agreement"]["size_mm"] == 1.0  # 30 is within 2 mm of the median
+    assert merged["lesions"][2]["agreement"]["presence"] == 2 / 3
+    assert merged["summary"]["total_lesion_count"] == 3
+    assert merged["summary"]["metastasis_present"] is True
+    assert merged["summary"]["agreement"]["modality"] == 1.0
+
+
+def test_batch_extract_samples_at_the_configured_temperature(tmp_path, label_backend):
+    temperatures = []
+    generate = label_backend.generate
+    label_backend.generate = lambda messages, **kwargs: temperatures.append(
+        kwargs["temperature"]
+    ) or generate(messages)
+    config = SelfConsistencyConfig(n=3, temperature=0.9, only_uncertain=None)
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        self_consistency=config,
+        temperature=0.0,
+    )
+    assert (
+        stats["sc_reports"] == 2
+        and stats["sc_samples"] == 6
+        and stats["sc_invalid_samples"] == 0
+    )
+    assert temperatures == [0.9] * 6
+    out = json.loads((tmp_path / "001.json").read_text())
+    assert [lesion["size_mm"] for lesion in out["lesions"]] == [28, 12, 9]
+    assert out["lesions"][0]["agreement"]["presence"] == 1.0
+
+
+def test_greedy_attempt_of_a_sampled_report_is_counted_apart(tmp_path, label_backend):
+    config = SelfConsistencyConfig(
+        n=2, only_uncertain=UncertaintyPolicy(max_count_gap=None, min_key_logprob=None)
+    )
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        self_consistency=config,
+    )
+    assert stats["sc_reports"] == 0 and stats["reports"] == 2
+
+    # Every report fails the count check, is sampled, and counts once
+    config = SelfConsistencyConfig(
+        n=2, only_uncertain=UncertaintyPolicy(max_count_gap=-1)
+    )
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        self_consistency=config,
+    )
+    assert (
+        stats["sc_reports"] == 2
+        and stats["reports"] == 2
+        and stats["sc_greedy_reports"] == 2
+    )
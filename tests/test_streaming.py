@@ -0,0 +1,109 @@
+import json
+from collections import Counter
+
+from storymode.extract import extract_from_text, extract_stream
+from storymode.models import ModelBackend, model_manager
+from storymode.schema import Lesion, ReportExtraction, Summary
+from storymode.streaming import StreamParser
+from storymode.tabular import render_table
+
+LABEL = "examples/labels/001.json"
+REPORT = "examples/reports/001.txt"
+
+
+class _StreamingBackend(ModelBackend):
+    """Streams a fixed completion in small chunks, counting how many were sent"""
+
+    def __init__(self, text):
+        self.text = text
+        self.sent = 0
+
+    def generate(self, messages, **kwargs):
+        return self.text
+
+    def generate_stream(self, messages, **kwargs):
+        for i in range(0, len(self.text), 8):
+            self.sent += 1
+            yield self.text[i : i + 8]
+        self.last_finish_reason = "stop"
+        self.last_completion_tokens = len(self.text) // 4
+
+    def close(self):
+        pass
+
+
+def test_parser_emits_parts_as_they_close():
+    data = json.load(open(LABEL))
+    data["lesions"][0]["note"] = 'braces } { ] and "quotes" \\ inside'
+    text = "```json\n" + json.dumps(data) + "\n```"
+    parser = StreamParser()
+    parts = []
+    for i in range(len(text)):
+        parts += [(kind, obj, i) for kind, obj in parser.feed(text[i])]
+    assert [kind for kind, _, _ in parts] == ["summary"] + ["lesion"] * len(
+        data["lesions"]
+    )
+    assert [obj for _, obj, _ in parts[1:]] == data["lesions"]
+    assert parts[1][2] < len(text) // 2
+
+    rows = StreamParser("t1")
+    table = render_table(data)
+    parts = rows.feed(table[:-3]) + rows.feed(table[-3:]) + rows.close()
+    assert [obj.get("lesion_id") for kind, obj in parts if kind == "lesion"] == [
+        "L1",
+        "L2",
+        "L3",
+    ]
+
+
+def test_extract_stream_yields_lesions_before_the_end(monkeypatch):
+    backend = _StreamingBackend(open(LABEL).read())
+    monkeypatch.setattr(model_manager, "_create_backend", lambda config: backend)
+    report = open(REPORT).read()
+    diagnostics = {}
+    seen = []
+    for event in extract_stream(report, "mistral-7b-instruct", diagnostics=diagnostics):
+        seen.append((event.kind, type(event.item), backend.sent))
+        if event.kind == "result":
+            result = event.item
+    model_manager.close_all()
+
+    assert [kind for kind, _, _ in seen] == [
+        "summary",
+        "lesion",
+        "lesion",
+        "lesion",
+        "result",
+    ]
+    assert (
+        seen[0][1] is Summary
+        and seen[1][1] is Lesion
+        and seen[-1][1] is ReportExtraction
+    )
+    assert seen[1][2] < backend.sent
+    assert 0 < diagnostics["first_lesion_ms"] <= diagnostics["total_ms"]
+
+    monkeypatch.setattr(model_manager, "_create_backend", lambda config: backend)
+    expected = extract_from_text(report, "mistral-7b-instruct")
+    model_manager.close_all()
+    assert result.model_dump(exclude_unset=True) == expected
+
+
+def test_invalid_stream_falls_back_with_the_jsonschema_engine(monkeypatch):
+    bad = json.load(open(LABEL))
+    bad["lesions"][0]["size_mm"] = "large"
+    backend = _StreamingBackend(json.dumps(bad))
+    backend.generate = lambda messages, **kwargs: open(LABEL).read()
+    monkeypatch.setattr(model_manager, "_create_backend", lambda config: backend)
+    stats = Counter()
+    events = list(
+        extract_stream(
+            open(REPORT).read(),
+            "mistral-7b-instruct",
+            stats=stats,
+            validation_engine="jsonschema",
+        )
+    )
+    model_manager.close_all()
+    assert stats["stream_fallbacks"] == 1
+    assert events[-1].kind == "result" and events[-1].item.lesions[0].size_mm == 28
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+from storymode.decode import parse_completion
+from storymode.extract import batch_extract, build_prompt
+from storymode.models import ModelBackend, model_manager
+from storymode.prompts import FEW_SHOT
+from storymode.tabular import TableFormatError, parse_table, render_table
+
+
+class _TableBackend(ModelBackend):
+    """Answers with the reference label rendered as "t1" rows"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def generate(self, messages, **kwargs):
+        assert "response_format" not in kwargs
+        return render_table(json.loads(self.labels.generate(messages)))
+
+    def close(self):
+        pass
+
+
+def test_rows_expand_to_the_reference_extraction():
+    ref = FEW_SHOT[0]["json"]
+    parsed = parse_completion(render_table(ref), prompt_version="t1").model_dump(
+        exclude_none=True
+    )
+    assert (
+        parsed["summary"]["total_lesion_count"] == 3
+        and parsed["summary"]["metastasis_present"] is True
+    )
+    for got, want in zip(parsed["lesions"], ref["lesions"]):
+        assert {k: got[k] for k in want} == want
+
+
+def test_parser_is_strict():
+    with pytest.raises(TableFormatError, match="line 1"):
+        parse_table("Here is the table:\nS|CT|CAP||y|1")
+    with pytest.raises(TableFormatError, match="expected 12 cells"):
+        parse_table("S|CT|CAP||y|1\nL|met|liver")
+    # The last cell is the evidence quote, so a delimiter inside it is kept
+    row = parse_table("S|CT||||\nL|met|liver||n||||9|||| a|b ")["lesions"][0]
+    assert row["evidence_span"] == "a|b" and row["lesion_id"] == "L1"
+
+
+def test_tabular_prompt_version_end_to_end(tmp_path, monkeypatch, label_backend):
+    prompt = build_prompt("report", prompt_version="t1")
+    assert prompt["fewshot_messages"][1]["content"] == render_table(FEW_SHOT[0]["json"])
+    assert "JSON Schema" not in prompt["user"]
+
+    monkeypatch.setattr(
+        model_manager, "_create_backend", lambda config: _TableBackend(label_backend)
+    )
+    batch_extract(
+        "examples/reports", str(tmp_path), "mistral-7b-instruct", prompt_version="t1"
+    )
+    out = json.loads((tmp_path / "001.json").read_text())
+    assert out["prompt_version"] == "t1"
+    assert [lesion["size_mm"] for lesion in out["lesions"]] == [28, 12, 9]
@@ -0,0 +1,80 @@
+from storymode.postprocess import normalize_units_and_cleanup
+from storymode.textindex import build_index, build_indexes
+
+REPORT = """FINDINGS:
+Liver:   0.8 cm lesion in segment 7.
+Right renal mass 2.1 x 1.5 cm. Station 4R node 12mm (previously 9 mm).
+"""
+
+
+def test_measurement_mentions():
+    index = build_index(REPORT)
+    found = [(REPORT[m.start : m.end], m.dims_mm) for m in index.measurements]
+    assert found == [
+        ("0.8 cm", (8.0,)),
+        ("2.1 x 1.5 cm", (21.0, 15.0)),
+        ("12mm", (12.0,)),
+        ("9 mm", (9.0,)),
+    ]
+    assert (
+        build_indexes([REPORT, "no sizes", REPORT])[2].measurements
+        == index.measurements
+    )
+
+
+def test_batched_index_matches_single_report_index():
+    texts = [
+        "Lesion size was",
+        "12 mm nodule.",
+        REPORT,
+        "Compared to\n",
+        "5 mm. Prior 3 mm",
+    ]
+    for batched, text in zip(build_indexes(texts), texts):
+        assert batched.measurements == build_index(text).measurements
+    assert (
+        not build_indexes(["Lesion size was", "12 mm nodule."])[1].measurements[0].prior
+    )
+
+
+def test_span_alignment_exact_and_fuzzy():
+    index = build_index(REPORT)
+    exact = index.align("liver: 0.8 cm lesion")
+    assert exact.exact and REPORT[exact.start : exact.end] == "Liver:   0.8 cm lesion"
+    fuzzy = index.align("Right renal mass 2.1x1.5 cm")
+    assert fuzzy is not None and not fuzzy.exact
+    assert index.align("5 mm nodule in the left lung apex") is None
+
+
+def test_postprocess_keeps_mm_values_and_fixes_copied_cm_values():
+    obj = {
+        "summary": {},
+        "lesions": [
+            {
+                "lesion_id": "L1",
+                "body_site": "liver",
+                "size_mm": 8,
+                "evidence_span": "0.8 cm lesion",
+            },
+            {
+                "lesion_id": "L2",
+                "body_site": "kidney",
+                "size_mm": 2,
+                "evidence_span": "renal mass 2.1 x 1.5 cm",
+            },
+            {
+                "lesion_id": "L3",
+                "body_site": "lung",
+                "size_mm": 5,
+                "evidence_span": "5 mm lung nodule",
+            },
+        ],
+    }
+    lesions = normalize_units_and_cleanup(obj, REPORT)["lesions"]
+    assert [lesion["size_mm"] for lesion in lesions] == [8, 21, 5]
+    assert [lesion["evidence_status"] for lesion in lesions] == [
+        "exact",
+        "exact",
+        "unsupported",
+    ]
+    assert "evidence_start" not in lesions[2]
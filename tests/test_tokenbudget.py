@@ -0,0 +1,78 @@
+import json
+
+from storymode.batching import BatchPolicy
+from storymode.extract import batch_extract
+from storymode.models import ModelBackend, model_manager
+from storymode.textindex import build_index
+from storymode.tokenbudget import TokenBudget, budget_summary, count_lesion_mentions
+
+
+class _TruncatingBackend(ModelBackend):
+    """Answers with the reference label, 4 characters a "token", cut at max_tokens"""
+
+    def __init__(self, labels):
+        self.labels = labels
+
+    def generate(self, messages, **kwargs):
+        full = json.dumps(json.loads(self.labels.generate(messages)))
+        prefix = kwargs.get("assistant_prefix", "")
+        assert full.startswith(prefix)
+        rest = full[len(prefix) :]
+        out = rest[: 4 * kwargs["max_tokens"]]
+        self.last_finish_reason = "stop" if out == rest else "length"
+        self.last_completion_tokens = -(-len(out) // 4)
+        return out
+
+    def close(self):
+        pass
+
+
+def test_prediction_counts_current_sizes_and_non_negated_lesions():
+    text = open("examples/reports/002.txt").read()
+    assert (
+        count_lesion_mentions(text) == 2
+    )  # "No distant FDG-avid metastasis" is not a lesion
+    budget = TokenBudget(
+        base_tokens=50, tokens_per_lesion=100, margin=1.0, min_tokens=10
+    )
+    assert budget.predict(build_index(text), cap=1200) == 250
+    assert budget.predict(build_index(text), cap=200) == 200
+
+
+def test_truncated_output_is_continued(tmp_path, monkeypatch, label_backend):
+    monkeypatch.setattr(
+        model_manager,
+        "_create_backend",
+        lambda config: _TruncatingBackend(label_backend),
+    )
+    tight = TokenBudget(base_tokens=10, tokens_per_lesion=10, margin=1.0, min_tokens=10)
+    stats = batch_extract(
+        "examples/reports", str(tmp_path), "mistral-7b-instruct", token_budget=tight
+    )
+    assert stats["budget_reports"] == 2 and stats["budget_hits"] == 0
+    assert stats["budget_continuations"] == 2
+    assert len(json.loads((tmp_path / "001.json").read_text())["lesions"]) == 3
+
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        token_budget=TokenBudget(),
+    )
+    assert (
+        stats["budget_hits"] == 2
+        and stats["budget_tokens"] < stats["budget_static_tokens"]
+    )
+    assert stats["budget_kv_saved_bytes"] > 0
+    assert "kv_saved_mb_per_batch" not in budget_summary(stats)
+
+    stats = batch_extract(
+        "examples/reports",
+        str(tmp_path),
+        "mistral-7b-instruct",
+        token_budget=TokenBudget(),
+        batching=BatchPolicy(batch_size=2),
+    )
+    summary = budget_summary(stats)
+    assert summary["reports_per_batch"] == 2.0
+    assert summary["kv_saved_mb_per_batch"] == 2 * summary["kv_saved_mb_per_report"] > 0